@@ -1,15 +1,25 @@
+import asyncio
+
 from aiogram import Bot, Dispatcher, types, executor
 from aiogram.contrib.fsm_storage.memory import MemoryStorage
 from data import config
 from handlers.users.start import register_user_handlers
 from handlers.users.admin import register_admin_handlers
-from utils.db_api.database import Database
+from handlers.channels.chat_member import register_chat_member_handlers
+from utils.db_api.database import get_db
+from utils.db_api.async_database import get_async_db
+from utils.db_api.query_plans import print_report as print_query_plan_report
 from middlewares.subscription_middleware import SubscriptionMiddleware
+from middlewares.user_context import UserContextMiddleware
+from utils.subscription import run_membership_reconciler
+from utils.qr_renderer import start_qr_pool, shutdown_qr_pool
 
 # Google Sheets import
 GOOGLE_SHEETS_ENABLED = False
 try:
-    from sheets_integration import init_google_sheets, get_sheets_url
+    from sheets_integration import (
+        init_google_sheets, is_sheets_connected, get_sheets_url, run_sheets_worker, flush_sheets_queue
+    )
 
     GOOGLE_SHEETS_ENABLED = True
     print("✅ Google Sheets (sheets_integration) integratsiyasi yoqildi")
@@ -21,10 +31,16 @@ except ImportError as e:
 bot = Bot(token=config.BOT_TOKEN, parse_mode=types.ParseMode.HTML)
 storage = MemoryStorage()
 dp = Dispatcher(bot, storage=storage)
+# UserContext birinchi: obuna middleware ham, handlerlar ham shu bitta o'qishdan foydalanadi
+dp.middleware.setup(UserContextMiddleware())
 dp.middleware.setup(SubscriptionMiddleware())
 
 # Database — faqat bir marta yaratiladi
-db = Database()
+db = get_db()
+
+# channel_members ni qayta tekshiruvchi fon vazifasi
+membership_reconciler = None
+sheets_worker = None
 
 
 async def on_startup(dispatcher):
@@ -41,6 +57,13 @@ async def on_startup(dispatcher):
         print(f"📊 Bazada {stats['total']} foydalanuvchi mavjud")
         print(f"   - Tasdiqlangan: {stats['approved']}")
         print(f"   - Kutilayotgan: {stats['pending']}")
+
+        # QR chizuvchi jarayonlarni oldindan ishga tushirish
+        start_qr_pool()
+
+        plans_ok, plan_results = db.check_query_plans()
+        if not plans_ok:
+            print_query_plan_report(plans_ok, plan_results)
     except Exception as e:
         print(f"❌ Ma'lumotlar bazasi ishga tushirishda xatolik: {e}")
         import traceback
@@ -57,27 +80,29 @@ async def on_startup(dispatcher):
                 credentials_path=credentials_file,
                 spreadsheet_id=spreadsheet_id
             )
-            if sheets_success:
+            if sheets_success and is_sheets_connected():
                 print("✅ Google Sheets muvaffaqiyatli ishga tushdi!")
                 sheets_url = get_sheets_url()
                 if sheets_url:
                     print(f"📊 Jadval URL: {sheets_url}")
                     print("📝 QR kodlar ID sifatida saqlanadi")
             else:
-                print("❌ Google Sheets ishlamadi")
-                GOOGLE_SHEETS_ENABLED = False
+                print("❌ Google Sheets ishlamadi - o'zgarishlar navbatda to'planadi")
         except Exception as e:
             print(f"❌ Google Sheets ishga tushirishda xatolik: {e}")
             print("⚠️ Bot Google Sheets bo'lmasdan ham to'liq ishlaydi")
-            GOOGLE_SHEETS_ENABLED = False
     else:
         print("⚠️ Google Sheets o'chiq - faqat mahalliy ma'lumotlar bazasi")
+    # Jadval ID si bo'lsa outbox har doim yoziladi: Google ishlamasa ham yozuvlar navbatda qoladi,
+    # fon vazifasi backoff va circuit breaker bilan ulanish tiklanganda yetkazadi
+    config.SHEETS_MODE = bool(config.SPREADSHEET_ID or (GOOGLE_SHEETS_ENABLED and get_sheets_url()))
 
     # Handlerlarni ro'yxatdan o'tkazish
     print("\n🔧 Handlerlarni ro'yxatdan o'tkazish...")
     try:
         register_user_handlers(dp)
         register_admin_handlers(dp)
+        register_chat_member_handlers(dp)
 
         # REKLAMA HANDLERLARINI QO'SHING
         try:
@@ -103,6 +128,15 @@ async def on_startup(dispatcher):
         traceback.print_exc()
         return
 
+    # Kanal a'zoligini fonda qayta tekshirish
+    global membership_reconciler
+    membership_reconciler = asyncio.create_task(run_membership_reconciler(dispatcher.bot))
+
+    # Google Sheets o'zgarishlarini fonda partiyalab yozish
+    global sheets_worker
+    if GOOGLE_SHEETS_ENABLED and config.SHEETS_MODE:
+        sheets_worker = asyncio.create_task(run_sheets_worker())
+
     # Admin ma'lumotlari
     print(f"\n👨‍💼 Admin IDs: {config.ADMINS}")
 
@@ -141,12 +175,25 @@ async def on_startup(dispatcher):
 async def on_shutdown(dispatcher):
     """Bot to'xtatilganda bajariladigan funksiya"""
     print("\n🛑 Bot to'xtatilmoqda...")
+    if membership_reconciler:
+        membership_reconciler.cancel()
+    if sheets_worker:
+        sheets_worker.cancel()
+        try:
+            await sheets_worker
+        except asyncio.CancelledError:
+            pass
+        # Navbatda qolgan o'zgarishlarni yozib qo'yamiz (qolganlari soni logga chiqadi)
+        await flush_sheets_queue()
     try:
         backup_path = db.backup_database()
         if backup_path:
             print(f"💾 Ma'lumotlar bazasi zahiralandi: {backup_path}")
     except Exception as e:
         print(f"❌ Zahiralashda xatolik: {e}")
+    get_async_db().shutdown()
+    shutdown_qr_pool()
+    db.close()
     print("👋 Bot muvaffaqiyatli to'xtatildi!")
 
 
@@ -168,7 +215,10 @@ if __name__ == '__main__':
             dp,
             on_startup=on_startup,
             on_shutdown=on_shutdown,
-            skip_updates=True
+            skip_updates=True,
+            # chat_member updatelari faqat aniq so'ralganda keladi (bot kanal admini bo'lishi kerak)
+            allowed_updates=types.AllowedUpdates.MESSAGE | types.AllowedUpdates.CALLBACK_QUERY
+                            | types.AllowedUpdates.CHAT_MEMBER
         )
     except KeyboardInterrupt:
         print("\n\n🛑 Bot foydalanuvchi tomonidan to'xtatildi!")
@@ -17,13 +17,52 @@ IP = env.str("ip")  # Xosting IP manzili
 SPREADSHEET_ID = env.str("SPREADSHEET_ID", None)
 GOOGLE_CREDENTIALS_FILE = 'mybotproject-468611-8104acd37ccd.json'
 SHEET_NAME = 'marosim_bot'
-SHEETS_MODE = True  # Google Sheets integratsiyasi faol
+# Outbox yoziladimi: jadval ID si bo'lsa har doim (Google ishlamasa ham - navbatda to'planadi va
+# ulanish tiklanganda yetkaziladi). ID yo'q bo'lsa app.py yangi jadval yaratilgandan keyin yoqadi
+SHEETS_MODE = bool(SPREADSHEET_ID)
 # Ma'lumotlar bazasi konfiguratsiyasi
 DATABASE_PATH = "db/bot_database.db"
+SQLITE_READ_POOL_SIZE = env.int("SQLITE_READ_POOL_SIZE", 4)  # O'qish uchun ulanishlar soni
+SQLITE_SYNCHRONOUS = env.str("SQLITE_SYNCHRONOUS", "NORMAL")  # OFF / NORMAL / FULL
+SQLITE_BUSY_TIMEOUT_MS = env.int("SQLITE_BUSY_TIMEOUT_MS", 5000)
+SQLITE_CACHE_SIZE_KB = env.int("SQLITE_CACHE_SIZE_KB", 16384)  # Har bir ulanish uchun sahifa keshi
+SQLITE_MMAP_SIZE = env.int("SQLITE_MMAP_SIZE", 64 * 1024 * 1024)  # 0 - o'chirilgan
+DB_EXECUTOR_QUEUE_SIZE = env.int("DB_EXECUTOR_QUEUE_SIZE", 256)  # Async so'rovlar navbati chegarasi
+EVENT_CACHE_TTL = env.int("EVENT_CACHE_TTL", 300)  # Marosimlar keshi (soniya), o'zgarishda darhol tozalanadi
+CHANNEL_CACHE_TTL = env.int("CHANNEL_CACHE_TTL", 300)  # Faol kanallar keshi (soniya)
+USER_CACHE_SIZE = env.int("USER_CACHE_SIZE", 5000)  # LRU user profillari keshi (0 - o'chirilgan)
+USER_CACHE_TTL = env.int("USER_CACHE_TTL", 600)  # Soniya, yozuvlarda darhol yangilanadi
+USE_STATS_COUNTERS = env.bool("USE_STATS_COUNTERS", True)  # Statistikani event_counters jadvalidan o'qish
+
+# Kanal obunasi keshi (soniya)
+SUBSCRIPTION_CACHE_TTL = env.int("SUBSCRIPTION_CACHE_TTL", 300)  # Obuna bo'lganlar
+SUBSCRIPTION_NEGATIVE_TTL = env.int("SUBSCRIPTION_NEGATIVE_TTL", 30)  # Obuna bo'lmaganlar
+# channel_members jadvali (chat_member updatelari bilan yangilanadi)
+CHANNEL_MEMBER_MAX_AGE = env.int("CHANNEL_MEMBER_MAX_AGE", 86400)  # Bundan eski yozuvga ishonilmaydi
+CHANNEL_MEMBER_RECONCILE_INTERVAL = env.int("CHANNEL_MEMBER_RECONCILE_INTERVAL", 3600)
+CHANNEL_MEMBER_RECONCILE_BATCH = env.int("CHANNEL_MEMBER_RECONCILE_BATCH", 100)
 
 # QR kod konfiguratsiyasi
 QR_CODE_SIZE = 10  # QR kod o'lchami
 QR_CODE_BORDER = 4  # QR kod chegarasi
+QR_RENDER_WORKERS = env.int("QR_RENDER_WORKERS", 2)  # QR chizuvchi jarayonlar (0 - joriy jarayonda)
+QR_RENDER_TIMEOUT = env.int("QR_RENDER_TIMEOUT", 10)  # Soniya
+QR_DECODE_TIMEOUT = env.int("QR_DECODE_TIMEOUT", 5)  # Skanerga yuborilgan rasmni o'qish (soniya)
+TICKET_ID_BLOCK_SIZE = env.int("TICKET_ID_BLOCK_SIZE", 100)  # Bir safarda ajratiladigan chipta raqamlari
+TICKET_SECRET = env.str("TICKET_SECRET", "")  # Chipta imzosi kaliti (bo'sh bo'lsa BOT_TOKEN dan olinadi)
+
+# Google Sheets navbati
+SHEETS_FLUSH_INTERVAL = env.float("SHEETS_FLUSH_INTERVAL", 1.0)  # Outbox ni tekshirish oralig'i (soniya)
+SHEETS_OUTBOX_BATCH = env.int("SHEETS_OUTBOX_BATCH", 200)  # Bitta partiyadagi o'zgarishlar
+SHEETS_RETRY_BASE_DELAY = env.int("SHEETS_RETRY_BASE_DELAY", 5)  # Xatolikdan keyin: 5, 10, 20, ... soniya
+SHEETS_RETRY_MAX_DELAY = env.int("SHEETS_RETRY_MAX_DELAY", 900)
+SHEETS_MAX_ATTEMPTS = env.int("SHEETS_MAX_ATTEMPTS", 5)  # Doimiy xatolikda shundan keyin dead-letter ga
+SHEETS_SHUTDOWN_TIMEOUT = env.int("SHEETS_SHUTDOWN_TIMEOUT", 30)  # To'xtashda navbatni yetkazish chegarasi (soniya)
+SHEETS_READ_PER_MINUTE = env.int("SHEETS_READ_PER_MINUTE", 60)  # Google Sheets kvotasi (foydalanuvchi uchun)
+SHEETS_WRITE_PER_MINUTE = env.int("SHEETS_WRITE_PER_MINUTE", 60)
+SHEETS_MAX_RETRIES = env.int("SHEETS_MAX_RETRIES", 3)  # 429/5xx da bitta so'rov uchun qayta urinishlar
+SHEETS_BREAKER_THRESHOLD = env.int("SHEETS_BREAKER_THRESHOLD", 5)  # Ketma-ket xatoliklar - circuit ochiladi
+SHEETS_BREAKER_RESET = env.int("SHEETS_BREAKER_RESET", 60)  # Circuit ochiq turadigan vaqt (soniya)
 
 # To'lov konfiguratsiyasi
 DEFAULT_PAYMENT_AMOUNT = 100000  # Standart to'lov summasi (UZS)
@@ -0,0 +1,26 @@
+from aiogram import types, Dispatcher
+
+from utils.db_api.async_database import get_async_db
+from utils.subscription import get_subscription_checker, match_channel
+
+
+async def chat_member_handler(update: types.ChatMemberUpdated):
+    """Kanalga qo'shilish/chiqish - channel_members jadvali va obuna keshini yangilash"""
+    try:
+        db = get_async_db()
+        channel_id = match_channel(await db.get_all_channels(), update.chat)
+        if not channel_id:
+            return  # Bot admin bo'lgan, lekin majburiy bo'lmagan chat
+
+        user_id = update.new_chat_member.user.id
+        status = update.new_chat_member.status
+        await db.save_channel_members([(channel_id, user_id, status)])
+        get_subscription_checker().record(user_id, channel_id, status)
+        print(f"👥 {channel_id}: user {user_id} -> {status}")
+    except Exception as e:
+        print(f"❌ chat_member updateni qayta ishlashda xatolik: {e}")
+
+
+def register_chat_member_handlers(dp: Dispatcher):
+    """chat_member handlerlarini ro'yxatdan o'tkazish"""
+    dp.register_chat_member_handler(chat_member_handler)
@@ -4,17 +4,22 @@ from aiogram.dispatcher import FSMContext
 from aiogram.dispatcher.filters.state import State, StatesGroup
 from aiogram.dispatcher.filters import Command, Text
 from data import config
-from utils.db_api.database import Database
+from utils.db_api.async_database import get_async_db
+from utils.db_api.ticket_ids import is_signed_ticket
+from utils.checkin import parse_checkin_batch, resolve_scan
+from utils.qr_decoder import decode_qr_image
+from utils.tickets import send_qr_photo
 from keyboards.default.keyboards import get_admin_keyboard, get_main_menu
 from datetime import datetime
+import csv
+import io
 
 # Google Sheets import
 try:
     from sheets_integration import (
-        save_user_with_qr_to_sheets,
-        scan_qr_and_mark_attendance,
-        get_sheets_url,
-        clear_sheets_data
+        queue_clear_sheets,
+        get_sheets_queue_stats,
+        get_sheets_url
     )
 
     SHEETS_MODE = True
@@ -95,16 +100,16 @@ def get_event_texts(lang):
 def get_user_approval_message(user, event, lang='uz'):
     """Foydalanuvchi tasdiqlash xabari - chiroyli format"""
     texts = {
-        'uz': f"""🎉 <b>Tabriklaymiz, {user[2]}!</b>  
+        'uz': f"""🎉 <b>Tabriklaymiz, {user.full_name}!</b>  
 Sizning to'lovingiz muvaffaqiyatli tasdiqlandi!  
 
 🎟 <b>Sizning elektron chiptangiz:</b>  
-👤 <b>Ishtirokchi:</b> {user[2]}  
-📱 <b>Telefon:</b> {user[3]}  
+👤 <b>Ishtirokchi:</b> {user.full_name}  
+📱 <b>Telefon:</b> {user.phone_number}  
 📅 <b>Sana va vaqt:</b> {event[2] if event else 'N/A'} {event[3] if event else ''}  
 📍 <b>Manzil:</b> {event[4] if event else 'N/A'}  
 💰 <b>Narx:</b> {event[5] if event else 0:,.0f} UZS  
-�ID <b>Chipta raqami:</b> <code>{user[7]}</code>  
+�ID <b>Chipta raqami:</b> <code>{user.qr_id}</code>  
 
 🔥 <b>YANGILIK!</b>  
 QR kodingizda barcha ma'lumotlaringiz mavjud. Uni tadbir kuni taqdim eting!  
@@ -112,16 +117,16 @@ QR kodingizda barcha ma'lumotlaringiz mavjud. Uni tadbir kuni taqdim eting!
 ⚠️ <b>MUHIM!</b>  
 Chipta ma'lumotlaringizni maxfiy saqlang va tadbir kuni QR kodni ko'rsating.""",
 
-        'ru': f"""🎉 <b>Поздравляем, {user[2]}!</b>  
+        'ru': f"""🎉 <b>Поздравляем, {user.full_name}!</b>  
 Ваш платеж успешно подтвержден!  
 
 🎟 <b>Ваш электронный билет:</b>  
-👤 <b>Участник:</b> {user[2]}  
-📱 <b>Телефон:</b> {user[3]}  
+👤 <b>Участник:</b> {user.full_name}  
+📱 <b>Телефон:</b> {user.phone_number}  
 📅 <b>Дата и время:</b> {event[2] if event else 'N/A'} {event[3] if event else ''}  
 📍 <b>Адрес:</b> {event[4] if event else 'N/A'}  
 💰 <b>Стоимость:</b> {event[5] if event else 0:,.0f} UZS  
-🆔 <b>Номер билета:</b> <code>{user[7]}</code>  
+🆔 <b>Номер билета:</b> <code>{user.qr_id}</code>  
 
 🔥 <b>НОВИНКА!</b>  
 Ваш QR-код содержит всю информацию. Предъявите его на мероприятии!  
@@ -129,16 +134,16 @@ Chipta ma'lumotlaringizni maxfiy saqlang va tadbir kuni QR kodni ko'rsating.""",
 ⚠️ <b>ВАЖНО!</b>  
 Храните данные билета в секрете и предъявите QR-код на входе.""",
 
-        'en': f"""🎉 <b>Congratulations, {user[2]}!</b>  
+        'en': f"""🎉 <b>Congratulations, {user.full_name}!</b>  
 Your payment has been successfully confirmed!  
 
 🎟 <b>Your e-ticket:</b>  
-👤 <b>Participant:</b> {user[2]}  
-📱 <b>Phone:</b> {user[3]}  
+👤 <b>Participant:</b> {user.full_name}  
+📱 <b>Phone:</b> {user.phone_number}  
 📅 <b>Date and time:</b> {event[2] if event else 'N/A'} {event[3] if event else ''}  
 📍 <b>Address:</b> {event[4] if event else 'N/A'}  
 💰 <b>Price:</b> {event[5] if event else 0:,.0f} UZS  
-🆔 <b>Ticket number:</b> <code>{user[7]}</code>  
+🆔 <b>Ticket number:</b> <code>{user.qr_id}</code>  
 
 🔥 <b>NEW!</b>  
 Your QR code contains all your information. Present it at the event!  
@@ -149,30 +154,38 @@ Keep your ticket information confidential and show the QR code at the entrance."
     return texts.get(lang, texts['uz'])
 
 
-async def safe_send_to_user(bot, user_id, message, qr_image=None):
-    """Xavfsiz foydalanuvchiga yuborish"""
+async def safe_send_to_user(bot, user_id, message, with_qr=False):
+    """Xavfsiz foydalanuvchiga yuborish (with_qr - QR chipta rasmi bilan)"""
     try:
-        if qr_image:
-            await bot.send_photo(user_id, qr_image, caption=message, parse_mode='HTML')
-        else:
-            await bot.send_message(user_id, message, parse_mode='HTML')
+        if with_qr and await send_qr_photo(bot, user_id, user_id, caption=message, parse_mode='HTML'):
+            return True
+        await bot.send_message(user_id, message, parse_mode='HTML')
         return True
     except Exception as e:
         print(f"⚠️ Foydalanuvchiga yuborishda xatolik: {e}")
         return False
 
 
-async def update_sheets_data(user_info, event_info):
-    """Google Sheets yangilash"""
-    if not SHEETS_MODE:
-        return False
-    try:
-        success, qr_id = save_user_with_qr_to_sheets(user_info, event_info)
-        print(f"📊 Google Sheets: {'✅ Yangilandi' if success else '❌ Xatolik'}")
-        return success
-    except Exception as e:
-        print(f"⚠️ Sheets xatolik: {e}")
-        return False
+def format_sheets_api_stats(api):
+    """Sheets API kvota va circuit breaker holati"""
+    if not api:
+        return "🚦 API: ulanmagan"
+    circuit = {'closed': '✅ yopiq', 'half_open': '🟡 sinov', 'open': '🔴 ochiq'}[api['circuit']]
+    return (
+        f"🚦 API: {api['requests']} so'rov, kvota kutish {api['throttled']} ({api['throttled_seconds']} s), "
+        f"429: {api['rate_limited']}, 5xx: {api['server_errors']}, xato: {api['failed']}, "
+        f"rad etilgan: {api['rejected']}, circuit: {circuit}"
+    )
+
+
+async def sheets_outbox_status():
+    """Tasdiqlash tranzaksiyasi Sheets o'zgarishini outboxga yozgan - uning holati"""
+    if not SHEETS_MODE or not config.SHEETS_MODE:
+        return "❌ ulanmagan"
+    stats = await get_async_db().get_sheets_outbox_stats()
+    if stats['last_error']:
+        return f"⚠️ navbatda ({stats['pending']} ta), xatolik: {stats['last_error']}"
+    return f"⏳ navbatga qo'yildi ({stats['pending']} ta kutmoqda)"
 
 
 # ASOSIY ADMIN HANDLERLAR
@@ -184,8 +197,8 @@ async def admin_panel(message: types.Message):
         return
 
     try:
-        db = Database()
-        stats = db.get_all_user_stats()
+        db = get_async_db()
+        stats = await db.get_all_user_stats()
         sheets_status = "✅ Ulangi" if SHEETS_MODE else "❌ Ulanmagan"
 
         info = (
@@ -216,7 +229,9 @@ async def qr_scanner_start(message: types.Message):
         "📱 QR Skaner ishga tushdi!\n\n"
         "🔍 ID raqamni kiriting:\n"
         "Masalan: 123456\n\n"
-        "Mehmon kelganini belgilash uchun ID ni yuboring.",
+        "Mehmon kelganini belgilash uchun ID ni yuboring.\n"
+        "📷 Yoki chipta QR kodini suratga olib yuboring.\n"
+        "📦 Offline skanerlar: har qatorda <code>qr_id,vaqt,skaner</code> yoki CSV/JSON fayl yuboring.",
         reply_markup=keyboard
     )
     await AdminStates.qr_scanner_mode.set()
@@ -239,57 +254,96 @@ async def qr_scan_handler(message: types.Message, state: FSMContext):
     if not text:
         await message.answer("❌ QR kod ma'lumotini yuboring!")
         return
-    qr_id = text.split(':')[0] if ':' in text else text
+    if is_checkin_batch(text):
+        # Offline skanerdan partiya (bitta "qr,vaqt,skaner" qatori ham)
+        await apply_checkin_batch(message, text)
+        return
+    await check_in_scanned_text(message, text)
+
+
+async def get_active_event_ids():
+    """Faol marosimlar ID lari (keshdan) - imzolangan chiptalarni tekshirish uchun"""
+    return {event[0] for event in await get_async_db().get_all_active_events()}
+
+
+def is_checkin_batch(text):
+    """Matn partiya sifatida o'qiladimi: bir nechta yozuv yoki vaqt/skaner ustunlari bor"""
+    try:
+        records = parse_checkin_batch(text)
+    except Exception:
+        return False
+    return len(records) > 1 or (len(records) == 1 and records[0]['raw'] != text)
+
+
+async def check_in_scanned_text(message: types.Message, text, note=''):
+    """Skanerlangan QR matni bo'yicha kelganlikni belgilash (matn yoki rasmdan o'qilgan)"""
+    active_event_ids = None
+    if is_signed_ticket(text):
+        # Imzo va marosim xotirada tekshiriladi (faol marosimlar keshdan), users jadvaliga tegilmaydi
+        active_event_ids = await get_active_event_ids()
+    qr_id, event_id, error = resolve_scan(text, active_event_ids)
+    if error == 'invalid_id':
+        # Nazorat raqami mos kelmadi - bazaga murojaat qilinmaydi
+        await message.answer(
+            f"❌ <b>CHIPTA RAQAMI NOTO'G'RI!</b>\n\n"
+            f"🆔 <b>ID:</b> <code>{qr_id}</code>\n\n"
+            f"⚠️ Raqamni tekshirib, qaytadan yuboring.",
+            parse_mode='HTML'
+        )
+        return
+    if error:
+        reasons = {
+            'invalid_format': "QR kod formati noto'g'ri",
+            'invalid_signature': "Chipta imzosi mos kelmadi (soxta chipta)",
+            'wrong_event': f"Chipta faol bo'lmagan marosim uchun (#{event_id})"
+        }
+        await message.answer(
+            f"❌ <b>CHIPTA YAROQSIZ!</b>\n\n"
+            f"🆔 <b>ID:</b> <code>{qr_id if event_id is not None else 'N/A'}</code>\n\n"
+            f"⚠️ {reasons[error]}.",
+            parse_mode='HTML'
+        )
+        return
     try:
-        db = Database()
-        with db.get_connection() as conn:
-            cursor = conn.cursor()
-            cursor.execute('''
-                SELECT u.*, e.name_uz as event_name 
-                FROM users u
-                LEFT JOIN events e ON u.event_id = e.id
-                WHERE u.qr_id = ?
-            ''', (qr_id,))
-            result = cursor.fetchone()
-            if not result:
-                await message.answer(
-                    f"❌ <b>QR KOD TOPILMADI!</b>\n\n"
-                    f"🆔 <b>ID:</b> <code>{qr_id}</code>\n\n"
-                    f"⚠️ Bu ma'lumot jadvalda yo'q.",
-                    parse_mode='HTML'
-                )
-                return
-            full_name = result[2]
-            phone = result[3]
-            payment_status = result[5]
-            attended = result[10]
-            event_name = result[-1]
-            if not attended:
-                now = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-                admin_name = f"Admin_{message.from_user.first_name}"
-                cursor.execute('''
-                    UPDATE users SET attended = 1, attended_at = ?, attended_by = ?
-                    WHERE qr_id = ?
-                ''', (now, admin_name, qr_id))
-                conn.commit()
-                print(f"✅ Kelganlik belgilandi: {full_name} - {event_name}")
-                if SHEETS_MODE:
-                    try:
-                        scan_qr_and_mark_attendance(qr_id, admin_name)
-                    except Exception as sheets_error:
-                        print(f"⚠️ Sheets xatolik: {sheets_error}")
-            qr_display = (
-                f"👤 <b>Ism:</b> {full_name or 'N/A'}\n"
-                f"📱 <b>Telefon:</b> {phone or 'N/A'}\n"
-                f"🆔 <b>Chipta ID:</b> <code>{qr_id}</code>\n\n"
-                f"✅ <b>To'lov:</b> {payment_status or 'N/A'}"
+        db = get_async_db()
+        admin_name = f"Admin_{message.from_user.first_name}"
+        ticket = await db.check_in_ticket(qr_id, admin_name, event_id)
+        if ticket['status'] == 'not_found':
+            await message.answer(
+                f"❌ <b>QR KOD TOPILMADI!</b>\n\n"
+                f"🆔 <b>ID:</b> <code>{qr_id}</code>\n\n"
+                f"⚠️ Bu ma'lumot jadvalda yo'q.",
+                parse_mode='HTML'
             )
+            return
+        if ticket['status'] == 'wrong_event':
             await message.answer(
-                f"✅ <b>MEHMON KELGANLIGI BELGILANDI!</b>\n\n"
-                f"📋 <b>QR KODI MA'LUMOTLARI:</b>\n{qr_display}\n\n"
-                f"📱 Keyingi QR kodni skanerlang.",
+                f"🚫 <b>CHIPTA BOSHQA MAROSIM UCHUN!</b>\n\n"
+                f"👤 <b>Ism:</b> {ticket['full_name'] or 'N/A'}\n"
+                f"🎪 <b>Marosim:</b> {ticket['event_name']}\n"
+                f"🆔 <b>ID:</b> <code>{qr_id}</code>",
                 parse_mode='HTML'
             )
+            return
+        qr_display = (
+            f"👤 <b>Ism:</b> {ticket['full_name'] or 'N/A'}\n"
+            f"📱 <b>Telefon:</b> {ticket['phone'] or 'N/A'}\n"
+            f"🆔 <b>Chipta ID:</b> <code>{qr_id}</code>\n\n"
+            f"✅ <b>To'lov:</b> {ticket['payment_status'] or 'N/A'}"
+        )
+        if ticket['status'] == 'first_entry':
+            header = "✅ <b>MEHMON KELGANLIGI BELGILANDI!</b>"
+        else:
+            header = (
+                f"⚠️ <b>CHIPTA ALLAQACHON ISHLATILGAN!</b>\n"
+                f"🕐 {ticket['attended_at'] or 'N/A'} da, {ticket['attended_by'] or 'N/A'} tomonidan"
+            )
+        await message.answer(
+            f"{header}\n\n"
+            f"📋 <b>QR KODI MA'LUMOTLARI:</b>\n{qr_display}\n\n"
+            f"📱 Keyingi QR kodni skanerlang.{note}",
+            parse_mode='HTML'
+        )
     except Exception as e:
         print(f"❌ QR Scan xatolik: {e}")
         await message.answer(
@@ -300,47 +354,142 @@ async def qr_scan_handler(message: types.Message, state: FSMContext):
         )
 
 
+QR_DECODE_ERRORS = {
+    'no_decoder': "Serverda QR o'quvchi kutubxona o'rnatilmagan (opencv yoki pyzbar)",
+    'bad_image': "Rasm faylini ochib bo'lmadi",
+    'not_found': "Rasmda QR kod topilmadi",
+    'unreadable': "QR kod topildi, lekin o'qib bo'lmadi (xira yoki qiyshiq)",
+    'timeout': "O'qish juda uzoq davom etdi",
+    'error': "Tizim xatoligi",
+}
+
+
+async def qr_photo_handler(message: types.Message, state: FSMContext):
+    """Skaner rejimida yuborilgan rasmdan QR o'qib, kelganlikni belgilash"""
+    if not is_admin(message.from_user.id):
+        return
+    buffer = io.BytesIO()
+    if message.photo:
+        await message.photo[-1].download(destination_file=buffer)
+    else:
+        await message.document.download(destination_file=buffer)
+
+    text, reason, elapsed_ms = await decode_qr_image(buffer.getvalue())
+    if not text:
+        print(f"⚠️ QR rasmdan o'qilmadi: {reason} ({elapsed_ms} ms)")
+        await message.answer(
+            f"❌ <b>QR KOD O'QILMADI!</b>\n\n"
+            f"⚠️ {QR_DECODE_ERRORS.get(reason, reason)}.\n"
+            f"⏱ {elapsed_ms} ms\n\n"
+            f"📷 Qaytadan, yaqinroqdan suratga oling yoki ID ni yozing.",
+            parse_mode='HTML'
+        )
+        return
+    await check_in_scanned_text(message, text.strip(), note=f"\n📷 Rasmdan o'qildi: {elapsed_ms} ms")
+
+
+CHECKIN_STATUS_LABELS = {
+    'checked_in': "✅ Belgilandi",
+    'updated': "🔁 Vaqti yangilandi (ertaroq skan)",
+    'duplicate': "♻️ Takroriy",
+    'not_found': "❌ Topilmadi",
+    'wrong_event': "🚫 Boshqa marosim",
+    'invalid_id': "⚠️ Noto'g'ri ID",
+    'invalid_signature': "⚠️ Soxta imzo",
+    'invalid_format': "⚠️ Noto'g'ri format",
+    'invalid_time': "⚠️ Noto'g'ri vaqt",
+}
+
+
+async def apply_checkin_batch(message: types.Message, text):
+    """Offline skanerlar partiyasini qo'llab, har bir yozuv bo'yicha natija yuborish"""
+    admin_name = f"Admin_{message.from_user.first_name}"
+    try:
+        records = parse_checkin_batch(text, default_scanner=admin_name, active_event_ids=await get_active_event_ids())
+    except Exception as e:
+        await message.answer(f"❌ Partiyani o'qib bo'lmadi: {e}")
+        return
+    if not records:
+        await message.answer("❌ Partiyada yozuv topilmadi!")
+        return
+
+    valid = [record for record in records if not record['error']]
+    results = await get_async_db().bulk_check_in(
+        [(r['qr_id'], r['event_id'], r['scanned_at'], r['scanner']) for r in valid]
+    )
+    if results is None:
+        await message.answer("❌ <b>TIZIM XATOLIGI!</b>\n🔄 Partiyani qayta yuboring.", parse_mode='HTML')
+        return
+    for record, result in zip(valid, results):
+        record.update(status=result['status'], full_name=result['full_name'],
+                      attended_at=result['attended_at'], attended_by=result['attended_by'])
+    for record in records:
+        if record['error']:
+            record.update(status=record['error'], full_name=None, attended_at=None, attended_by=None)
+
+    counts = {}
+    for record in records:
+        counts[record['status']] = counts.get(record['status'], 0) + 1
+    summary = "\n".join(f"{CHECKIN_STATUS_LABELS[status]}: {count}" for status, count in counts.items())
+
+    report = io.StringIO()
+    writer = csv.writer(report)
+    writer.writerow(['line', 'qr_id', 'scanned_at', 'scanner', 'status', 'full_name', 'attended_at', 'attended_by'])
+    for record in records:
+        writer.writerow([record['line'], record['qr_id'], record['scanned_at'], record['scanner'],
+                         record['status'], record['full_name'], record['attended_at'], record['attended_by']])
+
+    await message.answer_document(
+        types.InputFile(io.BytesIO(report.getvalue().encode('utf-8')), filename='checkin_results.csv'),
+        caption=f"📦 <b>PARTIYA QO'LLANDI</b> ({len(records)} ta yozuv)\n\n{summary}",
+        parse_mode='HTML'
+    )
+
+
+async def qr_batch_document_handler(message: types.Message, state: FSMContext):
+    """Skaner rejimida yuborilgan fayl (CSV/JSON) - partiyali kelganlik"""
+    if not is_admin(message.from_user.id):
+        return
+    if (message.document.mime_type or '').startswith('image/'):
+        # Siqilmagan rasm fayl sifatida yuborilgan
+        await qr_photo_handler(message, state)
+        return
+    buffer = io.BytesIO()
+    await message.document.download(destination_file=buffer)
+    try:
+        text = buffer.getvalue().decode('utf-8-sig')
+    except UnicodeDecodeError:
+        await message.answer("❌ Fayl UTF-8 matn bo'lishi kerak (CSV yoki JSON)")
+        return
+    await apply_checkin_batch(message, text)
+
+
 async def approve_user_handler(message: types.Message):
     """User ni tasdiqlash (komanda orqali)"""
     if not is_admin(message.from_user.id):
         return
     try:
         user_id = int(message.text.split('_')[1])
-        db = Database()
-        user = db.get_user(user_id)
+        db = get_async_db()
+        user = await db.get_user(user_id)
         if not user:
             await message.answer("❌ User topilmadi!")
             return
-        event = db.get_event_by_id(user[4]) if user[4] else None
+        event = await db.get_event_by_id(user.event_id) if user.event_id else None
         event_name = event[1] if event else "Noma'lum marosim"
-        success = db.approve_user_with_full_qr(user_id, approved=True)
+        success = await db.approve_user_with_full_qr(user_id, approved=True)
         if not success:
             await message.answer("❌ User tasdiqlashda xatolik!")
             return
-        qr_image = db.get_qr_code_image(user_id)
-        lang = user[13] if len(user) > 13 and user[13] else 'uz'
+        lang = user.language or 'uz'
         user_message = get_user_approval_message(user, event, lang)
-        sent = await safe_send_to_user(message.bot, user_id, user_message, qr_image)
-        if SHEETS_MODE:
-            user_info = {
-                'telegram_id': user[1], 'full_name': user[2], 'phone': user[3],
-                'payment_status': 'paid', 'qr_id': user[7], 'registered_at': user[9],
-                'event_id': user[4]
-            }
-            event_info = {
-                'payment_amount': event[5] if event else 100000,
-                'date': event[2] if event else '', 'time': event[3] if event else '',
-                'address': event[4] if event else ''
-            }
-            sheets_success = await update_sheets_data(user_info, event_info)
-        else:
-            sheets_success = False
+        sent = await safe_send_to_user(message.bot, user_id, user_message, with_qr=True)
         admin_message = (
             f"✅ <b>USER TASDIQLANDI!</b>\n\n"
-            f"👤 <b>Ism:</b> {user[2]}\n"
-            f"📱 <b>Telefon:</b> {user[3]}\n"
-            f"🆔 <b>Chipta ID:</b> <code>{user[7]}</code>\n\n"
-            f"📊 Google Sheets: {'✅' if SHEETS_MODE and sheets_success else '❌'}\n"
+            f"👤 <b>Ism:</b> {user.full_name}\n"
+            f"📱 <b>Telefon:</b> {user.phone_number}\n"
+            f"🆔 <b>Chipta ID:</b> <code>{user.qr_id}</code>\n\n"
+            f"📊 Google Sheets: {await sheets_outbox_status()}\n"
             f"📱 Foydalanuvchiga: {'✅' if sent else '❌'}"
         )
         await message.answer(admin_message, parse_mode='HTML')
@@ -355,14 +504,14 @@ async def reject_user_handler(message: types.Message):
 
     try:
         user_id = int(message.text.split('_')[1])
-        db = Database()
-        user = db.get_user(user_id)
+        db = get_async_db()
+        user = await db.select_user_fields(user_id, 'full_name')
 
         if not user:
             await message.answer("❌ User topilmadi!")
             return
 
-        db.approve_user(user_id, approved=False)
+        await db.approve_user(user_id, approved=False)
 
         # User ga xabar
         await safe_send_to_user(
@@ -370,7 +519,7 @@ async def reject_user_handler(message: types.Message):
             "❌ Afsuski, to'lovingiz tasdiqlanmadi.\n\n📞 Admin bilan bog'laning."
         )
 
-        await message.answer(f"❌ User {user[2]} rad etildi!")
+        await message.answer(f"❌ User {user.full_name} rad etildi!")
 
     except Exception as e:
         await message.answer(f"❌ Xatolik: {e}")
@@ -383,52 +532,31 @@ async def approve_user_callback(callback_query: types.CallbackQuery):
         return
     try:
         user_id = int(callback_query.data.split('_')[1])
-        db = Database()
-        user = db.get_user(user_id)
+        db = get_async_db()
+        user = await db.get_user(user_id)
         if not user:
             await callback_query.answer("❌ User topilmadi!")
             return
 
-        event = db.get_event_by_id(user[4]) if user[4] else None
+        event = await db.get_event_by_id(user.event_id) if user.event_id else None
         event_name = event[1] if event else "Noma'lum marosim"
 
-        success = db.approve_user_with_full_qr(user_id, approved=True)
+        success = await db.approve_user_with_full_qr(user_id, approved=True)
         if not success:
             await callback_query.answer("❌ User tasdiqlashda xatolik!")
             return
 
-        qr_image = db.get_qr_code_image(user_id)
-        lang = user[13] if len(user) > 13 and user[13] else 'uz'
+        lang = user.language or 'uz'
         user_message = get_user_approval_message(user, event, lang)
 
-        sent = await safe_send_to_user(callback_query.bot, user_id, user_message, qr_image)
-
-        if SHEETS_MODE:
-            user_info = {
-                'telegram_id': user[1],
-                'full_name': user[2],
-                'phone': user[3],
-                'payment_status': 'paid',
-                'qr_id': user[7],
-                'registered_at': user[9],
-                'event_id': user[4]
-            }
-            event_info = {
-                'payment_amount': event[5] if event else 100000,
-                'date': event[2] if event else '',
-                'time': event[3] if event else '',
-                'address': event[4] if event else ''
-            }
-            sheets_success = await update_sheets_data(user_info, event_info)
-        else:
-            sheets_success = False
+        sent = await safe_send_to_user(callback_query.bot, user_id, user_message, with_qr=True)
 
         admin_message = (
             f"✅ <b>USER TASDIQLANDI!</b>\n\n"
-            f"👤 <b>Ism:</b> {user[2]}\n"
-            f"📱 <b>Telefon:</b> {user[3]}\n"
-            f"🆔 <b>Chipta ID:</b> <code>{user[7]}</code>\n\n"
-            f"📊 Google Sheets: {'✅' if SHEETS_MODE and sheets_success else '❌'}\n"
+            f"👤 <b>Ism:</b> {user.full_name}\n"
+            f"📱 <b>Telefon:</b> {user.phone_number}\n"
+            f"🆔 <b>Chipta ID:</b> <code>{user.qr_id}</code>\n\n"
+            f"📊 Google Sheets: {await sheets_outbox_status()}\n"
             f"📱 Foydalanuvchiga: {'✅' if sent else '❌'}"
         )
 
@@ -456,15 +584,15 @@ async def reject_user_callback(callback_query: types.CallbackQuery):
 
     try:
         user_id = int(callback_query.data.split('_')[1])  # reject_123 -> 123
-        db = Database()
-        user = db.get_user(user_id)
+        db = get_async_db()
+        user = await db.select_user_fields(user_id, 'full_name', 'phone_number')
 
         if not user:
             await callback_query.answer("❌ User topilmadi!")
             return
 
         # Rad etish
-        db.approve_user(user_id, approved=False)
+        await db.approve_user(user_id, approved=False)
 
         # User ga xabar
         await safe_send_to_user(
@@ -475,8 +603,8 @@ async def reject_user_callback(callback_query: types.CallbackQuery):
         # Admin ga javob
         admin_message = (
             f"❌ <b>USER RAD ETILDI!</b>\n\n"
-            f"👤 <b>Ism:</b> {user[2]}\n"
-            f"📱 <b>Telefon:</b> {user[3]}\n"
+            f"👤 <b>Ism:</b> {user.full_name}\n"
+            f"📱 <b>Telefon:</b> {user.phone_number}\n"
             f"🆔 <b>User ID:</b> {user_id}\n\n"
             f"📱 Foydalanuvchiga xabar yuborildi"
         )
@@ -496,9 +624,9 @@ async def stats_handler(message: types.Message):
         return
 
     try:
-        db = Database()
-        overall_stats = db.get_all_user_stats()
-        events_with_stats = db.get_events_with_stats()
+        db = get_async_db()
+        overall_stats = await db.get_all_user_stats()
+        events_with_stats = await db.get_events_with_stats()
 
         stats_text = (
             f"📊 <b>UMUMIY STATISTIKA</b>\n\n"
@@ -546,8 +674,8 @@ async def pending_payments_handler(message: types.Message):
         return
 
     try:
-        db = Database()
-        pending_users = db.get_pending_users()
+        db = get_async_db()
+        pending_users = await db.get_pending_users()
 
         if not pending_users:
             await message.answer("✅ Kutilayotgan to'lovlar yo'q!")
@@ -557,12 +685,12 @@ async def pending_payments_handler(message: types.Message):
 
         for user in pending_users:
             user_info = (
-                f"👤 Ism: {user[2]}\n"
-                f"📱 Telefon: {user[3]}\n"
-                f"🆔 Telegram ID: {user[1]}\n"
-                f"🎫 QR ID: {user[7]}\n\n"
-                f"✅ Tasdiqlash: /approve_{user[1]}\n"
-                f"❌ Rad etish: /reject_{user[1]}"
+                f"👤 Ism: {user.full_name}\n"
+                f"📱 Telefon: {user.phone_number}\n"
+                f"🆔 Telegram ID: {user.telegram_id}\n"
+                f"🎫 QR ID: {user.qr_id}\n\n"
+                f"✅ Tasdiqlash: /approve_{user.telegram_id}\n"
+                f"❌ Rad etish: /reject_{user.telegram_id}"
             )
             await message.answer(user_info)
 
@@ -578,8 +706,8 @@ async def events_management_handler(message: types.Message):
         return
 
     try:
-        db = Database()
-        events_with_stats = db.get_events_with_stats()
+        db = get_async_db()
+        events_with_stats = await db.get_events_with_stats()
 
         if not events_with_stats:
             keyboard = types.InlineKeyboardMarkup()
@@ -643,8 +771,8 @@ async def channels_management_handler(message: types.Message):
         return
 
     try:
-        db = Database()
-        channels = db.get_all_channels()
+        db = get_async_db()
+        channels = await db.get_all_channels()
 
         channels_text = "📢 <b>KANALLAR BOSHQARUVI</b>\n\n"
 
@@ -717,7 +845,7 @@ async def process_channel_input(message: types.Message, state: FSMContext):
         # Show loading message
         loading_msg = await message.answer("🔄 Checking channel...")
 
-        db = Database()
+        db = get_async_db()
         # CRITICAL: Ensure this is awaited properly
         result = await db.add_channel_smart(message.bot, channel_input)
 
@@ -763,8 +891,8 @@ async def remove_channel_callback(callback_query: types.CallbackQuery):
             await callback_query.answer("❌ Xatolik: Channel ID topilmadi!")
             return
 
-        db = Database()
-        success = db.remove_channel(channel_id)
+        db = get_async_db()
+        success = await db.remove_channel(channel_id)
 
         if success:
             await callback_query.answer("✅ Kanal o'chirildi!")
@@ -785,12 +913,19 @@ async def google_sheets_panel(message: types.Message):
         return
     if SHEETS_MODE:
         sheets_url = get_sheets_url()
+        queue_stats = await get_sheets_queue_stats()
         keyboard = types.InlineKeyboardMarkup()
         if sheets_url:
             keyboard.add(types.InlineKeyboardButton("📊 Jadvalni ochish", url=sheets_url))
         await message.answer(
             f"📋 Google Sheets Jadval\n\n"
-            f"📊 Barcha ma'lumotlar shu jadvalda.\n\n"
+            f"📊 Barcha ma'lumotlar shu jadvalda.\n"
+            f"📥 Navbatda: {queue_stats['pending']} ta, kechikish {queue_stats['lag_seconds']} s\n"
+            f"🕐 Oxirgi yozish: {queue_stats['last_flush_at'] or '-'} ({queue_stats['last_flush_ms']} ms), "
+            f"xatoliklar: {queue_stats['failed']}\n"
+            f"⚠️ Oxirgi xatolik: {queue_stats['last_error'] or '-'}\n"
+            f"☠️ Yetkazib bo'lmagan (dead-letter): {queue_stats['dead']}\n"
+            f"{format_sheets_api_stats(queue_stats['api'])}\n\n"
             f"🔍 Jadvalda:\n"
             f"• Ism Familiya\n"
             f"• Telefon\n"
@@ -817,11 +952,35 @@ async def debug_channel_command(message: types.Message):
     if not is_admin(message.from_user.id):
         return
 
-    db = Database()
-    db.debug_channel_parsing()
+    db = get_async_db()
+    await db.debug_channel_parsing()
     await message.answer("✅ Debug test yakunlandi. Konsol loglarini tekshiring!")
 
 
+async def db_stats_command(message: types.Message):
+    """Debug: Database navbati va so'rovlar kechikishi"""
+    if not is_admin(message.from_user.id):
+        return
+
+    db = get_async_db()
+    stats = db.get_stats()
+    cache = db.user_cache.get_stats()
+    text = (
+        f"🗄 <b>DATABASE HOLATI</b>\n\n"
+        f"📥 Navbatda: {stats['queue_depth']}\n"
+        f"⚙️ Bajarilmoqda: {stats['running']}/{stats['workers']}\n"
+        f"👤 User keshi: {cache['entries']}/{cache['max_entries']}, "
+        f"hit {cache['hits']}, miss {cache['misses']}, chiqarilgan {cache['evictions']}\n\n"
+    )
+    slowest = sorted(stats['queries'].items(), key=lambda item: item[1]['avg_ms'], reverse=True)[:15]
+    for name, q in slowest:
+        text += (
+            f"<code>{name}</code>: {q['calls']} ta, "
+            f"o'rtacha {q['avg_ms']} ms, max {q['max_ms']} ms, kutish {q['avg_wait_ms']} ms\n"
+        )
+    await message.answer(text, parse_mode='HTML')
+
+
 async def add_event_callback_handler(callback_query: types.CallbackQuery):
     """Tadbir qo'shish callback"""
     if not is_admin(callback_query.from_user.id):
@@ -904,15 +1063,15 @@ async def process_event_payment(message: types.Message, state: FSMContext):
 
         payment_amount = float(message.text)
 
-        db = Database()
-        event_id = db.add_event(
+        db = get_async_db()
+        event_id = await db.add_event(
             data['event_name'], data['event_date'], data['event_time'],
             data['event_address'], payment_amount, lang
         )
 
         # Google Sheets tozalash
         if SHEETS_MODE:
-            clear_sheets_data()
+            await queue_clear_sheets()
 
         await message.answer(
             f"{texts['event_added']}\n\n"
@@ -943,14 +1102,12 @@ async def confirm_clear_sheets_callback(callback_query: types.CallbackQuery):
         return
 
     try:
-        await callback_query.message.edit_text("🔄 Google Sheets tozalanmoqda...")
-
-        # Clear sheets
-        clear_sheets_data()
+        # Clear sheets (navbat orqali, oldingi yozilmagan o'zgarishlar bekor qilinadi)
+        await queue_clear_sheets()
 
         await callback_query.message.edit_text(
-            "✅ <b>Google Sheets muvaffaqiyatli tozalandi!</b>\n\n"
-            "📋 Barcha eski ma'lumotlar o'chirildi.\n"
+            "✅ <b>Google Sheets tozalash navbatga qo'yildi!</b>\n\n"
+            "📋 Barcha eski ma'lumotlar bir necha soniyada o'chiriladi.\n"
             "🆕 Yangi event ma'lumotlari qo'shilishga tayyor.",
             parse_mode='HTML'
         )
@@ -981,11 +1138,10 @@ async def event_detail_callback_handler(callback_query: types.CallbackQuery):
         return
 
     event_id = int(callback_query.data.split('_')[2])
-    db = Database()
+    db = get_async_db()
 
     try:
-        events_with_stats = db.get_events_with_stats()
-        event = next((e for e in events_with_stats if e['id'] == event_id), None)
+        event = await db.get_event_stats(event_id)
 
         if not event:
             await callback_query.answer("❌ Marosim topilmadi!")
@@ -1026,10 +1182,10 @@ async def toggle_event_callback_handler(callback_query: types.CallbackQuery):
         return
 
     event_id = int(callback_query.data.split('_')[2])
-    db = Database()
+    db = get_async_db()
 
     try:
-        result = db.toggle_event_status(event_id)
+        result = await db.toggle_event_status(event_id)
         if result:
             await callback_query.answer("✅ Marosim holati o'zgartirildi!")
             await events_management_handler(callback_query.message)
@@ -1064,7 +1220,7 @@ async def debug_qr_command(message: types.Message):
         return
 
     try:
-        db = Database()
+        db = get_async_db()
         parsed_qr = db.parse_qr_data(test_id)
 
         debug_text = f"🔍 <b>DEBUG QR: {test_id}</b>\n\n"
@@ -1074,7 +1230,7 @@ async def debug_qr_command(message: types.Message):
 
         # Database test
         try:
-            user_data = db.get_user_with_full_qr_info_by_qr_id(parsed_qr['id'])
+            user_data = await db.get_user_with_full_qr_info_by_qr_id(parsed_qr['id'])
             if user_data:
                 debug_text += f"👤 <b>Database ma'lumot:</b>\n"
                 debug_text += f"Ism: {user_data['user']['full_name']}\n"
@@ -1099,8 +1255,8 @@ async def convert_qr_codes_command(message: types.Message):
     await message.answer("🔄 QR kodlarni JSON formatga o'zgartirish boshlandi...")
 
     try:
-        db = Database()
-        converted_count = db.convert_all_qr_to_json_format()
+        db = get_async_db()
+        converted_count = await db.convert_all_qr_to_json_format()
 
         await message.answer(
             f"🎉 <b>QR KODLAR O'ZGARTIRILDI!</b>\n\n"
@@ -1124,6 +1280,7 @@ def register_admin_handlers(dp: Dispatcher):
         dp.register_message_handler(approve_user_handler, lambda m: m.text.startswith('/approve_'))
         dp.register_message_handler(reject_user_handler, lambda m: m.text.startswith('/reject_'))
         dp.register_message_handler(debug_channel_command, Command("debug_channels"))
+        dp.register_message_handler(db_stats_command, Command("db_stats"))
 
         # Tugma handlari
         dp.register_message_handler(stats_handler, Text(equals="📊 Statistika"), user_id=config.ADMINS)
@@ -1141,6 +1298,9 @@ def register_admin_handlers(dp: Dispatcher):
         dp.register_message_handler(qr_scanner_start, Text(equals="📱 QR Skaner"), user_id=config.ADMINS)
         dp.register_message_handler(qr_scanner_stop, Text(equals="📱 QR Stop"), user_id=config.ADMINS, state="*")
         dp.register_message_handler(qr_scan_handler, state=AdminStates.qr_scanner_mode, content_types=['text'])
+        dp.register_message_handler(qr_batch_document_handler, state=AdminStates.qr_scanner_mode,
+                                    content_types=['document'])
+        dp.register_message_handler(qr_photo_handler, state=AdminStates.qr_scanner_mode, content_types=['photo'])
 
         # State handlari
         dp.register_message_handler(process_event_name, state=AdminStates.waiting_for_event_name)
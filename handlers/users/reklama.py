@@ -8,7 +8,7 @@ from aiogram.dispatcher.filters.state import State, StatesGroup
 from aiogram.utils.exceptions import BotBlocked, ChatNotFound, RetryAfter, Unauthorized
 from aiogram.dispatcher.filters import Command
 
-from utils.db_api.database import user_db
+from utils.db_api.async_database import get_async_db
 
 # Reklama yuborish jarayonlarini saqlash uchun ro'yxat
 advertisements = []
@@ -44,14 +44,14 @@ class Advertisement:
             delay = (self.send_time - datetime.datetime.now()).total_seconds()
             if delay > 0:
                 await asyncio.sleep(delay)
-        users = user_db.select_all_users()
+        users = await get_async_db().get_all_telegram_ids()
         self.total_users = len(users)
         self.current_message = await bot.send_message(
             chat_id=self.creator_id,
             text=f"Reklama #{self.ad_id} yuborish boshlandi.\nYuborilgan: {self.sent_count}\nYuborilmagan: {self.failed_count}\nUmumiy: {self.sent_count + self.failed_count}/{self.total_users}\n\nStatus: Davom etmoqda",
             reply_markup=get_status_keyboard(self.ad_id)
         )
-        for user in users:
+        for user_id in users:
             if not self.running:
                 break
             while self.paused:
@@ -61,7 +61,7 @@ class Advertisement:
             if not self.running:
                 break
             try:
-                await send_advertisement_to_user(user[1], self)
+                await send_advertisement_to_user(user_id, self)
                 self.sent_count += 1
             except (BotBlocked, ChatNotFound, Unauthorized):
                 self.failed_count += 1
@@ -155,11 +155,11 @@ async def check_super_admin_permission(telegram_id: int):
 
 
 async def check_admin_permission(telegram_id: int):
-    user = user_db.select_user(telegram_id=telegram_id)
+    user = await get_async_db().select_user_fields(telegram_id, 'id')
     if not user:
         return False
-    user_id = user[0]
-    admin = user_db.check_if_admin(user_id=user_id)
+    user_id = user.id
+    admin = await get_async_db().check_if_admin(user_id=user_id)
     return admin
 
 
@@ -16,18 +16,10 @@ from keyboards.default.keyboards import (
     get_user_info_keyboard,
     get_back_to_main_keyboard
 )
-from loader import db
-from utils.db_api.database import Database
-
-# Google Sheets import
-try:
-    from sheets_integration import save_user_with_qr_to_sheets
-
-    SHEETS_MODE = True
-    print("✅ Google Sheets user handlers da ulanadi")
-except ImportError:
-    SHEETS_MODE = False
-    print("❌ Google Sheets user handlers da ulanmadi")
+from utils.db_api.async_database import get_async_db
+from utils.subscription import get_subscription_checker
+from utils.tickets import send_qr_photo
+from utils.user_context import UserContext
 
 
 # User states
@@ -39,59 +31,12 @@ class UserStates(StatesGroup):
     waiting_for_payment_screenshot = State()
 
 
-async def check_user_subscription(bot, user_id, channels):
+async def check_user_subscription(bot, user_id, channels, force=False):
     """
-    TUZATILGAN: Foydalanuvchi barcha kerakli kanallarga obuna bo'lganligini tekshiradi.
+    Foydalanuvchi barcha kerakli kanallarga obuna bo'lganligini tekshiradi (keshlangan).
     channels -> [(channel_id, channel_name, channel_username, channel_type), ...]
     """
-    try:
-        if not channels:
-            print("📝 Hech qanday kanal topilmadi")
-            return True  # Kanal yo'q bo'lsa, obuna tekshirish shart emas
-
-        for channel in channels:
-            try:
-                # Channel tuple dan ma'lumotlarni olish
-                channel_id, channel_name, channel_username, channel_type = channel
-
-                # Actual channel identifier ni aniqlash
-                if channel_id.startswith('@'):
-                    # Public channel username
-                    actual_channel_id = channel_id
-                    print(f"🔍 Tekshirilayotgan kanal (username): {actual_channel_id}")
-                elif channel_id.startswith('-100'):
-                    # Private channel ID
-                    actual_channel_id = int(channel_id)
-                    print(f"🔍 Tekshirilayotgan kanal (ID): {actual_channel_id}")
-                elif channel_id.isdigit() or (channel_id.startswith('-') and channel_id[1:].isdigit()):
-                    # Numeric ID
-                    actual_channel_id = int(channel_id)
-                    print(f"🔍 Tekshirilayotgan kanal (numeric): {actual_channel_id}")
-                else:
-                    print(f"⚠️ Noma'lum kanal format: {channel_id}")
-                    continue  # Skip invalid format
-
-                # Bot API orqali obuna tekshirish
-                member = await bot.get_chat_member(actual_channel_id, user_id)
-
-                if member.status not in ["member", "administrator", "creator"]:
-                    print(f"🚫 User {user_id} kanalga obuna emas: {actual_channel_id} (status: {member.status})")
-                    return False
-                else:
-                    print(f"✅ User {user_id} kanalga obuna: {actual_channel_id}")
-
-            except Exception as channel_error:
-                print(f"❌ Kanal {channel_id} tekshirishda xatolik: {channel_error}")
-                # Agar kanal mavjud bo'lmasa yoki bot unga kira olmasa, False qaytarish
-                return False
-
-        print(f"✅ User {user_id} barcha kanallarga obuna!")
-        return True
-
-    except Exception as e:
-        print(f"❌ check_user_subscription da umumiy xatolik: {e}")
-        return False
-
+    return await get_subscription_checker().is_subscribed(bot, user_id, channels, force=force)
 
 
 def get_status_message(status, lang):
@@ -126,21 +71,22 @@ def get_status_message(status, lang):
     return messages.get(status, {}).get(lang, f"Status: {status}")
 
 
-async def start_handler(message: types.Message, state: FSMContext):
+async def start_handler(message: types.Message, state: FSMContext, user_ctx: UserContext = None):
     """TUZATILGAN /start command handler."""
     try:
-        db = Database()
+        db = get_async_db()
         user_id = message.from_user.id
+        user_ctx = user_ctx or UserContext(user_id)
 
         # Clear state
         await state.finish()
 
         # Get user from database
-        user = db.get_user(user_id)
-        lang = user[13] if user and len(user) > 13 and user[13] else 'uz'
+        user = await user_ctx.get_user()
+        lang = user.language if user and user.language else 'uz'
 
         # 1️⃣ First check channel subscriptions
-        channels = db.get_all_channels()
+        channels = await db.get_all_channels()
         print(f"📋 Topilgan kanallar: {len(channels)} ta")
 
         if channels:
@@ -162,14 +108,14 @@ async def start_handler(message: types.Message, state: FSMContext):
                 return
 
         # 2️⃣ If user exists and has complete registration (name AND phone)
-        if user and user[2] and user[3] and user[2] != '' and user[3] != '':
+        if user and user.full_name and user.phone_number and user.full_name != '' and user.phone_number != '':
             # User is fully registered, show main menu
             welcome_texts = {
-                'uz': f"👋 Assalomu alaykum, {user[2]}!",
-                'ru': f"👋 Здравствуйте, {user[2]}!",
-                'en': f"👋 Hello, {user[2]}!"
+                'uz': f"👋 Assalomu alaykum, {user.full_name}!",
+                'ru': f"👋 Здравствуйте, {user.full_name}!",
+                'en': f"👋 Hello, {user.full_name}!"
             }
-            status = db.get_user_registration_status(user_id)
+            status = await user_ctx.get_status()
             status_msg = get_status_message(status['status'], lang)
 
             await message.answer(
@@ -181,7 +127,7 @@ async def start_handler(message: types.Message, state: FSMContext):
         # 3️⃣ If user exists but missing name or phone (incomplete registration)
         if user:
             # User exists in database but incomplete registration
-            if not user[2] or user[2] == '':
+            if not user.full_name or user.full_name == '':
                 # Missing full name
                 contact_texts = {
                     'uz': "📝 Ro'yxatdan o'tishni davom ettirish uchun ism va familiyangizni kiriting (masalan: Aziz Azizov):",
@@ -192,7 +138,7 @@ async def start_handler(message: types.Message, state: FSMContext):
                 await UserStates.waiting_for_full_name.set()
                 return
 
-            if not user[3] or user[3] == '':
+            if not user.phone_number or user.phone_number == '':
                 # Missing phone number
                 contact_texts = {
                     'uz': "📱 Ro'yxatdan o'tishni davom ettirish uchun telefon raqamingizni yuboring:",
@@ -207,7 +153,7 @@ async def start_handler(message: types.Message, state: FSMContext):
                 return
 
         # 4️⃣ If no user exists OR no language selected (completely new user)
-        if not user or not user[13] or str(user[13]).strip() == '':
+        if not user or not user.language or str(user.language).strip() == '':
             await message.answer(
                 "🌐 Tilni tanlang / Выберите язык / Select language:",
                 reply_markup=get_language_keyboard()
@@ -235,11 +181,11 @@ async def select_language_callback(callback: types.CallbackQuery, state: FSMCont
     """TUZATILGAN til tanlash callback."""
     try:
         lang = callback.data.split('_')[1]  # Handles 'lang_uz'
-        db = Database()
+        db = get_async_db()
         user_id = callback.from_user.id
 
         # Save language
-        success = db.set_user_language(user_id, lang)
+        success = await db.set_user_language(user_id, lang)
         if not success:
             await callback.answer("❌ Xatolik!", show_alert=True)
             return
@@ -258,7 +204,7 @@ async def select_language_callback(callback: types.CallbackQuery, state: FSMCont
         await callback.message.delete()
 
         # Check channels
-        channels = db.get_all_channels()
+        channels = await db.get_all_channels()
         print(f"📋 Til tanlagandan keyin kanallar: {len(channels)} ta")
 
         if channels:
@@ -303,11 +249,11 @@ async def change_language_callback(callback: types.CallbackQuery, state: FSMCont
     """Handle change language callback."""
     try:
         lang = callback.data.split('_')[2]  # 'change_lang_uz', 'change_lang_ru', 'change_lang_en'
-        db = Database()
+        db = get_async_db()
         user_id = callback.from_user.id
 
         # Save the new language
-        success = db.set_user_language(user_id, lang)
+        success = await db.set_user_language(user_id, lang)
         if not success:
             await callback.answer("❌ Xatolik yuz berdi!", show_alert=True)
             return
@@ -343,19 +289,21 @@ async def change_language_callback(callback: types.CallbackQuery, state: FSMCont
         await callback.answer("❌ Xatolik yuz berdi!", show_alert=True)
 
 
-async def check_subscription_callback(callback: types.CallbackQuery, state: FSMContext):
+async def check_subscription_callback(callback: types.CallbackQuery, state: FSMContext, user_ctx: UserContext = None):
     """TUZATILGAN obuna tekshirish callback."""
     try:
-        db = Database()
+        db = get_async_db()
         user_id = callback.from_user.id
-        user = db.get_user(user_id)
-        lang = user[13] if user and len(user) > 13 else 'uz'
+        user_ctx = user_ctx or UserContext(user_id)
+        user = await user_ctx.get_user()
+        lang = user.language if user and user.language else 'uz'
 
-        channels = db.get_all_channels()
+        channels = await db.get_all_channels()
         print(f"📋 Obuna tekshirish: {len(channels)} ta kanal")
         print(f"🔍 Kanallar: {channels}")
 
-        subscribed = await check_user_subscription(callback.bot, user_id, channels)
+        # User "obuna bo'ldim" deb bosgan - keshdagi eski javobga ishonmaymiz
+        subscribed = await check_user_subscription(callback.bot, user_id, channels, force=True)
         print(f"📊 Obuna natijasi: {subscribed}")
 
         if subscribed:
@@ -368,13 +316,13 @@ async def check_subscription_callback(callback: types.CallbackQuery, state: FSMC
             await callback.answer(success_texts.get(lang, success_texts['uz']))
 
             # Agar user to'liq ro'yxatdan o'tgan bo'lsa - asosiy menyuni ko'rsatish
-            if user and user[2] and user[3] and user[2] != '' and user[3] != '':
+            if user and user.full_name and user.phone_number and user.full_name != '' and user.phone_number != '':
                 welcome_texts = {
-                    'uz': f"👋 Xush kelibsiz, {user[2]}!",
-                    'ru': f"👋 Добро пожаловать, {user[2]}!",
-                    'en': f"👋 Welcome, {user[2]}!"
+                    'uz': f"👋 Xush kelibsiz, {user.full_name}!",
+                    'ru': f"👋 Добро пожаловать, {user.full_name}!",
+                    'en': f"👋 Welcome, {user.full_name}!"
                 }
-                status = db.get_user_registration_status(user_id)
+                status = await user_ctx.get_status()
                 status_msg = get_status_message(status['status'], lang)
 
                 await callback.bot.send_message(
@@ -412,13 +360,14 @@ async def check_subscription_callback(callback: types.CallbackQuery, state: FSMC
         await callback.answer("❌ Xatolik!", show_alert=True)
 
 
-async def process_full_name(message: types.Message, state: FSMContext):
+async def process_full_name(message: types.Message, state: FSMContext, user_ctx: UserContext = None):
     """Process full name input (first name and last name together)."""
     try:
-        db = Database()
+        db = get_async_db()
         user_id = message.from_user.id
-        user = db.get_user(user_id)
-        lang = user[13] if user and len(user) > 13 else 'uz'
+        user_ctx = user_ctx or UserContext(user_id)
+        user = await user_ctx.get_user()
+        lang = user.language if user and user.language else 'uz'
 
         full_name = message.text.strip()
 
@@ -491,13 +440,14 @@ async def process_full_name(message: types.Message, state: FSMContext):
         await message.answer("❌ Xatolik yuz berdi!")
 
 
-async def process_contact(message: types.Message, state: FSMContext):
+async def process_contact(message: types.Message, state: FSMContext, user_ctx: UserContext = None):
     """Process contact information."""
     try:
-        db = Database()
+        db = get_async_db()
         user_id = message.from_user.id
-        user = db.get_user(user_id)
-        lang = user[13] if user and len(user) > 13 else 'uz'
+        user_ctx = user_ctx or UserContext(user_id)
+        user = await user_ctx.get_user()
+        lang = user.language if user and user.language else 'uz'
 
         # Get full name from state
         data = await state.get_data()
@@ -530,20 +480,7 @@ async def process_contact(message: types.Message, state: FSMContext):
             return
 
         # Save user data
-        with db.get_connection() as conn:
-            cursor = conn.cursor()
-            cursor.execute(
-                "UPDATE users SET full_name = ?, phone_number = ? WHERE telegram_id = ?",
-                (full_name, phone, user_id)
-            )
-            conn.commit()
-
-        # If Google Sheets is enabled, save data
-        if SHEETS_MODE:
-            try:
-                save_user_with_qr_to_sheets(user_id, full_name, phone)
-            except Exception as e:
-                print(f"Google Sheets save error: {e}")
+        await db.update_user_contact(user_id, full_name, phone)
 
         # Clear state
         await state.finish()
@@ -568,16 +505,17 @@ async def process_contact(message: types.Message, state: FSMContext):
         await message.answer("❌ Xatolik yuz berdi!")
 
 
-async def event_list_handler(message: types.Message):
+async def event_list_handler(message: types.Message, user_ctx: UserContext = None):
     """Display the latest active event."""
     try:
-        db = Database()
+        db = get_async_db()
         user_id = message.from_user.id
-        user = db.get_user(user_id)
-        lang = user[13] if user and len(user) > 13 else 'uz'
+        user_ctx = user_ctx or UserContext(user_id)
+        user = await user_ctx.get_user()
+        lang = user.language if user and user.language else 'uz'
 
         # Check if user is registered
-        if not user or not user[2] or not user[3] or user[2] == '' or user[3] == '':
+        if not user or not user.full_name or not user.phone_number or user.full_name == '' or user.phone_number == '':
             not_reg_texts = {
                 'uz': "❌ Avval ro'yxatdan o'tishingiz kerak!\nIltimos /start bosing",
                 'ru': "❌ Сначала нужно зарегистрироваться!\nПожалуйста нажмите /start",
@@ -587,7 +525,7 @@ async def event_list_handler(message: types.Message):
             return
 
         # Get the latest active event
-        events = db.get_all_active_events(lang)
+        events = await db.get_all_active_events(lang)
         if not events:
             no_events = {
                 'uz': "📅 Hozirda faol tadbirlar mavjud emas",
@@ -602,8 +540,8 @@ async def event_list_handler(message: types.Message):
         event_id, event_name, event_date, event_time, event_address, payment_amount, _, _ = latest_event
 
         # Check if user is approved for this event
-        status = db.get_user_registration_status(user_id)
-        if status['status'] == 'approved' and user[4] == event_id:
+        status = await user_ctx.get_status()
+        if status['status'] == 'approved' and user.event_id == event_id:
             approved_texts = {
                 'uz': f"✅ Siz ushbu tadbir uchun allaqachon tasdiqlangansiz: {event_name}",
                 'ru': f"✅ Вы уже подтверждены для этого мероприятия: {event_name}",
@@ -672,18 +610,19 @@ Select:
         await message.answer("❌ Xatolik yuz berdi!")
 
 
-async def pay_event_callback(callback: types.CallbackQuery, state: FSMContext):
+async def pay_event_callback(callback: types.CallbackQuery, state: FSMContext, user_ctx: UserContext = None):
     """Handle 'Pay' button for the selected event."""
     try:
         event_id = int(callback.data.split('_')[2])  # Handles 'pay_event_'
-        db = Database()
+        db = get_async_db()
         user_id = callback.from_user.id
-        user = db.get_user(user_id)
-        lang = user[13] if user and len(user) > 13 else 'uz'
+        user_ctx = user_ctx or UserContext(user_id)
+        user = await user_ctx.get_user()
+        lang = user.language if user and user.language else 'uz'
 
         # Check if user is approved for this event
-        status = db.get_user_registration_status(user_id)
-        if status['status'] == 'approved' and user[4] == event_id:
+        status = await user_ctx.get_status()
+        if status['status'] == 'approved' and user.event_id == event_id:
             approved_texts = {
                 'uz': "✅ Siz ushbu tadbir uchun allaqachon tasdiqlangansiz!",
                 'ru': "✅ Вы уже подтверждены для этого мероприятия!",
@@ -698,16 +637,10 @@ async def pay_event_callback(callback: types.CallbackQuery, state: FSMContext):
             return
 
         # If approved for a different event, reset payment status for new event
-        if status['status'] == 'approved' and user[4] != event_id:
-            with db.get_connection() as conn:
-                cursor = conn.cursor()
-                cursor.execute(
-                    "UPDATE users SET payment_status = 'pending', approved = 0, qr_code = NULL, qr_id = ? WHERE telegram_id = ?",
-                    (db._generate_unique_qr_id(), user_id)
-                )
-                conn.commit()
+        if status['status'] == 'approved' and user.event_id != event_id:
+            await db.reset_user_for_new_event(user_id)
 
-        event = db.get_event_by_id(event_id, lang)
+        event = await db.get_event_by_id(event_id, lang)
         if not event:
             await callback.answer("❌ Tadbir topilmadi!", show_alert=True)
             return
@@ -779,19 +712,17 @@ async def pay_event_callback(callback: types.CallbackQuery, state: FSMContext):
         await callback.answer("❌ Xatolik!", show_alert=True)
 
 
-async def cancel_payment_callback(callback: types.CallbackQuery, state: FSMContext):
+async def cancel_payment_callback(callback: types.CallbackQuery, state: FSMContext, user_ctx: UserContext = None):
     """Handle 'Cancel Payment' button."""
     try:
-        db = Database()
+        db = get_async_db()
         user_id = callback.from_user.id
-        user = db.get_user(user_id)
-        lang = user[13] if user and len(user) > 13 else 'uz'
+        user_ctx = user_ctx or UserContext(user_id)
+        user = await user_ctx.get_user()
+        lang = user.language if user and user.language else 'uz'
 
         # Clear event selection
-        with db.get_connection() as conn:
-            cursor = conn.cursor()
-            cursor.execute("UPDATE users SET event_id = NULL WHERE telegram_id = ?", (user_id,))
-            conn.commit()
+        await db.clear_user_event(user_id)
 
         await callback.message.delete()
 
@@ -816,13 +747,14 @@ async def cancel_payment_callback(callback: types.CallbackQuery, state: FSMConte
         await callback.answer("❌ Xatolik!", show_alert=True)
 
 
-async def process_screenshot(message: types.Message, state: FSMContext):
+async def process_screenshot(message: types.Message, state: FSMContext, user_ctx: UserContext = None):
     """Process payment screenshot."""
     try:
-        db = Database()
+        db = get_async_db()
         user_id = message.from_user.id
-        user = db.get_user(user_id)
-        lang = user[13] if user and len(user) > 13 else 'uz'
+        user_ctx = user_ctx or UserContext(user_id)
+        user = await user_ctx.get_user()
+        lang = user.language if user and user.language else 'uz'
 
         if not message.photo:
             error_texts = {
@@ -836,16 +768,16 @@ async def process_screenshot(message: types.Message, state: FSMContext):
         file_id = message.photo[-1].file_id
 
         # Update payment status
-        db.update_payment_status(user_id, 'pending_approval')
+        await db.update_payment_status(user_id, 'pending_approval')
 
         # Admin notification
-        event = db.get_event_by_id(user[4], lang) if user[4] else None
+        event = await db.get_event_by_id(user.event_id, lang) if user.event_id else None
         event_name = event[1] if event else 'Noma\'lum tadbir'
         admin_message = f"""
 💳 <b>YANGI TO'LOV CHEKI</b>
 
-👤 <b>Ism:</b> {user[2]}
-📱 <b>Telefon:</b> {user[3]}
+👤 <b>Ism:</b> {user.full_name}
+📱 <b>Telefon:</b> {user.phone_number}
 🎪 <b>Tadbir:</b> {event_name}
 🆔 <b>User ID:</b> <code>{user_id}</code>
 
@@ -879,13 +811,6 @@ async def process_screenshot(message: types.Message, state: FSMContext):
 
         await state.finish()
 
-        # Save to Google Sheets if enabled
-        if SHEETS_MODE:
-            try:
-                save_user_with_qr_to_sheets(user_id, user[2], user[3])
-            except Exception as e:
-                print(f"Google Sheets save error: {e}")
-
     except Exception as e:
         print(f"Process screenshot error: {e}")
         import traceback
@@ -893,14 +818,15 @@ async def process_screenshot(message: types.Message, state: FSMContext):
         await message.answer("❌ Xatolik yuz berdi!")
 
 
-async def my_info_handler(message: types.Message):
+async def my_info_handler(message: types.Message, user_ctx: UserContext = None):
     """Display user information."""
     try:
-        db = Database()
+        db = get_async_db()
         user_id = message.from_user.id
-        user = db.get_user(user_id)
+        user_ctx = user_ctx or UserContext(user_id)
+        user = await user_ctx.get_user()
 
-        if not user or not user[2] or not user[3] or user[2] == '' or user[3] == '':
+        if not user or not user.full_name or not user.phone_number or user.full_name == '' or user.phone_number == '':
             error_texts = {
                 'uz': "❌ Siz hali ro'yxatdan o'tmagansiz!\nIltimos /start bosing",
                 'ru': "❌ Вы еще не зарегистрированы!\nПожалуйста нажмите /start",
@@ -909,11 +835,11 @@ async def my_info_handler(message: types.Message):
             await message.answer(error_texts.get('uz', error_texts['uz']))
             return
 
-        lang = user[13] if len(user) > 13 and user[13] else 'uz'
-        status = db.get_user_registration_status(user_id)
+        lang = user.language or 'uz'
+        status = await user_ctx.get_status()
 
         # Event info
-        event = db.get_event_by_id(user[4], lang) if user[4] else None
+        event = await db.get_event_by_id(user.event_id, lang) if user.event_id else None
         event_name = event[1] if event else "-"
 
         # Status text
@@ -922,50 +848,49 @@ async def my_info_handler(message: types.Message):
         # Agar tasdiqlangan bo'lsa — QR kod va to'liq chipta ma'lumotlari
         if status['status'] == 'approved':
             try:
-                qr_image = db.get_qr_code_image(user_id)
-                if qr_image:
-                    ticket_number = user[7] if len(user) > 7 else user_id
-                    texts = {
-                        'uz': f"""✅ <b>Tabriklaymiz!</b> To'lovingiz tasdiqlandi.
+                ticket_number = user.qr_id
+                texts = {
+                    'uz': f"""✅ <b>Tabriklaymiz!</b> To'lovingiz tasdiqlandi.
 Bu QR sizning elektron chiptangiz.
 
-🎟 <b>Ishtirokchi:</b> {user[2]}
-📱 <b>Telefon:</b> {user[3]}
+🎟 <b>Ishtirokchi:</b> {user.full_name}
+📱 <b>Telefon:</b> {user.phone_number}
 🎪 <b>Tadbir:</b> {event_name}
 🆔 <b>Chipta raqami:</b> <code>{ticket_number}</code>
 
 <b>Eslatma!</b>
 Boshqa ishtirokchi tomonidan chiptangiz o'zlashtirilmasligi uchun, ushbu chipta ma'lumotlaringizni sir saqlash tavsiya etiladi!!!
 """,
-                        'ru': f"""✅ <b>Поздравляем!</b> Ваша оплата подтверждена.
+                    'ru': f"""✅ <b>Поздравляем!</b> Ваша оплата подтверждена.
 Этот QR — ваш электронный билет.
 
-🎟 <b>Участник:</b> {user[2]}
-📱 <b>Телефон:</b> {user[3]}
+🎟 <b>Участник:</b> {user.full_name}
+📱 <b>Телефон:</b> {user.phone_number}
 🎪 <b>Мероприятие:</b> {event_name}
 🆔 <b>Номер билета:</b> <code>{ticket_number}</code>
 
 <b>Важно!</b>
 Чтобы ваш билет не был использован другим участником, храните данные билета в секрете!!!
 """,
-                        'en': f"""✅ <b>Congratulations!</b> Your payment has been confirmed.
+                    'en': f"""✅ <b>Congratulations!</b> Your payment has been confirmed.
 This QR is your e-ticket.
 
-🎟 <b>Participant:</b> {user[2]}
-📱 <b>Phone:</b> {user[3]}
+🎟 <b>Participant:</b> {user.full_name}
+📱 <b>Phone:</b> {user.phone_number}
 🎪 <b>Event:</b> {event_name}
 🆔 <b>Ticket number:</b> <code>{ticket_number}</code>
 
 <b>Note!</b>
 To prevent your ticket from being misused by others, keep your ticket information confidential!!!
 """
-                    }
+                }
 
-                    await message.answer_photo(
-                        qr_image,
-                        caption=texts.get(lang, texts['uz']),
-                        parse_mode='HTML'
-                    )
+                sent = await send_qr_photo(
+                    message.bot, message.chat.id, user_id,
+                    caption=texts.get(lang, texts['uz']),
+                    parse_mode='HTML'
+                )
+                if sent:
                     return  # Approved bo'lsa boshqa ma'lumotlarni chiqarmaymiz
             except Exception as qr_error:
                 print(f"QR kod rasmini yuborishda xatolik: {qr_error}")
@@ -975,31 +900,31 @@ To prevent your ticket from being misused by others, keep your ticket informatio
             'uz': f"""
 📋 <b>MENING MA'LUMOTLARIM</b>
 
-👤 <b>To'liq ism:</b> {user[2]}
-📱 <b>Telefon:</b> {user[3]}
+👤 <b>To'liq ism:</b> {user.full_name}
+📱 <b>Telefon:</b> {user.phone_number}
 🎪 <b>Tanlangan tadbir:</b> {event_name}
 📊 <b>Holat:</b> {status_text}
-🆔 <b>ID:</b> <code>{user[7] if len(user) > 7 else user_id}</code>
+🆔 <b>ID:</b> <code>{user.qr_id}</code>
 🌐 <b>Til:</b> {lang.upper()}
 """,
             'ru': f"""
 📋 <b>МОИ ДАННЫЕ</b>
 
-👤 <b>Полное имя:</b> {user[2]}
-📱 <b>Телефон:</b> {user[3]}
+👤 <b>Полное имя:</b> {user.full_name}
+📱 <b>Телефон:</b> {user.phone_number}
 🎪 <b>Выбранное мероприятие:</b> {event_name}
 📊 <b>Статус:</b> {status_text}
-🆔 <b>ID:</b> <code>{user[7] if len(user) > 7 else user_id}</code>
+🆔 <b>ID:</b> <code>{user.qr_id}</code>
 🌐 <b>Язык:</b> {lang.upper()}
 """,
             'en': f"""
 📋 <b>MY INFORMATION</b>
 
-👤 <b>Full name:</b> {user[2]}
-📱 <b>Phone:</b> {user[3]}
+👤 <b>Full name:</b> {user.full_name}
+📱 <b>Phone:</b> {user.phone_number}
 🎪 <b>Selected event:</b> {event_name}
 📊 <b>Status:</b> {status_text}
-🆔 <b>ID:</b> <code>{user[7] if len(user) > 7 else user_id}</code>
+🆔 <b>ID:</b> <code>{user.qr_id}</code>
 🌐 <b>Language:</b> {lang.upper()}
 """
         }
@@ -1018,13 +943,14 @@ To prevent your ticket from being misused by others, keep your ticket informatio
 
 
 
-async def contact_handler(message: types.Message):
+async def contact_handler(message: types.Message, user_ctx: UserContext = None):
     """Handle contact request."""
     try:
-        db = Database()
+        db = get_async_db()
         user_id = message.from_user.id
-        user = db.get_user(user_id)
-        lang = user[13] if user and len(user) > 13 and user[13] else 'uz'
+        user_ctx = user_ctx or UserContext(user_id)
+        user = await user_ctx.get_user()
+        lang = user.language if user and user.language else 'uz'
 
         admin_username = getattr(config, 'ADMIN_USERNAME', '@husniyamee')
 
@@ -1045,13 +971,14 @@ async def contact_handler(message: types.Message):
         await message.answer("❌ Xatolik yuz berdi!")
 
 
-async def change_language_handler(message: types.Message):
+async def change_language_handler(message: types.Message, user_ctx: UserContext = None):
     """Handle change language request."""
     try:
-        db = Database()
+        db = get_async_db()
         user_id = message.from_user.id
-        user = db.get_user(user_id)
-        lang = user[13] if user and len(user) > 13 else 'uz'
+        user_ctx = user_ctx or UserContext(user_id)
+        user = await user_ctx.get_user()
+        lang = user.language if user and user.language else 'uz'
 
         await message.answer(
             {
@@ -1068,23 +995,24 @@ async def change_language_handler(message: types.Message):
 
 
 
-async def back_to_main_callback(callback: types.CallbackQuery, state: FSMContext):
+async def back_to_main_callback(callback: types.CallbackQuery, state: FSMContext, user_ctx: UserContext = None):
     """Handle back to main menu callback."""
     try:
-        db = Database()
+        db = get_async_db()
         user_id = callback.from_user.id
-        user = db.get_user(user_id)
-        lang = user[13] if user and len(user) > 13 else 'uz'
+        user_ctx = user_ctx or UserContext(user_id)
+        user = await user_ctx.get_user()
+        lang = user.language if user and user.language else 'uz'
 
         await callback.message.delete()
 
         welcome_texts = {
-            'uz': f"👋 Assalomu alaykum, {user[2]}!",
-            'ru': f"👋 Здравствуйте, {user[2]}!",
-            'en': f"👋 Hello, {user[2]}!"
+            'uz': f"👋 Assalomu alaykum, {user.full_name}!",
+            'ru': f"👋 Здравствуйте, {user.full_name}!",
+            'en': f"👋 Hello, {user.full_name}!"
         }
 
-        status = db.get_user_registration_status(user_id)
+        status = await user_ctx.get_status()
         status_msg = get_status_message(status['status'], lang)
 
         await callback.bot.send_message(
@@ -1102,15 +1030,16 @@ async def back_to_main_callback(callback: types.CallbackQuery, state: FSMContext
         await callback.answer("❌ Xatolik!", show_alert=True)
 
 
-async def my_qr_callback(callback: types.CallbackQuery, state: FSMContext):
+async def my_qr_callback(callback: types.CallbackQuery, state: FSMContext, user_ctx: UserContext = None):
     """Handle 'View my QR code' callback."""
     try:
-        db = Database()
+        db = get_async_db()
         user_id = callback.from_user.id
-        user = db.get_user(user_id)
-        lang = user[13] if user and len(user) > 13 else 'uz'
+        user_ctx = user_ctx or UserContext(user_id)
+        user = await user_ctx.get_user()
+        lang = user.language if user and user.language else 'uz'
 
-        status = db.get_user_registration_status(user_id)
+        status = await user_ctx.get_status()
         if status['status'] != 'approved':
             error_texts = {
                 'uz': "❌ QR kod faqat tasdiqlangan to'lovdan so'ng mavjud!",
@@ -1120,8 +1049,19 @@ async def my_qr_callback(callback: types.CallbackQuery, state: FSMContext):
             await callback.answer(error_texts.get(lang, error_texts['uz']), show_alert=True)
             return
 
-        qr_image = db.get_qr_code_image(user_id)
-        if not qr_image:
+        qr_texts = {
+            'uz': f"🎫 Sizning QR kodingiz\n🆔 <b>ID:</b> <code>{user.qr_id}</code>",
+            'ru': f"🎫 Ваш QR код\n🆔 <b>ID:</b> <code>{user.qr_id}</code>",
+            'en': f"🎫 Your QR code\n🆔 <b>ID:</b> <code>{user.qr_id}</code>"
+        }
+
+        sent = await send_qr_photo(
+            callback.bot, callback.message.chat.id, user_id,
+            caption=qr_texts.get(lang, qr_texts['uz']),
+            reply_markup=get_user_info_keyboard(user_id, lang),
+            parse_mode='HTML'
+        )
+        if not sent:
             error_texts = {
                 'uz': "❌ QR kod topilmadi!",
                 'ru': "❌ QR код не найден!",
@@ -1130,20 +1070,7 @@ async def my_qr_callback(callback: types.CallbackQuery, state: FSMContext):
             await callback.answer(error_texts.get(lang, error_texts['uz']), show_alert=True)
             return
 
-        qr_texts = {
-            'uz': f"🎫 Sizning QR kodingiz\n🆔 <b>ID:</b> <code>{user[7] if len(user) > 7 else user_id}</code>",
-            'ru': f"🎫 Ваш QR код\n🆔 <b>ID:</b> <code>{user[7] if len(user) > 7 else user_id}</code>",
-            'en': f"🎫 Your QR code\n🆔 <b>ID:</b> <code>{user[7] if len(user) > 7 else user_id}</code>"
-        }
-
         await callback.message.delete()
-        await callback.bot.send_photo(
-            callback.message.chat.id,
-            qr_image,
-            caption=qr_texts.get(lang, qr_texts['uz']),
-            reply_markup=get_user_info_keyboard(user_id, lang),
-            parse_mode='HTML'
-        )
         await callback.answer()
 
     except Exception as e:
@@ -1151,18 +1078,19 @@ async def my_qr_callback(callback: types.CallbackQuery, state: FSMContext):
         await callback.answer("❌ Xatolik!", show_alert=True)
 
 
-async def payment_status_callback(callback: types.CallbackQuery, state: FSMContext):
+async def payment_status_callback(callback: types.CallbackQuery, state: FSMContext, user_ctx: UserContext = None):
     """Handle 'Payment status' callback."""
     try:
-        db = Database()
+        db = get_async_db()
         user_id = callback.from_user.id
-        user = db.get_user(user_id)
-        lang = user[13] if user and len(user) > 13 else 'uz'
+        user_ctx = user_ctx or UserContext(user_id)
+        user = await user_ctx.get_user()
+        lang = user.language if user and user.language else 'uz'
 
-        status = db.get_user_registration_status(user_id)
+        status = await user_ctx.get_status()
         status_text = get_status_message(status['status'], lang)
 
-        event = db.get_event_by_id(user[4], lang) if user[4] else None
+        event = await db.get_event_by_id(user.event_id, lang) if user.event_id else None
         event_name = event[1] if event else "-"
 
         status_texts = {
@@ -1183,20 +1111,21 @@ async def payment_status_callback(callback: types.CallbackQuery, state: FSMConte
         await callback.answer("❌ Xatolik!", show_alert=True)
 
 
-async def confirm_terms_callback(callback: types.CallbackQuery, state):
+async def confirm_terms_callback(callback: types.CallbackQuery, state, user_ctx: UserContext = None):
     """TUZATILGAN shartlarga rozilik callback"""
     try:
         event_id = int(callback.data.split('_')[2])
         user_id = callback.from_user.id
+        user_ctx = user_ctx or UserContext(user_id)
 
-        db = Database()  # db ni to'g'ri import qilish
-        user = db.get_user(user_id)
-        lang = user[13] if user and len(user) > 13 else 'uz'
+        db = get_async_db()
+        user = await user_ctx.get_user()
+        lang = user.language if user and user.language else 'uz'
 
         # Event ID ni yangilash
-        db.update_user_event(user_id, event_id)
+        await db.update_user_event(user_id, event_id)
 
-        event = db.get_event_by_id(event_id, lang)
+        event = await db.get_event_by_id(event_id, lang)
         event_name = event[1]
 
         # Config dan karta ma'lumotlarini olish
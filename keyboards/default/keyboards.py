@@ -1,5 +1,7 @@
 # ================ KEYBOARDS.PY - TO'G'IRLANGAN VERSIYA ================
 
+from functools import lru_cache
+
 from aiogram.types import ReplyKeyboardMarkup, KeyboardButton, InlineKeyboardMarkup, InlineKeyboardButton
 
 
@@ -65,14 +67,18 @@ def get_change_language_keyboard():
 
 
 def get_subscribe_button(channels, lang='uz'):
+    """Kanallarga obuna bo'lish tugmalari (kanallar ro'yxati va til bo'yicha keshlanadi)"""
+    return _build_subscribe_button(tuple(tuple(channel) for channel in channels), lang)
+
+
+@lru_cache(maxsize=32)
+def _build_subscribe_button(channels, lang):
     """TUZATILGAN: Kanallarga obuna bo'lish tugmalari"""
     keyboard = InlineKeyboardMarkup(row_width=1)
 
     for channel_data in channels:
         try:
             # Database dan keladigan ma'lumotlar: (channel_id, channel_name, channel_username, channel_type)
-            print(f"🔍 Processing channel: {channel_data}")
-
             if len(channel_data) >= 4:
                 channel_id, channel_name, channel_username, channel_type = channel_data[:4]
             elif len(channel_data) == 3:
@@ -86,8 +92,6 @@ def get_subscribe_button(channels, lang='uz'):
                 print(f"❌ Invalid channel data format: {channel_data}")
                 continue
 
-            print(f"📋 Parsed: ID={channel_id}, Name={channel_name}, Username={channel_username}, Type={channel_type}")
-
             # URL yaratish - TUZATILGAN mantiq
             url = None
 
@@ -102,7 +106,6 @@ def get_subscribe_button(channels, lang='uz'):
                 # Username ni validatsiya qilish
                 if username_clean and len(username_clean) > 0 and username_clean != 'none' and username_clean != 'yoq':
                     url = f"https://t.me/{username_clean}"
-                    print(f"✅ URL from username: {url}")
 
             # 2. Agar username yo'q bo'lsa, channel_id dan foydalanish
             if not url:
@@ -111,18 +114,15 @@ def get_subscribe_button(channels, lang='uz'):
                     username_from_id = str(channel_id)[1:]  # @ ni olib tashlash
                     if username_from_id and username_from_id != 'none':
                         url = f"https://t.me/{username_from_id}"
-                        print(f"✅ URL from channel_id (username): {url}")
 
                 elif str(channel_id).startswith('-100'):
                     # Private channel ID
                     channel_numeric_id = str(channel_id)[4:]  # -100 ni olib tashlash
                     url = f"https://t.me/c/{channel_numeric_id}/1"
-                    print(f"✅ URL from channel_id (private): {url}")
 
                 elif str(channel_id).isdigit() or (str(channel_id).startswith('-') and str(channel_id)[1:].isdigit()):
                     # Oddiy raqamli ID
                     url = f"https://t.me/c/{str(channel_id).replace('-', '')}/1"
-                    print(f"✅ URL from channel_id (numeric): {url}")
 
             # 3. Fallback: channel_name dan foydalanish (agar boshqa hech narsa ishlamasa)
             if not url:
@@ -143,8 +143,6 @@ def get_subscribe_button(channels, lang='uz'):
                 else:
                     display_name = f"Channel {str(channel_id)[:10]}"
 
-            print(f"🎯 Final: Name='{display_name}', URL='{url}'")
-
             # Tugma qo'shish
             keyboard.add(
                 InlineKeyboardButton(f"📢 {display_name}", url=url)
@@ -1,5 +1,5 @@
 # loader.py
-from utils.db_api.database import Database
+from utils.db_api.database import get_db
 from aiogram import Bot, Dispatcher, types
 from aiogram.contrib.fsm_storage.memory import MemoryStorage
 from data import config
@@ -9,4 +9,4 @@ storage = MemoryStorage()
 dp = Dispatcher(bot, storage=storage)
 
 # Database faqat bir marta yaratiladi
-db = Database()
+db = get_db()
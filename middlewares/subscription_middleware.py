@@ -3,16 +3,16 @@ from aiogram.dispatcher.handler import CancelHandler
 from aiogram import types
 
 from keyboards.default.keyboards import get_subscribe_button
-from utils.db_api.database import Database
+from utils.db_api.async_database import get_async_db
 from handlers.users.start import check_user_subscription
 
 class SubscriptionMiddleware(BaseMiddleware):
     async def on_pre_process_message(self, message: types.Message, data: dict):
-        db = Database()
-        channels = db.get_all_channels()
+        db = get_async_db()
+        channels = await db.get_all_channels()
         subscribed = await check_user_subscription(message.bot, message.from_user.id, channels)
         if not subscribed:
-            lang = 'uz'  # Yoki db.get_user_lang(message.from_user.id)
+            lang = await data['user_ctx'].get_language() if 'user_ctx' in data else 'uz'
             texts = {
                 'uz': "📢 Botdan foydalanish uchun quyidagi kanallarga obuna bo'ling:",
                 'ru': "📢 Подпишитесь на следующие каналы для использования бота:",
@@ -25,11 +25,13 @@ class SubscriptionMiddleware(BaseMiddleware):
             raise CancelHandler()  # ❌ Boshqa handlerlar ishlamaydi
 
     async def on_pre_process_callback_query(self, callback: types.CallbackQuery, data: dict):
-        db = Database()
-        channels = db.get_all_channels()
-        subscribed = await check_user_subscription(callback.bot, callback.from_user.id, channels)
+        db = get_async_db()
+        channels = await db.get_all_channels()
+        # "Tekshirish" tugmasi keshni chetlab o'tadi
+        force = callback.data == 'check_subscription'
+        subscribed = await check_user_subscription(callback.bot, callback.from_user.id, channels, force=force)
         if not subscribed:
-            lang = 'uz'
+            lang = await data['user_ctx'].get_language() if 'user_ctx' in data else 'uz'
             texts = {
                 'uz': "📢 Botdan foydalanish uchun quyidagi kanallarga obuna bo'ling:",
                 'ru': "📢 Подпишитесь на следующие каналы для использования бота:",
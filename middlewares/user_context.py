@@ -0,0 +1,14 @@
+from aiogram import types
+from aiogram.dispatcher.middlewares import BaseMiddleware
+
+from utils.user_context import UserContext
+
+
+class UserContextMiddleware(BaseMiddleware):
+    """Har bir updatega UserContext biriktiradi (handlerlarda user_ctx argumenti)"""
+
+    async def on_pre_process_message(self, message: types.Message, data: dict):
+        data['user_ctx'] = UserContext(message.from_user.id)
+
+    async def on_pre_process_callback_query(self, callback: types.CallbackQuery, data: dict):
+        data['user_ctx'] = UserContext(callback.from_user.id)
@@ -1,31 +1,123 @@
-import qrcode
-from io import BytesIO
-import base64
 from googleapiclient.discovery import build
+from googleapiclient.errors import HttpError
 from google.oauth2.service_account import Credentials
 import os
 from datetime import datetime
 import time
 import json
+import asyncio
+import random
+import re
+import threading
+
+from data import config
+from utils.db_api.async_database import get_async_db
+
+class SheetsUnavailableError(Exception):
+    """Circuit ochiq - Google Sheets vaqtincha chaqirilmaydi"""
+
+
+class TokenBucket:
+    """Daqiqalik kvota uchun token bucket (thread-safe). Istalgan 60 soniyada per_minute dan oshmaydi"""
+
+    def __init__(self, per_minute):
+        self.capacity = max(1, per_minute // 6)
+        self.rate = max(per_minute - self.capacity, 1) / 60
+        self._tokens = self.capacity
+        self._updated_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """Token olish, kerak bo'lsa kutadi. Kutilgan vaqtni (soniya) qaytaradi"""
+        waited = 0
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated_at) * self.rate)
+                self._updated_at = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return waited
+                delay = (1 - self._tokens) / self.rate
+            time.sleep(delay)
+            waited += delay
+
+
+class CircuitBreaker:
+    """Ketma-ket failure_threshold ta xatolikdan keyin reset_timeout soniya so'rov yubormaydi"""
+
+    def __init__(self, failure_threshold=5, reset_timeout=60):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return 'closed'
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return 'half_open'
+        return 'open'
+
+    def allow(self):
+        # half_open: sinov so'rovi o'tadi, xato bo'lsa circuit yana ochiladi
+        return self.state != 'open'
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.failures >= self.failure_threshold or self.opened_at is not None:
+                self.opened_at = time.monotonic()
+
+
+def _is_transient(error):
+    """Google tomonidagi vaqtinchalik muammo (circuit breaker hisoblaydi): 429, 5xx, tarmoq xatoliklari"""
+    if isinstance(error, HttpError):
+        return error.resp.status == 429 or error.resp.status >= 500
+    return not isinstance(error, (ValueError, KeyError, TypeError))
+
 
 class GoogleSheetsSimple:
     def __init__(self, credentials_path="mybotproject-468611-8104acd37ccd.json"):
         """Google Sheets API - JWT muammosini hal qilgan versiya"""
+        # spreadsheet_id -> {qr_id: qator raqami}. Bazada (sheets_rows) ham saqlanadi
+        self.row_index = {}
+        # Sarlavhasi tekshirilgan jadvallar (jarayon davomida bir marta)
+        self._headers_ready = set()
+        # Kvota: o'qish va yozish so'rovlari alohida hisoblanadi
+        self.read_bucket = TokenBucket(config.SHEETS_READ_PER_MINUTE)
+        self.write_bucket = TokenBucket(config.SHEETS_WRITE_PER_MINUTE)
+        self.breaker = CircuitBreaker(config.SHEETS_BREAKER_THRESHOLD, config.SHEETS_BREAKER_RESET)
+        self.metrics = {'requests': 0, 'throttled': 0, 'throttled_seconds': 0.0, 'rate_limited': 0,
+                        'server_errors': 0, 'failed': 0, 'rejected': 0}
+        self.credentials_path = credentials_path
+        self.scopes = ['https://www.googleapis.com/auth/spreadsheets']
+        self.service = None
+        if self.reconnect():
+            print("✅ Google Sheets API ulandi (JWT muammosi hal qilindi)")
+        else:
+            print("⚠️ Offline rejimda ishlamoqda (outbox ulanish tiklanganda yetkaziladi)")
+
+    def reconnect(self):
+        """service ni yaratish. Ishga tushishda ulanmagan bo'lsa drainer har urinishda chaqiradi"""
+        if self.service:
+            return True
         try:
-            scopes = ['https://www.googleapis.com/auth/spreadsheets']
-            if not os.path.exists(credentials_path):
-                print(f"❌ Credentials fayl topilmadi: {credentials_path}")
-                raise FileNotFoundError(f"Credentials file not found: {credentials_path}")
-
-            creds = self._create_fresh_credentials(credentials_path, scopes)
-            self.credentials_path = credentials_path
-            self.scopes = scopes
+            if not os.path.exists(self.credentials_path):
+                print(f"❌ Credentials fayl topilmadi: {self.credentials_path}")
+                raise FileNotFoundError(f"Credentials file not found: {self.credentials_path}")
+            creds = self._create_fresh_credentials(self.credentials_path, self.scopes)
             self.service = build('sheets', 'v4', credentials=creds)
-            print("✅ Google Sheets API ulandi (JWT muammosi hal qilindi)")
         except Exception as e:
             print(f"❌ Google Sheets API xatolik: {e}")
-            self.service = None
-            print("⚠️ Offline rejimda ishlamoqda (Google Sheets o'chirildi)")
+        return bool(self.service)
 
     def _create_fresh_credentials(self, credentials_path, scopes):
         """Yangi va toza credentials yaratish"""
@@ -47,8 +139,48 @@ class GoogleSheetsSimple:
             print(f"⚠️ Credentials yaratishda muammo: {e}")
             return Credentials.from_service_account_file(credentials_path, scopes=scopes)
 
+    def _execute(self, request):
+        """Bitta API so'rovi: kvota bo'yicha navbat, 429/5xx da eksponensial kechikish bilan qayta urinish"""
+        bucket = self.read_bucket if getattr(request, 'method', 'POST') == 'GET' else self.write_bucket
+        for attempt in range(config.SHEETS_MAX_RETRIES + 1):
+            waited = bucket.acquire()
+            if waited:
+                self.metrics['throttled'] += 1
+                self.metrics['throttled_seconds'] += waited
+            self.metrics['requests'] += 1
+            try:
+                return request.execute()
+            except HttpError as e:
+                status = e.resp.status
+                if not (status == 429 or status >= 500) or attempt == config.SHEETS_MAX_RETRIES:
+                    raise
+                self.metrics['rate_limited' if status == 429 else 'server_errors'] += 1
+                retry_after = e.resp.get('retry-after')
+                delay = float(retry_after) if retry_after and retry_after.isdigit() else 2 ** attempt
+                print(f"⏳ Sheets API {status} - {delay:.0f} soniyadan keyin qayta urinish")
+                time.sleep(min(delay, 60) + random.uniform(0, 1))
+
     def _retry_with_fresh_credentials(self, func, *args, **kwargs):
-        """Xatolik bo'lganda yangi credentials bilan qayta urinish"""
+        """Xatolik bo'lganda yangi credentials bilan qayta urinish (circuit ochiq bo'lsa darhol xatolik)"""
+        if not self.breaker.allow():
+            self.metrics['rejected'] += 1
+            raise SheetsUnavailableError("Google Sheets vaqtincha o'chirilgan (circuit ochiq)")
+        try:
+            result = self._call_with_fresh_credentials(func, *args, **kwargs)
+        except Exception as e:
+            self.metrics['failed'] += 1
+            if _is_transient(e):
+                self.breaker.record_failure()
+            raise
+        self.breaker.record_success()
+        return result
+
+    def get_api_stats(self):
+        stats = dict(self.metrics, throttled_seconds=round(self.metrics['throttled_seconds'], 1))
+        stats['circuit'] = self.breaker.state
+        return stats
+
+    def _call_with_fresh_credentials(self, func, *args, **kwargs):
         try:
             return func(*args, **kwargs)
         except Exception as e:
@@ -80,7 +212,7 @@ class GoogleSheetsSimple:
                     }
                 }]
             }
-            result = self.service.spreadsheets().create(body=spreadsheet).execute()
+            result = self._execute(self.service.spreadsheets().create(body=spreadsheet))
             spreadsheet_id = result.get('spreadsheetId')
             self._setup_spreadsheet_format(spreadsheet_id)
             print(f"✅ Jadval yaratildi: {spreadsheet_id}")
@@ -99,10 +231,11 @@ class GoogleSheetsSimple:
             return True
 
         def _clear():
-            self.service.spreadsheets().values().clear(
+            self._execute(self.service.spreadsheets().values().clear(
                 spreadsheetId=spreadsheet_id,
                 range='A2:H1000'  # I dan H ga o'zgartirildi
-            ).execute()
+            ))
+            self.row_index[spreadsheet_id] = {}
             return True
 
         try:
@@ -113,6 +246,38 @@ class GoogleSheetsSimple:
             print(f"❌ Jadval tozalashda xatolik: {e}")
             return False
 
+    def load_row_index(self, spreadsheet_id, rows):
+        """Bazada saqlangan indeksni yuklash (bo'sh bo'lsa birinchi murojaatda jadvaldan o'qiladi)"""
+        if rows:
+            self.row_index[spreadsheet_id] = dict(rows)
+
+    def _read_row_index(self, spreadsheet_id):
+        """Indeksni ID ustunidan bitta so'rov bilan qayta qurish"""
+        ids = self._execute(self.service.spreadsheets().values().get(
+            spreadsheetId=spreadsheet_id,
+            range='E:E'
+        )).get('values', [])
+        index = {str(row[0]): number for number, row in enumerate(ids, start=1) if number > 1 and row and row[0]}
+        self.row_index[spreadsheet_id] = index
+        return index
+
+    def _rows_match(self, spreadsheet_id, index, qr_ids):
+        """Indeksdagi qatorlarda haqiqatan shu qr_id turganini bitta values.batchGet bilan tekshirish"""
+        qr_ids = sorted(qr_ids)
+        value_ranges = self._execute(self.service.spreadsheets().values().batchGet(
+            spreadsheetId=spreadsheet_id,
+            ranges=[f'E{index[qr_id]}' for qr_id in qr_ids]
+        )).get('valueRanges', [])
+        found = [str((value_range.get('values') or [['']])[0][0]) for value_range in value_ranges]
+        return found == qr_ids
+
+    def _get_row_index(self, spreadsheet_id):
+        """(indeks, jadvaldan qayta o'qildimi)"""
+        index = self.row_index.get(spreadsheet_id)
+        if index is None:
+            return self._read_row_index(spreadsheet_id), True
+        return index, False
+
     def _setup_spreadsheet_format(self, spreadsheet_id):
         """Jadval formatini sozlash"""
         if not self.service:
@@ -122,12 +287,12 @@ class GoogleSheetsSimple:
             headers = [
                 ['№', 'ISM FAMILIYA', 'TELEFON RAQAM', 'TOLOV QILINGAN', 'ID', 'QR CODE', 'KELDI', 'SKANER HOLATI']
             ]
-            self.service.spreadsheets().values().update(
+            self._execute(self.service.spreadsheets().values().update(
                 spreadsheetId=spreadsheet_id,
                 range='A1:H1',  # I1 dan H1 ga o'zgartirildi
                 valueInputOption='RAW',
                 body={'values': headers}
-            ).execute()
+            ))
 
             requests = [
                 {'updateDimensionProperties': {
@@ -165,10 +330,10 @@ class GoogleSheetsSimple:
                                           'verticalAlignment': 'MIDDLE'}},
                                 'fields': 'userEnteredFormat(backgroundColor,textFormat,horizontalAlignment,verticalAlignment)'}}
             ]
-            self.service.spreadsheets().batchUpdate(
+            self._execute(self.service.spreadsheets().batchUpdate(
                 spreadsheetId=spreadsheet_id,
                 body={'requests': requests}
-            ).execute()
+            ))
 
         try:
             self._retry_with_fresh_credentials(_setup)
@@ -177,9 +342,10 @@ class GoogleSheetsSimple:
             print(f"❌ Format sozlashda xatolik: {e}")
 
     def create_qr_formula(self, cell_reference, row_number):
-        """QR kod formulasi yaratish"""
+        """QR kod formulasi yaratish (row_number=None - qator raqami formulaning o'zidan olinadi)"""
         try:
-            formula = f'=IMAGE("https://api.qrserver.com/v1/create-qr-code/?size=1200x1200&data=" & ENCODEURL(E{row_number}) & "&margin=20")'
+            source = f'E{row_number}' if row_number else 'INDIRECT("E" & ROW())'
+            formula = f'=IMAGE("https://api.qrserver.com/v1/create-qr-code/?size=1200x1200&data=" & ENCODEURL({source}) & "&margin=20")'
             print(f"✅ QR formula yaratildi (1200x1200): {cell_reference}")
             return formula
         except Exception as e:
@@ -187,30 +353,32 @@ class GoogleSheetsSimple:
             return None
 
     def ensure_headers_exist(self, spreadsheet_id):
-        """Sarlavhalar mavjudligini tekshirish"""
-        if not self.service:
+        """Sarlavhalar mavjudligini tekshirish (har bir jadval uchun jarayonda bir marta)"""
+        if not self.service or spreadsheet_id in self._headers_ready:
             return False
 
         def _check_headers():
-            existing_headers = self.service.spreadsheets().values().get(
+            existing_headers = self._execute(self.service.spreadsheets().values().get(
                 spreadsheetId=spreadsheet_id,
                 range='A1:H1'  # I1 dan H1 ga o'zgartirildi
-            ).execute()
+            ))
             existing_values = existing_headers.get('values', [[]])
             if not existing_values or len(existing_values[0]) < 8:
                 headers = [
                     ['№', 'ISM FAMILIYA', 'TELEFON RAQAM', 'TOLOV QILINGAN', 'ID', 'QR CODE', 'KELDI', 'SKANER HOLATI']
                 ]
-                self.service.spreadsheets().values().update(
+                self._execute(self.service.spreadsheets().values().update(
                     spreadsheetId=spreadsheet_id,
                     range='A1:H1',
                     valueInputOption='RAW',
                     body={'values': headers}
-                ).execute()
+                ))
                 print("✅ Sarlavhalar avtomatik qo'shildi")
+                self._headers_ready.add(spreadsheet_id)
                 return True
             else:
                 print("✅ Sarlavhalar mavjud")
+                self._headers_ready.add(spreadsheet_id)
                 return False
 
         try:
@@ -219,111 +387,108 @@ class GoogleSheetsSimple:
             print(f"❌ Sarlavhalarni tekshirishda xatolik: {e}")
             return False
 
-    def add_user(self, spreadsheet_id, user_info, event_info=None):
-        """Foydalanuvchi qo'shish - JWT xatoliklarga chidamli"""
+    def _user_row_values(self, user_info, row_number=None):
+        qr_id = user_info.get('qr_id')
+        qr_formula = self.create_qr_formula(f'F{row_number or ""}', row_number)
+        return [
+            user_info.get('full_name', ''),  # ISM FAMILIYA
+            user_info.get('phone', ''),  # TELEFON RAQAM
+            '☑' if user_info.get('payment_status') in ('paid', 'approved') else '☐',  # TOLOV QILINGAN
+            str(qr_id),  # ID
+            qr_formula if qr_formula else str(qr_id),  # QR CODE
+        ]
+
+    def _new_row_values(self, user_info):
+        """Qo'shiladigan qator: № va QR formulasi o'z qatoridan hisoblanadi (raqam oldindan kerak emas)"""
+        return ['=ROW()-1'] + self._user_row_values(user_info) + ['☐', '']
+
+    def _append_rows(self, spreadsheet_id, rows):
+        """Qatorlarni jadval oxiriga bitta values.append so'rovi bilan qo'shish, birinchi qator raqamini qaytaradi"""
+        result = self._execute(self.service.spreadsheets().values().append(
+            spreadsheetId=spreadsheet_id,
+            range='A:H',
+            valueInputOption='USER_ENTERED',
+            insertDataOption='INSERT_ROWS',
+            body={'values': rows}
+        ))
+        # updatedRange: "Sheet1!A5:H7"
+        updated_range = result.get('updates', {}).get('updatedRange', '')
+        match = re.search(r'[A-Z]+(\d+)', updated_range.split('!')[-1])
+        if not match:
+            raise ValueError(f"append javobida qator raqami yo'q: {updated_range!r}")
+        return int(match.group(1))
+
+    def sync_batch(self, spreadsheet_id, clear=False, users=(), attendance=()):
+        """Navbatdagi o'zgarishlarni bitta partiyada yozish
+
+        users -> [user_info, ...] (qr_id bo'yicha mavjud qator yangilanadi, yo'q bo'lsa qo'shiladi)
+        attendance -> [(qr_id, scanner_name, vaqt), ...]
+        Yangi qatorlar bitta values.append (INSERT_ROWS), mavjudlari va kelganlik bitta values.batchUpdate
+        bilan yoziladi; qator raqamlari row_index dan olinadi. Indeksda yo'q qr_id bo'lsa (yangi user)
+        avval ID ustuni o'qiladi - jadvalda allaqachon bor qator qayta qo'shilmaydi. Aks holda yozishdan
+        oldin indeksdagi E katakchalari bitta values.batchGet bilan tekshiriladi, mos kelmasa indeks qayta quriladi.
+        Qaytaradi: (yangi qatorlar {qr_id: qator}, indeks to'liq almashtirildimi)
+        """
         if not self.service:
-            print("✅ Offline rejim - user qo'shilmadi")
-            return True
+            return {}, False
 
-        def _add_user():
-            self.ensure_headers_exist(spreadsheet_id)
-            try:
-                existing_data = self.service.spreadsheets().values().get(
+        def _sync():
+            if clear:
+                self._execute(self.service.spreadsheets().values().clear(
                     spreadsheetId=spreadsheet_id,
-                    range='A:A'
-                ).execute()
-                next_row = len(existing_data.get('values', [])) + 1
-            except:
-                next_row = 2
-
-            qr_id = user_info.get('qr_id')
-            qr_formula = self.create_qr_formula(f'F{next_row}', next_row)
-
-            user_data = [
-                next_row - 1,  # №
-                user_info.get('full_name', ''),  # ISM FAMILIYA
-                user_info.get('phone', ''),  # TELEFON RAQAM
-                '☑' if user_info.get('payment_status') == 'paid' else '☐',  # TOLOV QILINGAN
-                str(qr_id),  # ID
-                qr_formula if qr_formula else str(qr_id),  # QR CODE
-                '☐',  # KELDI
-                ''  # SKANER HOLATI
-            ]
-
-            self.service.spreadsheets().values().update(
-                spreadsheetId=spreadsheet_id,
-                range=f'A{next_row}:H{next_row}',  # I dan H ga o'zgartirildi
-                valueInputOption='USER_ENTERED',
-                body={'values': [user_data]}
-            ).execute()
-            return True
-
-        try:
-            result = self._retry_with_fresh_credentials(_add_user)
-            print(f"✅ User qo'shildi: {user_info.get('full_name')} (ID: {user_info.get('qr_id')})")
-            return result
-        except Exception as e:
-            print(f"❌ User qo'shishda xatolik: {e}")
-            return False
-
-    def update_attendance(self, spreadsheet_id, qr_data, scanner_name='Admin'):
-        """Kelganlik belgilash - JWT xatoliklarga chidamli"""
-        if not self.service:
-            print("✅ Offline rejim - kelganlik belgilanmadi")
-            return True, "Offline rejim"
-
-        def _update_attendance():
-            if ':' in qr_data:
-                qr_id, _ = qr_data.split(':')
+                    range='A2:H1000'
+                ))
+                index, rebuilt = {}, True
             else:
-                qr_id = qr_data
-
-            data = self.service.spreadsheets().values().get(
-                spreadsheetId=spreadsheet_id,
-                range='E:E'
-            ).execute()
-            values = data.get('values', [])
-            row_number = None
-            for i, row in enumerate(values):
-                if row and str(row[0]) == str(qr_id):
-                    row_number = i + 1
-                    break
-
-            if not row_number:
-                print(f"❌ QR ID topilmadi: {qr_data}")
-                return False, None
-
-            current_time = datetime.now().strftime('%H:%M')
-            updates = [
-                {'range': f'G{row_number}', 'values': [['☑']]},
-                {'range': f'H{row_number}', 'values': [[f'{scanner_name} {current_time}']]}
-            ]
-            batch_update_request = {
-                'valueInputOption': 'RAW',
-                'data': updates
-            }
-            self.service.spreadsheets().values().batchUpdate(
-                spreadsheetId=spreadsheet_id,
-                body=batch_update_request
-            ).execute()
-
-            user_data = self.service.spreadsheets().values().get(
-                spreadsheetId=spreadsheet_id,
-                range=f'A{row_number}:H{row_number}'  # I dan H ga o'zgartirildi
-            ).execute()
-            user_info = user_data.get('values', [[]])[0]
-            user_name = user_info[1] if len(user_info) > 1 else 'Noma\'lum'
+                index, rebuilt = self._get_row_index(spreadsheet_id)
+                targets = {str(user_info.get('qr_id')) for user_info in users}
+                targets.update(str(qr_id) for qr_id, _, _ in attendance)
+                if not rebuilt and any(qr_id not in index for qr_id in targets):
+                    # Indeksda yo'q chipta: yangi qator yoki jadval qo'lda o'zgartirilgan. Qo'shishdan oldin
+                    # ID ustunini o'qiymiz - oldingi (ack qilinmagan) urinishda qo'shilgan qator takrorlanmaydi
+                    index, rebuilt = self._read_row_index(spreadsheet_id), True
+                elif not rebuilt and targets and not self._rows_match(spreadsheet_id, index, targets):
+                    # Qatorlar qo'lda saralangan/o'chirilgan - eski raqamlar boshqa odamga tegishli bo'lishi mumkin
+                    index, rebuilt = self._read_row_index(spreadsheet_id), True
+            # Yozish muvaffaqiyatsiz bo'lsa indeks buzilmasligi uchun nusxa bilan ishlaymiz
+            index = dict(index)
+            changed = dict(index) if rebuilt else {}
+
+            data = []
+            new_users = []
+            for user_info in users:
+                qr_id = str(user_info.get('qr_id'))
+                row_number = index.get(qr_id)
+                if row_number:
+                    data.append({'range': f'B{row_number}:F{row_number}',
+                                 'values': [self._user_row_values(user_info, row_number)]})
+                else:
+                    new_users.append(user_info)
+
+            if new_users:
+                # Barcha yangi qatorlar bitta append bilan - qator raqamlari javobdan olinadi
+                self.ensure_headers_exist(spreadsheet_id)
+                first_row = self._append_rows(spreadsheet_id, [self._new_row_values(user_info) for user_info in new_users])
+                for offset, user_info in enumerate(new_users):
+                    index[str(user_info.get('qr_id'))] = changed[str(user_info.get('qr_id'))] = first_row + offset
+
+            for qr_id, scanner_name, scanned_at in attendance:
+                row_number = index.get(str(qr_id))
+                if not row_number:
+                    print(f"❌ Sheets: QR ID topilmadi: {qr_id}")
+                    continue
+                data.append({'range': f'G{row_number}:H{row_number}',
+                             'values': [['☑', f'{scanner_name} {scanned_at}']]})
+
+            if data:
+                self._execute(self.service.spreadsheets().values().batchUpdate(
+                    spreadsheetId=spreadsheet_id,
+                    body={'valueInputOption': 'USER_ENTERED', 'data': data}
+                ))
+            self.row_index[spreadsheet_id] = index
+            return changed, rebuilt
 
-            return True, user_name
-
-        try:
-            success, user_info = self._retry_with_fresh_credentials(_update_attendance)
-            if success:
-                print(f"✅ Kelganlik belgilandi: {qr_data} - {user_info}")
-            return success, user_info
-        except Exception as e:
-            print(f"❌ Kelganlik belgilashda xatolik: {e}")
-            return False, None
+        return self._retry_with_fresh_credentials(_sync)
 
     def get_stats(self, spreadsheet_id):
         """Statistika olish - JWT xatoliklarga chidamli"""
@@ -331,10 +496,10 @@ class GoogleSheetsSimple:
             return {'total': 0, 'attended': 0, 'not_attended': 0}
 
         def _get_stats():
-            data = self.service.spreadsheets().values().get(
+            data = self._execute(self.service.spreadsheets().values().get(
                 spreadsheetId=spreadsheet_id,
                 range='A2:H1000'  # I dan H ga o'zgartirildi
-            ).execute()
+            ))
             users = data.get('values', [])
             total = len(users)
             attended = len([u for u in users if len(u) > 6 and u[6] == '☑'])
@@ -354,6 +519,12 @@ class GoogleSheetsSimple:
 sheets_client = None
 SPREADSHEET_ID = None
 
+
+def is_sheets_connected():
+    """API ulangan va jadval mavjud (aks holda offline rejim)"""
+    return bool(sheets_client and sheets_client.service and SPREADSHEET_ID)
+
+
 def init_google_sheets(credentials_path="mybotproject-468611-8104acd37ccd.json", spreadsheet_id=None):
     """Google Sheets ni ishga tushirish"""
     global sheets_client, SPREADSHEET_ID
@@ -392,34 +563,176 @@ def clear_sheets_data():
         return success
     except Exception as e:
         print(f"❌ Sheets tozalashda xatolik: {e}")
-        return True
+        return False
+
+class SheetsOutboxDrainer:
+    """sheets_outbox jadvalini Google Sheets ga yetkazuvchi fon vazifasi
+
+    Yozuvlar users o'zgarishi bilan bitta tranzaksiyada qo'shiladi (Database._outbox_*),
+    shuning uchun bot qayta ishga tushsa yoki Google ishlamay qolsa ham yo'qolmaydi.
+    Bir chipta bo'yicha yozuvlar idem_key orqali birlashadi. Yangi qator qo'shishdan oldin ID ustuni
+    qayta o'qiladi, shuning uchun ack dan oldin uzilgan partiya takrorlansa qator ikki marta qo'shilmaydi.
+    Partiyalar ketma-ket yetkaziladi (bir vaqtda faqat bitta flush).
+    """
+
+    def __init__(self, poll_interval=1.0, batch_size=200, base_delay=5, max_delay=900, max_attempts=5):
+        self.poll_interval = poll_interval
+        self.batch_size = batch_size
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.max_attempts = max_attempts
+        self.dead = 0
+        self.delivered = 0
+        self.failed = 0
+        self.last_flush_at = None
+        self.last_flush_ms = 0
+        self._index_loaded = None  # qaysi jadval uchun sheets_rows yuklangan
+        self._lock = asyncio.Lock()
+
+    def _apply(self, spreadsheet_id, items):
+        if not sheets_client or not spreadsheet_id or not sheets_client.reconnect():
+            # Yozuvlar outboxda qoladi va keyinroq (backoff bilan) qayta uriniladi
+            raise RuntimeError("Google Sheets ulanmagan")
+        clear = any(kind == 'clear' for _, kind, _, _, _ in items)
+        users = [payload for _, kind, payload, _, _ in items if kind == 'user']
+        attendance = [
+            (payload['qr_id'], payload['scanner'], str(payload['attended_at']))
+            for _, kind, payload, _, _ in items if kind == 'attendance'
+        ]
+        return sheets_client.sync_batch(spreadsheet_id, clear=clear, users=users, attendance=attendance)
+
+    async def flush(self):
+        """Bitta partiyani yetkazish: yetkazilganlar soni, xatolikda -1
+
+        Chaqiruvchi bekor qilinsa ham boshlangan partiya oxirigacha (ack gacha) yetkaziladi -
+        executor dagi yozish to'xtamaydi, keyingi flush esa uni kutadi
+        """
+        return await asyncio.shield(asyncio.ensure_future(self._locked_flush()))
+
+    async def _locked_flush(self):
+        async with self._lock:
+            return await self._flush_once()
+
+    async def _flush_once(self):
+        db = get_async_db()
+        items = await db.get_sheets_outbox_batch(self.batch_size)
+        if not items:
+            return 0
+        started_at = time.perf_counter()
+        spreadsheet_id = SPREADSHEET_ID
+        try:
+            if sheets_client and spreadsheet_id and self._index_loaded != spreadsheet_id:
+                sheets_client.load_row_index(spreadsheet_id, await db.get_sheets_rows(spreadsheet_id))
+                self._index_loaded = spreadsheet_id
+            await self._deliver(db, spreadsheet_id, items)
+        except Exception as e:
+            print(f"❌ Sheets partiyasini yozishda xatolik ({len(items)} ta yozuv): {e}")
+            self.failed += 1
+            if _is_transient(e):
+                # Google tomonidagi muammo - butun partiya keyinroq (urinishlar cheklanmaydi)
+                await db.retry_sheets_outbox(items, e, self.base_delay, self.max_delay)
+                return -1
+            delivered = await self._isolate(db, spreadsheet_id, items, e)
+        else:
+            await db.ack_sheets_outbox(items)
+            delivered = len(items)
+        if delivered:
+            self.delivered += delivered
+            self.last_flush_at = datetime.now().strftime('%H:%M:%S')
+            self.last_flush_ms = round((time.perf_counter() - started_at) * 1000)
+        return delivered or -1
+
+    async def _deliver(self, db, spreadsheet_id, items):
+        # googleapiclient sinxron - event loopni band qilmasligi uchun threadda
+        rows, replace = await asyncio.get_running_loop().run_in_executor(None, self._apply, spreadsheet_id, items)
+        if rows or replace:
+            await db.save_sheets_rows(spreadsheet_id, rows, replace=replace)
+
+    async def _isolate(self, db, spreadsheet_id, items, error):
+        """Doimiy xatolikda (masalan 400) buzuq yozuvni partiyani ikkiga bo'lib topish
+
+        Tartib saqlanadi: buzuq yozuvdan oldingilar yetkaziladi, u esa max_attempts dan keyin
+        sheets_outbox_dead ga o'tadi va keyingi yozuvlarni to'sib turmaydi. Yetkazilganlar sonini qaytaradi
+        """
+        delivered = 0
+        # items - xatolik berishi ma'lum bo'lgan qism
+        while len(items) > 1:
+            head = items[:len(items) // 2]
+            try:
+                await self._deliver(db, spreadsheet_id, head)
+            except Exception as e:
+                if _is_transient(e):
+                    await db.retry_sheets_outbox(items, e, self.base_delay, self.max_delay)
+                    return delivered
+                items, error = head, e
+                continue
+            await db.ack_sheets_outbox(head)
+            delivered += len(head)
+            items = items[len(head):]
+
+        dead = await db.retry_sheets_outbox(items, error, self.base_delay, self.max_delay, self.max_attempts)
+        if dead:
+            self.dead += dead
+            print(f"☠️ Sheets yozuvi dead-letter ga o'tkazildi: {items[0][1]} {items[0][2]} - {error}")
+        return delivered
+
+    async def run(self):
+        while True:
+            try:
+                delivered = await self.flush()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"❌ Sheets outbox xatolik: {e}")
+                delivered = 0
+            # To'liq partiya bo'lsa navbat hali bo'shamagan - darhol davom etamiz
+            if delivered < self.batch_size:
+                await asyncio.sleep(self.poll_interval)
 
-def save_user_with_qr_to_sheets(user_info, event_info):
-    """User ni Google Sheets ga saqlash"""
-    global sheets_client, SPREADSHEET_ID
-    try:
-        if not sheets_client or not SPREADSHEET_ID:
-            print("✅ Offline rejim - user saqlanmadi")
-            return True, user_info.get('qr_id')
-        success = sheets_client.add_user(SPREADSHEET_ID, user_info, event_info)
-        qr_id = user_info.get('qr_id') if success else None
-        return success, qr_id
-    except Exception as e:
-        print(f"❌ Saqlashda xatolik: {e}")
-        return True, user_info.get('qr_id')
 
-def scan_qr_and_mark_attendance(qr_data, scanner_name='Admin'):
-    """QR skanerlash va kelganlik belgilash"""
-    global sheets_client, SPREADSHEET_ID
-    try:
-        if not sheets_client or not SPREADSHEET_ID:
-            print("✅ Offline rejim - kelganlik belgilanmadi")
-            return True, "Offline rejim"
-        success, user_info = sheets_client.update_attendance(SPREADSHEET_ID, qr_data, scanner_name)
-        return success, user_info
-    except Exception as e:
-        print(f"❌ Skanerlashda xatolik: {e}")
-        return True, "Offline rejim"
+sheets_drainer = SheetsOutboxDrainer(
+    poll_interval=config.SHEETS_FLUSH_INTERVAL,
+    batch_size=config.SHEETS_OUTBOX_BATCH,
+    base_delay=config.SHEETS_RETRY_BASE_DELAY,
+    max_delay=config.SHEETS_RETRY_MAX_DELAY,
+    max_attempts=config.SHEETS_MAX_ATTEMPTS
+)
+
+
+async def queue_clear_sheets():
+    """Jadvalni tozalashni outbox ga qo'yish (darhol qaytadi)"""
+    return await get_async_db().enqueue_sheets_clear()
+
+
+async def get_sheets_queue_stats():
+    stats = await get_async_db().get_sheets_outbox_stats()
+    stats.update(
+        delivered=sheets_drainer.delivered,
+        failed=sheets_drainer.failed,
+        last_flush_at=sheets_drainer.last_flush_at,
+        last_flush_ms=sheets_drainer.last_flush_ms,
+        api=sheets_client.get_api_stats() if sheets_client else None
+    )
+    return stats
+
+
+async def run_sheets_worker():
+    await sheets_drainer.run()
+
+
+async def flush_sheets_queue(timeout=None):
+    """To'xtashdan oldin navbatni yetkazish: yuborish vaqti kelgan yozuv qolmaguncha yoki timeout gacha
+
+    Qolganlar outboxda saqlanadi va keyingi ishga tushishda yetkaziladi. Navbat bo'shadimi - qaytaradi
+    """
+    deadline = time.monotonic() + (config.SHEETS_SHUTDOWN_TIMEOUT if timeout is None else timeout)
+    while time.monotonic() < deadline:
+        if await sheets_drainer.flush() <= 0:
+            break
+    pending = (await get_async_db().get_sheets_outbox_stats())['pending']
+    if pending:
+        print(f"⚠️ Google Sheets navbatida {pending} ta yozuv qoldi - keyingi ishga tushishda yetkaziladi")
+    return not pending
 
 
 def get_sheets_url():
@@ -440,20 +753,3 @@ def get_sheets_stats():
     except Exception as e:
         print(f"❌ Statistika xatolik: {e}")
         return {'total': 0, 'attended': 0, 'not_attended': 0}
-
-
-def save_user_to_sheets(user_info, event_info):
-    """Eski funksiya"""
-    return save_user_with_qr_to_sheets(user_info, event_info)
-
-
-def update_payment_in_sheets(telegram_id, payment_status='✅'):
-    """To'lov holati yangilash"""
-    print(f"✅ To'lov yangilandi: {telegram_id}")
-    return True
-
-
-def update_user_status_in_sheets(telegram_id, new_status):
-    """User holati yangilash"""
-    print(f"✅ Holat yangilandi: {telegram_id}")
-    return True
\ No newline at end of file
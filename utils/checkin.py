@@ -0,0 +1,112 @@
+import csv
+import io
+import json
+from datetime import datetime
+
+from utils.db_api.ticket_ids import is_signed_ticket, is_valid_ticket_id, verify_ticket
+
+# Offline skanerlardan keladigan partiya: har bir qatorda "qr_id,scanned_at,scanner"
+# (qr_id o'rnida imzolangan chipta matni ham bo'lishi mumkin) yoki JSON ro'yxat:
+# [{"qr_id": "...", "scanned_at": "...", "scanner": "..."}, ...]
+TIME_FORMAT = '%Y-%m-%d %H:%M:%S'
+_TIME_FORMATS = ('%d.%m.%Y %H:%M:%S', '%d.%m.%Y %H:%M')  # ISO 8601 dan tashqari
+# Bundan katta son soniya emas, millisekund deb olinadi (5138-yil)
+_MAX_EPOCH_SECONDS = 10 ** 11
+
+
+def _parse_time(value):
+    """Skan vaqtini users.attended_at formatiga (mahalliy vaqt) keltirish
+
+    Bo'sh bo'lsa - hozirgi vaqt, o'qib bo'lmasa - None. Unix vaqt soniya yoki millisekundda bo'lishi mumkin,
+    ISO vaqtdagi Z / +hh:mm mahalliy vaqtga o'tkaziladi - partiyadagi skanlar bitta soat bo'yicha solishtiriladi
+    """
+    value = str(value or '').strip()
+    if not value:
+        return datetime.now().strftime(TIME_FORMAT)
+    if value.isdigit():
+        seconds = int(value)
+        if seconds > _MAX_EPOCH_SECONDS:
+            seconds /= 1000  # 13 xonali - millisekundlar
+        try:
+            return datetime.fromtimestamp(seconds).strftime(TIME_FORMAT)
+        except (OverflowError, OSError, ValueError):
+            return None
+    try:
+        parsed = datetime.fromisoformat(value[:-1] + '+00:00' if value[-1] in 'Zz' else value)
+    except ValueError:
+        parsed = None
+    if parsed is None:
+        for time_format in _TIME_FORMATS:
+            try:
+                parsed = datetime.strptime(value, time_format)
+                break
+            except ValueError:
+                continue
+        else:
+            return None
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone().replace(tzinfo=None)
+    return parsed.strftime(TIME_FORMAT)
+
+
+def _rows(text):
+    text = text.strip()
+    if text.startswith('['):
+        for item in json.loads(text):
+            yield [item.get('qr_id') or item.get('qr', ''), item.get('scanned_at', ''), item.get('scanner', '')]
+        return
+    try:
+        # Ajratuvchi (vergul, nuqtali vergul yoki tab) boshidagi qatorlardan aniqlanadi -
+        # qo'shtirnoq ichidagi belgilar o'zgarmaydi
+        dialect = csv.Sniffer().sniff(text[:4096], delimiters=',;\t')
+    except csv.Error:
+        dialect = 'excel'  # Bitta ustun (faqat qr_id)
+    for row in csv.reader(io.StringIO(text), dialect=dialect):
+        yield row
+
+
+_SIGNED_ERRORS = {'format': 'invalid_format', 'signature': 'invalid_signature', 'event': 'wrong_event'}
+
+
+def resolve_scan(raw, active_event_ids=None):
+    """Skanerlangan matnni bazasiz tekshirish (jonli skaner va partiya uchun bitta qoida)
+
+    Qaytaradi: (qr_id, event_id, xatolik) - xatolik: None, invalid_format, invalid_signature,
+    wrong_event (imzolangan chipta faol bo'lmagan marosim uchun), invalid_id
+    """
+    if is_signed_ticket(raw):
+        valid, qr_id, event_id, reason = verify_ticket(raw, active_event_ids)
+        return qr_id or raw, event_id, None if valid else _SIGNED_ERRORS[reason]
+    qr_id = raw.split(':')[0]
+    return qr_id, None, None if is_valid_ticket_id(qr_id) else 'invalid_id'
+
+
+def parse_checkin_batch(text, default_scanner='Admin', active_event_ids=None):
+    """Partiyani o'qish
+
+    Qaytaradi: [{'line', 'raw', 'qr_id', 'event_id', 'scanned_at', 'scanner', 'error'}, ...]
+    error bo'lmagan yozuvlar bulk_check_in ga beriladi. active_event_ids berilsa boshqa (faol bo'lmagan)
+    marosim chiptalari wrong_event bo'ladi - jonli skanerdagi kabi
+    """
+    records = []
+    for line, row in enumerate(_rows(text), start=1):
+        row = [str(cell).strip() for cell in row]
+        if not row or not row[0] or row[0].lower() in ('qr_id', 'qr'):
+            continue  # Bo'sh qator yoki sarlavha
+
+        raw = row[0]
+        qr_id, event_id, error = resolve_scan(raw, active_event_ids)
+        record = {
+            'line': line,
+            'raw': raw,
+            'qr_id': qr_id,
+            'event_id': event_id,
+            'scanned_at': _parse_time(row[1] if len(row) > 1 else ''),
+            'scanner': (row[2] if len(row) > 2 else '') or default_scanner,
+            'error': error
+        }
+
+        if not record['error'] and record['scanned_at'] is None:
+            record['error'] = 'invalid_time'
+        records.append(record)
+    return records
@@ -0,0 +1,130 @@
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+from data import config
+from utils.db_api.database import get_db
+
+# Event loopdan chaqirilsa ham bloklamaydigan (sof Python) metodlar
+SYNC_METHODS = {
+    'get_connection', 'get_read_connection', 'close',
+    'parse_qr_data', 'parse_channel_link',
+}
+
+# User keshida bo'lsa executor ga o'tkazmasdan darhol qaytariladigan metodlar (1-argument telegram_id)
+USER_CACHED_METHODS = {
+    'select_user', 'get_user', 'select_user_fields', 'get_user_language', 'get_user_registration_status',
+}
+
+
+class AsyncDatabase:
+    """Database metodlarini alohida thread poolda bajaradigan async qobiq"""
+
+    def __init__(self, db, max_workers=None, max_queue=256):
+        self.db = db
+        self.max_workers = max_workers or (config.SQLITE_READ_POOL_SIZE + 1)
+        self.max_queue = max_queue
+        self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='db')
+        self._slots = None
+        self._waiting = 0
+        self._running = 0
+        self._stats = {}
+        self._stats_lock = threading.Lock()
+
+    async def run(self, func, *args, **kwargs):
+        """Sinxron funksiyani executor da bajarish (navbat chegaralangan)"""
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.max_queue)
+        name = getattr(func, '__name__', 'call')
+        enqueued_at = time.perf_counter()
+        self._waiting += 1
+        try:
+            # Navbat to'lsa yangi so'rovlar shu yerda kutadi (backpressure)
+            async with self._slots:
+                loop = asyncio.get_running_loop()
+                return await loop.run_in_executor(
+                    self._executor, self._timed_call, name, enqueued_at, partial(func, *args, **kwargs)
+                )
+        finally:
+            self._waiting -= 1
+
+    def _timed_call(self, name, enqueued_at, call):
+        started_at = time.perf_counter()
+        with self._stats_lock:
+            self._running += 1
+        failed = False
+        try:
+            return call()
+        except Exception:
+            failed = True
+            raise
+        finally:
+            finished_at = time.perf_counter()
+            with self._stats_lock:
+                self._running -= 1
+            self._record(name, started_at - enqueued_at, finished_at - started_at, failed)
+
+    def _record(self, name, wait_time, run_time, failed):
+        with self._stats_lock:
+            stats = self._stats.setdefault(name, {
+                'calls': 0, 'errors': 0, 'total_time': 0.0, 'max_time': 0.0, 'total_wait': 0.0
+            })
+            stats['calls'] += 1
+            stats['errors'] += int(failed)
+            stats['total_time'] += run_time
+            stats['max_time'] = max(stats['max_time'], run_time)
+            stats['total_wait'] += wait_time
+
+    @property
+    def queue_depth(self):
+        """Bajarilishini kutayotgan so'rovlar soni"""
+        return max(0, self._waiting - self._running)
+
+    def get_stats(self):
+        """Navbat holati va har bir metod bo'yicha kechikish (ms)"""
+        with self._stats_lock:
+            queries = {
+                name: {
+                    'calls': s['calls'],
+                    'errors': s['errors'],
+                    'avg_ms': round(s['total_time'] / s['calls'] * 1000, 2),
+                    'max_ms': round(s['max_time'] * 1000, 2),
+                    'avg_wait_ms': round(s['total_wait'] / s['calls'] * 1000, 2),
+                }
+                for name, s in self._stats.items()
+            }
+        return {
+            'queue_depth': self.queue_depth,
+            'running': self._running,
+            'workers': self.max_workers,
+            'queries': queries
+        }
+
+    def shutdown(self):
+        self._executor.shutdown(wait=True)
+
+    def __getattr__(self, name):
+        attr = getattr(self.db, name)
+        if name in SYNC_METHODS or not callable(attr) or asyncio.iscoroutinefunction(attr):
+            return attr
+
+        async def wrapper(*args, **kwargs):
+            if name in USER_CACHED_METHODS and args and self.db.user_cache.contains(int(args[0])):
+                return attr(*args, **kwargs)
+            return await self.run(attr, *args, **kwargs)
+
+        wrapper.__name__ = name
+        return wrapper
+
+
+_shared_async_db = None
+
+
+def get_async_db():
+    """Umumiy Database uchun yagona AsyncDatabase obyektini olish"""
+    global _shared_async_db
+    if _shared_async_db is None:
+        _shared_async_db = AsyncDatabase(get_db(), max_queue=config.DB_EXECUTOR_QUEUE_SIZE)
+    return _shared_async_db
@@ -0,0 +1,149 @@
+import os
+import queue
+import random
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+# SQLITE_BUSY bo'lganda qayta urinishlar: busy_timeout odatda o'zi kutadi, qayta urinish faqat
+# darhol qaytgan BUSY uchun. Umumiy kutish busy_timeout dan oshmaydi
+BUSY_RETRIES = 5
+BUSY_BASE_DELAY = 0.05
+
+
+def _is_busy_error(error):
+    message = str(error).lower()
+    return 'database is locked' in message or 'database is busy' in message
+
+
+def _retry_on_busy(budget, func, *args):
+    """SQLITE_BUSY/locked xatoliklarida exponential backoff bilan qayta urinish
+
+    budget - umumiy kutish chegarasi (soniya, busy_timeout): SQLite ichida kutilgan vaqt ham hisoblanadi
+    """
+    deadline = time.monotonic() + budget
+    delay = BUSY_BASE_DELAY
+    for attempt in range(1, BUSY_RETRIES + 1):
+        try:
+            return func(*args)
+        except sqlite3.OperationalError as e:
+            sleep = delay + random.uniform(0, delay)
+            if not _is_busy_error(e) or attempt == BUSY_RETRIES or time.monotonic() + sleep > deadline:
+                raise
+            print(f"⚠️ SQLite band, qayta urinish {attempt}/{BUSY_RETRIES}: {e}")
+            time.sleep(sleep)
+            delay *= 2
+
+
+class RetryingCursor(sqlite3.Cursor):
+    """Band bo'lgan bazada so'rovni qayta bajaradigan cursor"""
+
+    def execute(self, sql, parameters=()):
+        return _retry_on_busy(self.connection.busy_budget, super().execute, sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return _retry_on_busy(self.connection.busy_budget, super().executemany, sql, seq_of_parameters)
+
+
+class RetryingConnection(sqlite3.Connection):
+    """cursor(), execute() va commit() SQLITE_BUSY da qayta urinadi"""
+
+    busy_budget = 5.0  # SQLitePool busy_timeout bo'yicha o'rnatadi
+
+    def cursor(self, factory=RetryingCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        return _retry_on_busy(self.busy_budget, super().execute, sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return _retry_on_busy(self.busy_budget, super().executemany, sql, seq_of_parameters)
+
+    def commit(self):
+        return _retry_on_busy(self.busy_budget, super().commit)
+
+
+class SQLitePool:
+    """Uzoq yashaydigan ulanishlar: bitta yozuvchi va bir nechta o'quvchi (WAL rejimi)"""
+
+    def __init__(self, db_path, read_pool_size=4, synchronous='NORMAL', busy_timeout_ms=5000,
+                 cache_size_kb=16384, mmap_size=0):
+        if str(synchronous).upper() not in ('OFF', 'NORMAL', 'FULL', 'EXTRA'):
+            raise ValueError(f"Noto'g'ri synchronous qiymati: {synchronous}")
+        self.db_path = db_path
+        self.synchronous = str(synchronous).upper()
+        self.busy_timeout_ms = busy_timeout_ms
+        self.cache_size_kb = cache_size_kb
+        self.mmap_size = mmap_size
+
+        directory = os.path.dirname(db_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        self._writer = self._connect()
+        self._writer.execute('PRAGMA journal_mode = WAL')
+        self._writer_lock = threading.RLock()
+        self._writer_depth = 0
+
+        self._readers = queue.Queue()
+        self._all_readers = []
+        for _ in range(max(1, read_pool_size)):
+            conn = self._connect()
+            conn.execute('PRAGMA query_only = 1')
+            self._readers.put(conn)
+            self._all_readers.append(conn)
+        self._closed = False
+
+    def _connect(self):
+        conn = sqlite3.connect(
+            self.db_path,
+            timeout=self.busy_timeout_ms / 1000,
+            check_same_thread=False,
+            factory=RetryingConnection
+        )
+        conn.busy_budget = self.busy_timeout_ms / 1000
+        conn.execute(f'PRAGMA busy_timeout = {int(self.busy_timeout_ms)}')
+        conn.execute(f'PRAGMA synchronous = {self.synchronous}')
+        conn.execute(f'PRAGMA cache_size = -{int(self.cache_size_kb)}')
+        conn.execute(f'PRAGMA mmap_size = {int(self.mmap_size)}')
+        conn.execute('PRAGMA temp_store = MEMORY')
+        return conn
+
+    @contextmanager
+    def writer(self):
+        """Yozuvchi ulanish (jarayon ichida bittadan navbat bilan)"""
+        with self._writer_lock:
+            self._writer_depth += 1
+            try:
+                yield self._writer
+            finally:
+                self._writer_depth -= 1
+                # Commit qilinmagan tranzaksiya keyingi chaqiruvga o'tib ketmasin
+                if self._writer_depth == 0 and self._writer.in_transaction:
+                    self._writer.rollback()
+
+    @contextmanager
+    def reader(self):
+        """Pooldan o'quvchi ulanish olish"""
+        conn = self._readers.get()
+        try:
+            yield conn
+        finally:
+            if conn.in_transaction:
+                conn.rollback()
+            self._readers.put(conn)
+
+    def close(self):
+        """Barcha ulanishlarni yopish"""
+        if self._closed:
+            return
+        self._closed = True
+        with self._writer_lock:
+            try:
+                self._writer.execute('PRAGMA optimize')
+            except sqlite3.Error:
+                pass
+            self._writer.close()
+        for conn in self._all_readers:
+            conn.close()
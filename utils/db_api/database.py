@@ -1,40 +1,352 @@
 import sqlite3
 import json
 import os
-import urllib
-import uuid
-import qrcode
 import io
 import base64
 import re
+import threading
+import time as time_module
 from datetime import datetime
 from contextlib import contextmanager
 
-import requests
-
-from data.config import SHEETS_MODE
-from sheets_integration import sheets_client, SPREADSHEET_ID
+from data import config
+from data.config import DATABASE_PATH
+from utils.db_api.connection_pool import SQLitePool
+from utils.db_api.user_cache import UserCache
+from utils.db_api.ticket_ids import format_ticket_id, is_signed_ticket, sign_ticket, verify_ticket
+from utils.db_api.records import (
+    USER_COLUMNS, USER_SELECT, UserRecord, PendingUserRecord, user_projection, registration_status
+)
+from utils.qr_renderer import render_qr, render_qr_many
+
+# Statistika ustunlari: nomi -> users qatori uchun shart
+# (umumiy "paid"/"pending" marosim bo'yicha "paid"/"pending" dan kengroq)
+STATS_CONDITIONS = {
+    'paid': "{row}.payment_status = 'paid'",
+    'paid_any': "{row}.payment_status IN ('paid', 'pending_approval', 'approved')",
+    'approved': "{row}.approved = 1",
+    'attended': "{row}.attended = 1",
+    'pending': "{row}.payment_status = 'paid' AND {row}.approved = 0",
+    'pending_any': "{row}.payment_status IN ('paid', 'pending_approval') AND {row}.approved = 0",
+}
+
+
+def _stats_sum_columns(row='users'):
+    """GROUP BY uchun SUM(CASE ...) ustunlari"""
+    return ', '.join(
+        f"SUM(CASE WHEN {cond.format(row=row)} THEN 1 ELSE 0 END) AS {name}"
+        for name, cond in STATS_CONDITIONS.items()
+    )
+
+
+def _stats_counter_delta(row, sign):
+    """event_counters ni bitta users qatori uchun o'zgartiradigan SQL"""
+    updates = ', '.join(
+        f"{name} = {name} {sign} (CASE WHEN {cond.format(row=row)} THEN 1 ELSE 0 END)"
+        for name, cond in STATS_CONDITIONS.items()
+    )
+    return (
+        f"INSERT OR IGNORE INTO event_counters (event_id) VALUES (COALESCE({row}.event_id, 0)); "
+        f"UPDATE event_counters SET total = total {sign} 1, {updates} "
+        f"WHERE event_id = COALESCE({row}.event_id, 0);"
+    )
+
+
+def _stats_counter_migration():
+    """event_counters jadvali, uni yangilab turuvchi triggerlar va boshlang'ich qiymatlar"""
+    counter_columns = ', '.join(f"{name} INTEGER NOT NULL DEFAULT 0" for name in STATS_CONDITIONS)
+    names = ', '.join(STATS_CONDITIONS)
+    return [
+        f"CREATE TABLE IF NOT EXISTS event_counters ("
+        f"event_id INTEGER PRIMARY KEY, total INTEGER NOT NULL DEFAULT 0, {counter_columns})",
+        f"CREATE TRIGGER IF NOT EXISTS trg_users_counters_insert AFTER INSERT ON users "
+        f"BEGIN {_stats_counter_delta('NEW', '+')} END",
+        f"CREATE TRIGGER IF NOT EXISTS trg_users_counters_delete AFTER DELETE ON users "
+        f"BEGIN {_stats_counter_delta('OLD', '-')} END",
+        f"CREATE TRIGGER IF NOT EXISTS trg_users_counters_update "
+        f"AFTER UPDATE OF event_id, payment_status, approved, attended ON users "
+        f"BEGIN {_stats_counter_delta('OLD', '-')} {_stats_counter_delta('NEW', '+')} END",
+        "DELETE FROM event_counters",
+        f"INSERT INTO event_counters (event_id, total, {names}) "
+        f"SELECT COALESCE(event_id, 0), COUNT(*), {_stats_sum_columns()} "
+        f"FROM users GROUP BY COALESCE(event_id, 0)",
+    ]
+
+
+def _move_qr_codes_to_assets(cursor):
+    """users.qr_code dagi base64 rasmlarni ticket_assets ga xom bayt sifatida ko'chirish"""
+    cursor.execute("SELECT telegram_id, qr_id, qr_code FROM users WHERE qr_code IS NOT NULL AND qr_code != '' AND qr_id IS NOT NULL")
+    moved = 0
+    for telegram_id, qr_id, qr_code in cursor.fetchall():
+        try:
+            png = base64.b64decode(qr_code)
+        except ValueError:
+            print(f"⚠️ QR rasmi o'qilmadi, o'tkazib yuborildi: {telegram_id}")
+            continue
+        cursor.execute("INSERT OR REPLACE INTO ticket_assets (telegram_id, qr_id, png) VALUES (?, ?, ?)",
+                       (telegram_id, qr_id, png))
+        moved += 1
+    cursor.execute("UPDATE users SET qr_code = NULL WHERE qr_code IS NOT NULL")
+    print(f"✅ {moved} ta QR rasmi ticket_assets jadvaliga ko'chirildi")
+
+
+# Tez-tez bajariladigan so'rovlar matni: Database metodlari va query_plans.HOT_QUERIES
+# shu yerdan oladi, shuning uchun EXPLAIN tekshiruvi bot bajaradigan so'rovning o'zini ko'radi
+SELECT_USER_SQL = f'SELECT {USER_SELECT} FROM users WHERE telegram_id = ?'
+
+SELECT_ALL_USERS_SQL = f'SELECT {USER_SELECT} FROM users ORDER BY registered_at DESC'
+
+# Qisman indeks (faqat kutilayotganlar, registered_at tartibida) - planner idx_users_approved +
+# vaqtinchalik saralashni tanlamasligi uchun aniq ko'rsatilgan
+PENDING_USERS_SQL = f'''
+    SELECT {', '.join(f'u.{column}' for column in USER_COLUMNS)}, e.name_uz as event_name
+    FROM users u INDEXED BY idx_users_pending
+    LEFT JOIN events e ON u.event_id = e.id
+    WHERE u.payment_status IN ('paid', 'pending_approval') AND u.approved = 0
+    ORDER BY u.registered_at ASC
+'''
+
+CHECK_IN_SQL = '''
+    UPDATE users SET attended = 1, attended_at = ?, attended_by = ?
+    WHERE qr_id = ? AND COALESCE(attended, 0) = 0 AND (? IS NULL OR event_id = ?)
+    RETURNING telegram_id, full_name, phone_number, payment_status, event_id, attended_at, attended_by
+'''
+
+CHECK_IN_LOOKUP_SQL = '''
+    SELECT telegram_id, full_name, phone_number, payment_status, event_id, attended_at, attended_by
+    FROM users WHERE qr_id = ?
+'''
+
+
+def event_catalog_sql(langs):
+    """Marosimlar keshi uchun barcha tadbirlar (jadval kichik - to'liq o'qiladi)"""
+    return f'''
+        SELECT id, {', '.join(f'name_{lang}, address_{lang}' for lang in langs)},
+               date, time, payment_amount, is_active, created_at
+        FROM events
+        ORDER BY date ASC, time ASC
+    '''
+
+
+def event_stats_source(use_counters):
+    """Marosimlar bo'yicha sanoqlar manbasi (event_id, total, paid, approved, attended, pending, ...)"""
+    names = ', '.join(STATS_CONDITIONS)
+    if use_counters:
+        # Triggerlar yangilab turadigan tayyor sanoqlar
+        return f"SELECT event_id, total, {names} FROM event_counters"
+    return (
+        f"SELECT event_id, COUNT(*) AS total, {_stats_sum_columns()} "
+        f"FROM users GROUP BY event_id"
+    )
+
+
+def event_stats_sql(name_field, address_field, use_counters):
+    """Bitta marosim va uning sanoqlari (parametrlar: event_id, event_id)"""
+    names = ', '.join(STATS_CONDITIONS)
+    if use_counters:
+        stats_query = f"SELECT total, {names} FROM event_counters WHERE event_id = ?"
+    else:
+        stats_query = f"SELECT COUNT(*) AS total, {_stats_sum_columns()} FROM users WHERE event_id = ?"
+    return f'''
+        SELECT e.id, e.{name_field}, e.date, e.time, e.{address_field}, e.payment_amount,
+               e.is_active, e.created_at, s.total, s.paid, s.approved, s.attended, s.pending
+        FROM events e
+        LEFT JOIN ({stats_query}) s
+        WHERE e.id = ?
+    '''
+
+
+def events_with_stats_sql(name_field, address_field, use_counters, where=''):
+    return f'''
+        SELECT e.id, e.{name_field}, e.date, e.time, e.{address_field}, e.payment_amount,
+               e.is_active, e.created_at, s.total, s.paid, s.approved, s.attended, s.pending
+        FROM events e
+        LEFT JOIN ({event_stats_source(use_counters)}) s ON s.event_id = e.id
+        {where}
+        ORDER BY e.id DESC
+    '''
+
+
+def all_user_stats_sql(use_counters):
+    return f'''
+        SELECT SUM(total), SUM(paid_any), SUM(approved), SUM(attended), SUM(pending_any)
+        FROM ({event_stats_source(use_counters)})
+    '''
+
+
+# Versiyalangan migratsiyalar: (versiya, tavsif, SQL buyruqlar yoki cursor qabul qiluvchi funksiyalar)
+# Yangi migratsiya faqat ro'yxat oxiriga, keyingi versiya raqami bilan qo'shiladi
+SCHEMA_MIGRATIONS = [
+    (1, "users va events uchun indekslar", [
+        # get_events_with_stats: event_id bo'yicha sanoqlar indeksdan o'qiladi
+        "CREATE INDEX IF NOT EXISTS idx_users_event_stats "
+        "ON users(event_id, payment_status, approved, attended)",
+        # get_pending_users: faqat kutilayotgan to'lovlar, registered_at tartibida
+        "CREATE INDEX IF NOT EXISTS idx_users_pending ON users(registered_at) "
+        "WHERE payment_status IN ('paid', 'pending_approval') AND approved = 0",
+        # select_all_users: ORDER BY registered_at uchun
+        "CREATE INDEX IF NOT EXISTS idx_users_registered_at ON users(registered_at)",
+        # get_all_user_stats sanoqlari
+        "CREATE INDEX IF NOT EXISTS idx_users_approved ON users(approved, payment_status)",
+        "CREATE INDEX IF NOT EXISTS idx_users_attended ON users(attended)",
+        # get_all_active_events
+        "CREATE INDEX IF NOT EXISTS idx_events_active ON events(is_active, date, time)",
+    ]),
+    (2, "event_counters statistika jadvali", _stats_counter_migration()),
+    (3, "channel_members obuna jadvali", [
+        # chat_member updatelari va get_chat_member natijalari (kanal, user) bo'yicha
+        '''CREATE TABLE IF NOT EXISTS channel_members (
+            channel_id TEXT NOT NULL,
+            user_id INTEGER NOT NULL,
+            status TEXT NOT NULL,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (channel_id, user_id)
+        )''',
+        "CREATE INDEX IF NOT EXISTS idx_channel_members_updated ON channel_members(updated_at)",
+    ]),
+    (4, "users.qr_file_id (Telegram file_id keshi)", [
+        "ALTER TABLE users ADD COLUMN qr_file_id TEXT",
+    ]),
+    (5, "QR rasmlari ticket_assets jadvaliga", [
+        # Rasm faqat kerak bo'lganda o'qiladi, users qatorlari yengil qoladi
+        '''CREATE TABLE IF NOT EXISTS ticket_assets (
+            telegram_id INTEGER PRIMARY KEY,
+            qr_id TEXT NOT NULL,
+            png BLOB NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )''',
+        _move_qr_codes_to_assets,
+    ]),
+    (6, "chipta raqamlari ketma-ketligi", [
+        # Raqamlar bloklab ajratiladi: bazani tekshirmasdan takrorlanmas chipta raqami
+        '''CREATE TABLE IF NOT EXISTS id_sequences (
+            name TEXT PRIMARY KEY,
+            next_value INTEGER NOT NULL
+        )''',
+        "INSERT OR IGNORE INTO id_sequences (name, next_value) VALUES ('ticket', 1)",
+    ]),
+    (7, "Google Sheets outbox jadvali", [
+        # users o'zgarishi bilan bitta tranzaksiyada yoziladi, fon vazifasi Sheets ga yetkazadi
+        '''CREATE TABLE IF NOT EXISTS sheets_outbox (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            idem_key TEXT NOT NULL UNIQUE,
+            kind TEXT NOT NULL,
+            payload TEXT NOT NULL,
+            revision INTEGER NOT NULL DEFAULT 1,
+            attempts INTEGER NOT NULL DEFAULT 0,
+            next_attempt_at REAL NOT NULL DEFAULT 0,
+            last_error TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )''',
+        "CREATE INDEX IF NOT EXISTS idx_sheets_outbox_due ON sheets_outbox(next_attempt_at, id)",
+    ]),
+    (8, "Google Sheets qator indeksi", [
+        # qr_id -> jadvaldagi qator raqami: har bir yozishda ID ustunini o'qimaslik uchun
+        '''CREATE TABLE IF NOT EXISTS sheets_rows (
+            spreadsheet_id TEXT NOT NULL,
+            qr_id TEXT NOT NULL,
+            row_number INTEGER NOT NULL,
+            PRIMARY KEY (spreadsheet_id, qr_id)
+        )''',
+    ]),
+    (9, "Google Sheets dead-letter jadvali", [
+        # Doimiy xatolik bilan SHEETS_MAX_ATTEMPTS marta yetkazilmagan yozuvlar - navbatni to'sib qo'ymasligi uchun
+        '''CREATE TABLE IF NOT EXISTS sheets_outbox_dead (
+            id INTEGER PRIMARY KEY,
+            idem_key TEXT NOT NULL,
+            kind TEXT NOT NULL,
+            payload TEXT NOT NULL,
+            attempts INTEGER NOT NULL,
+            last_error TEXT,
+            created_at TIMESTAMP,
+            failed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )''',
+    ]),
+    (10, "channel_members.checked_at (qayta tekshiruv navbati)", [
+        # updated_at - holat ma'lum bo'lgan vaqt, checked_at - oxirgi urinish (xatolik bo'lsa ham).
+        # Reconciler checked_at bo'yicha yuradi: tekshirib bo'lmagan yozuvlar navbat boshida qotib qolmaydi
+        "ALTER TABLE channel_members ADD COLUMN checked_at TIMESTAMP",
+        "UPDATE channel_members SET checked_at = updated_at",
+        "CREATE INDEX IF NOT EXISTS idx_channel_members_checked ON channel_members(checked_at)",
+    ]),
+]
 
 
 class Database:
+    # Sxema tayyorlangan bazalar (jarayon davomida har bir fayl uchun bir marta)
+    _bootstrapped_paths = set()
+    _bootstrap_lock = threading.Lock()
+
     def __init__(self, db_path="db/bot_database.db"):
         self.db_path = db_path
-        self.init_database()
-        self.migrate_database()
+        self.pool = SQLitePool(
+            db_path,
+            read_pool_size=config.SQLITE_READ_POOL_SIZE,
+            synchronous=config.SQLITE_SYNCHRONOUS,
+            busy_timeout_ms=config.SQLITE_BUSY_TIMEOUT_MS,
+            cache_size_kb=config.SQLITE_CACHE_SIZE_KB,
+            mmap_size=config.SQLITE_MMAP_SIZE
+        )
+        try:
+            self._bootstrap_schema()
+        except Exception:
+            self.pool.close()
+            raise
+
+        # Marosimlar katalogi: (event_id, lang) -> qator, lang -> faol marosimlar
+        self._event_columns = None
+        self._event_catalog = None
+        self._event_catalog_loaded_at = 0
+        self._event_catalog_version = 0
+        self._event_catalog_lock = threading.Lock()
+
+        # Faol kanallar ro'yxati keshi (har bir updateda o'qiladi)
+        self._channels_cache = None
+        self._channels_loaded_at = 0
+        self._channels_version = 0
+        self._channels_lock = threading.Lock()
+
+        # Tez-tez menyu bosadigan userlar profillari (har bir yozuvda yangilanadi)
+        self.user_cache = UserCache(max_entries=config.USER_CACHE_SIZE, ttl=config.USER_CACHE_TTL)
+
+        # Chipta raqamlari uchun ajratilgan blok: [_ticket_next, _ticket_end)
+        self._ticket_next = 0
+        self._ticket_end = 0
+        self._ticket_lock = threading.Lock()
+
+    def _bootstrap_schema(self):
+        """Jadvallar va migratsiyalarni jarayon uchun faqat bir marta bajarish
+
+        Xatolik chaqiruvchiga o'tadi va fayl belgilanmaydi - keyingi urinishda migratsiya qaytadan bajariladi
+        """
+        key = os.path.abspath(self.db_path)
+        if key in Database._bootstrapped_paths:
+            return
+        with Database._bootstrap_lock:
+            if key in Database._bootstrapped_paths:
+                return
+            self.init_database()
+            self.migrate_database()
+            Database._bootstrapped_paths.add(key)
 
     @contextmanager
     def get_connection(self):
-        """Context manager bilan database connection"""
-        conn = sqlite3.connect(self.db_path)
-        try:
+        """Yozish uchun ulanish (pooldagi yagona yozuvchi)"""
+        with self.pool.writer() as conn:
             yield conn
-        finally:
-            conn.close()
+
+    @contextmanager
+    def get_read_connection(self):
+        """Faqat o'qish uchun ulanish (WAL tufayli yozuvchini kutmaydi)"""
+        with self.pool.reader() as conn:
+            yield conn
+
+    def close(self):
+        """Ulanishlarni yopish"""
+        self.pool.close()
 
     def init_database(self):
         """Database va jadvallarni yaratish"""
-        os.makedirs('db', exist_ok=True)
-
         with self.get_connection() as conn:
             cursor = conn.cursor()
             try:
@@ -107,6 +419,7 @@ class Database:
 
             except Exception as e:
                 print(f"❌ Database yaratishda xatolik: {e}")
+                raise
 
     def migrate_database(self):
         """Database strukturasini yangilash"""
@@ -114,6 +427,8 @@ class Database:
             cursor = conn.cursor()
             try:
                 print("🔧 Database strukturasini tekshiryapmiz...")
+                # DDL o'zi tranzaksiya boshlamaydi - qisman qo'shilgan ustunlar qolmasligi uchun aniq BEGIN
+                cursor.execute("BEGIN IMMEDIATE")
 
                 # Channels jadval strukturasini yangilash
                 cursor.execute("PRAGMA table_info(channels)")
@@ -169,12 +484,66 @@ class Database:
                         )
                     ''')
                     print("✅ Admins jadvali yaratildi")
-
                 conn.commit()
+
+                self._apply_schema_migrations(conn)
                 print("✅ Database strukturasi yangilandi!")
 
             except Exception as e:
+                if conn.in_transaction:
+                    conn.rollback()
                 print(f"❌ Database migratsiyasida xatolik: {e}")
+                raise
+
+    def _apply_schema_migrations(self, conn):
+        """SCHEMA_MIGRATIONS dan hali qo'llanmaganlarini bajarish
+
+        Har bir versiya alohida tranzaksiyada: xatolikda butunlay bekor qilinadi, oldingilari saqlanib qoladi
+        """
+        cursor = conn.cursor()
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS schema_migrations (
+                version INTEGER PRIMARY KEY,
+                description TEXT,
+                applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+        cursor.execute("SELECT version FROM schema_migrations")
+        applied = {row[0] for row in cursor.fetchall()}
+
+        pending = [m for m in SCHEMA_MIGRATIONS if m[0] not in applied]
+        for version, description, statements in pending:
+            cursor.execute("BEGIN IMMEDIATE")
+            try:
+                # Boshqa jarayon shu orada qo'llagan bo'lishi mumkin
+                cursor.execute("SELECT 1 FROM schema_migrations WHERE version = ?", (version,))
+                if cursor.fetchone():
+                    conn.rollback()
+                    continue
+                for statement in statements:
+                    if callable(statement):
+                        statement(cursor)
+                    else:
+                        cursor.execute(statement)
+                cursor.execute("INSERT INTO schema_migrations (version, description) VALUES (?, ?)",
+                               (version, description))
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                print(f"❌ Migratsiya {version} bekor qilindi: {description}")
+                raise
+            print(f"✅ Migratsiya {version} qo'llandi: {description}")
+
+        if pending:
+            # Yangi indekslar uchun planner statistikasini yangilash
+            cursor.execute("ANALYZE")
+
+    def check_query_plans(self):
+        """Asosiy so'rovlar indeks ishlatayotganini tekshirish (EXPLAIN QUERY PLAN)"""
+        from utils.db_api.query_plans import check_query_plans
+
+        with self.get_read_connection() as conn:
+            return check_query_plans(conn)
 
     def parse_channel_link(self, link):
         """Improved channel link parsing with better validation"""
@@ -395,6 +764,7 @@ class Database:
                     channel_data['type']
                 ))
                 conn.commit()
+                self.invalidate_channel_cache()
 
                 success_msg = f"✅ Channel added successfully!\n\n"
                 success_msg += f"📝 Name: {channel_info['name']}\n"
@@ -454,6 +824,7 @@ class Database:
                 )
                 if cursor.rowcount > 0:
                     conn.commit()
+                    self.user_cache.update(int(telegram_id), event_id=event_id)
                     print(f"✅ User {telegram_id} event_id yangilandi: {event_id}")
                     return True
                 else:
@@ -463,6 +834,60 @@ class Database:
                 print(f"❌ Event ID yangilashda xatolik: {e}")
                 return False
 
+    def update_user_contact(self, telegram_id, full_name, phone_number):
+        """User ism-familiyasi va telefonini saqlash"""
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            try:
+                cursor.execute(
+                    'UPDATE users SET full_name = ?, phone_number = ? WHERE telegram_id = ?',
+                    (full_name, phone_number, int(telegram_id))
+                )
+                updated = cursor.rowcount > 0
+                if updated:
+                    self._outbox_user(cursor, telegram_id)
+                conn.commit()
+                if updated:
+                    self.user_cache.update(int(telegram_id), full_name=full_name, phone_number=phone_number)
+                return updated
+            except Exception as e:
+                print(f"❌ Kontakt ma'lumotlarini saqlashda xatolik: {e}")
+                return False
+
+    def clear_user_event(self, telegram_id):
+        """User tanlagan tadbirni bekor qilish"""
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            try:
+                cursor.execute('UPDATE users SET event_id = NULL WHERE telegram_id = ?', (int(telegram_id),))
+                conn.commit()
+                self.user_cache.update(int(telegram_id), event_id=None)
+                return cursor.rowcount > 0
+            except Exception as e:
+                print(f"❌ Tadbirni bekor qilishda xatolik: {e}")
+                return False
+
+    def reset_user_for_new_event(self, telegram_id):
+        """Boshqa tadbir uchun to'lov holati va chiptani qaytadan boshlash"""
+        qr_id = self._generate_unique_qr_id()
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            try:
+                cursor.execute('''
+                    UPDATE users SET payment_status = 'pending', approved = 0, qr_code = NULL, qr_file_id = NULL, qr_id = ?
+                    WHERE telegram_id = ?
+                ''', (qr_id, int(telegram_id)))
+                updated = cursor.rowcount > 0
+                cursor.execute('DELETE FROM ticket_assets WHERE telegram_id = ?', (int(telegram_id),))
+                conn.commit()
+                self.user_cache.update(
+                    int(telegram_id), payment_status='pending', approved=0, qr_file_id=None, qr_id=qr_id
+                )
+                return updated
+            except Exception as e:
+                print(f"❌ Yangi tadbir uchun userni tayyorlashda xatolik: {e}")
+                return False
+
     def debug_channel_parsing(self):
         """Debug: Kanal parsing testi"""
         test_links = [
@@ -501,6 +926,7 @@ class Database:
                 cursor.execute('DELETE FROM channels WHERE channel_id = ?', (channel_id,))
                 if cursor.rowcount > 0:
                     conn.commit()
+                    self.invalidate_channel_cache()
                     print(f"✅ Kanal o'chirildi: {channel_id}")
                     return True
                 else:
@@ -510,20 +936,109 @@ class Database:
                 print(f"❌ Kanal o'chirishda xatolik: {e}")
                 return False
 
+    def invalidate_channel_cache(self):
+        """Kanallar o'zgarganda keshni tozalash"""
+        with self._channels_lock:
+            self._channels_version += 1
+            self._channels_cache = None
+
+    def _load_channels(self):
+        with self._channels_lock:
+            version = self._channels_version
+        with self.get_read_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+                SELECT channel_id, channel_name, channel_username, channel_type 
+                FROM channels 
+                WHERE is_active = 1
+                ORDER BY added_at DESC
+            ''')
+            channels = tuple(cursor.fetchall())
+        with self._channels_lock:
+            if version == self._channels_version:
+                self._channels_cache = channels
+                self._channels_loaded_at = time_module.monotonic()
+        return channels
+
     def get_all_channels(self):
-        """Barcha faol kanallarni olish"""
+        """Barcha faol kanallarni olish (keshdan)"""
+        try:
+            channels = self._channels_cache
+            if channels is None or time_module.monotonic() - self._channels_loaded_at > config.CHANNEL_CACHE_TTL:
+                channels = self._load_channels()
+            return list(channels)
+        except Exception as e:
+            print(f"❌ Kanallarni olishda xatolik: {e}")
+            return []
+
+    def save_channel_members(self, members):
+        """Obuna holatlarini saqlash: [(channel_id, user_id, status), ...]"""
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            try:
+                cursor.executemany('''
+                    INSERT INTO channel_members (channel_id, user_id, status, updated_at, checked_at)
+                    VALUES (?, ?, ?, CURRENT_TIMESTAMP, CURRENT_TIMESTAMP)
+                    ON CONFLICT(channel_id, user_id) DO UPDATE SET
+                        status = excluded.status, updated_at = excluded.updated_at, checked_at = excluded.checked_at
+                ''', [(str(channel_id), int(user_id), status) for channel_id, user_id, status in members])
+                conn.commit()
+                return True
+            except Exception as e:
+                print(f"❌ Kanal a'zoligini saqlashda xatolik: {e}")
+                return False
+
+    def get_channel_memberships(self, user_id, channel_ids, max_age_seconds):
+        """User uchun yangi (max_age_seconds dan eski bo'lmagan) obuna holatlari: {channel_id: status}"""
+        if not channel_ids:
+            return {}
+        with self.get_read_connection() as conn:
+            cursor = conn.cursor()
+            try:
+                placeholders = ', '.join('?' for _ in channel_ids)
+                cursor.execute(f'''
+                    SELECT channel_id, status FROM channel_members
+                    WHERE user_id = ? AND channel_id IN ({placeholders})
+                      AND updated_at >= datetime('now', ?)
+                ''', (int(user_id), *[str(c) for c in channel_ids], f'-{int(max_age_seconds)} seconds'))
+                return dict(cursor.fetchall())
+            except Exception as e:
+                print(f"❌ Kanal a'zoligini olishda xatolik: {e}")
+                return {}
+
+    def mark_channel_members_checked(self, members):
+        """Tekshirib bo'lmagan yozuvlar: holat (updated_at) o'zgarmaydi, faqat navbat oxiriga o'tadi
+
+        members -> [(channel_id, user_id), ...]
+        """
         with self.get_connection() as conn:
+            cursor = conn.cursor()
+            try:
+                cursor.executemany(
+                    'UPDATE channel_members SET checked_at = CURRENT_TIMESTAMP WHERE channel_id = ? AND user_id = ?',
+                    [(str(channel_id), int(user_id)) for channel_id, user_id in members]
+                )
+                conn.commit()
+                return True
+            except Exception as e:
+                print(f"❌ Kanal a'zoligi tekshiruvini saqlashda xatolik: {e}")
+                return False
+
+    def get_stale_channel_members(self, older_than_seconds, limit=100):
+        """Qayta tekshirilishi kerak bo'lgan eng uzoq tekshirilmagan yozuvlar: [(channel_id, user_id), ...]"""
+        with self.get_read_connection() as conn:
             cursor = conn.cursor()
             try:
                 cursor.execute('''
-                    SELECT channel_id, channel_name, channel_username, channel_type 
-                    FROM channels 
-                    WHERE is_active = 1
-                    ORDER BY added_at DESC
-                ''')
+                    SELECT cm.channel_id, cm.user_id FROM channel_members cm
+                    JOIN channels c ON c.channel_id = cm.channel_id AND c.is_active = 1
+                    WHERE cm.checked_at < datetime('now', ?)
+                    ORDER BY cm.checked_at ASC
+                    LIMIT ?
+                ''', (f'-{int(older_than_seconds)} seconds', limit))
                 return cursor.fetchall()
             except Exception as e:
-                print(f"❌ Kanallarni olishda xatolik: {e}")
+                print(f"❌ Eskirgan a'zolikni olishda xatolik: {e}")
                 return []
 
     def check_user_subscription(self, bot, user_id, channel_id):
@@ -576,69 +1091,80 @@ class Database:
 
                 event_id = cursor.lastrowid
                 conn.commit()
+                self.invalidate_event_catalog()
                 print(f"✅ Yangi tadbir qo'shildi: {name} (ID: {event_id})")
                 return event_id
             except Exception as e:
                 print(f"❌ Tadbir qo'shishda xatolik: {e}")
                 return None
 
+    def _get_event_columns(self):
+        """events jadvali ustunlari (PRAGMA faqat bir marta)"""
+        if self._event_columns is None:
+            with self.get_read_connection() as conn:
+                cursor = conn.execute("PRAGMA table_info(events)")
+                self._event_columns = {column[1] for column in cursor.fetchall()}
+        return self._event_columns
+
+    def _event_lang(self, lang):
+        """Jadvalda ustuni bo'lmagan tillar uchun 'uz'"""
+        return lang if f'name_{lang}' in self._get_event_columns() else 'uz'
+
+    def invalidate_event_catalog(self):
+        """Marosimlar o'zgarganda keshni tozalash"""
+        with self._event_catalog_lock:
+            self._event_catalog_version += 1
+            self._event_catalog = None
+
+    def _load_event_catalog(self):
+        langs = sorted({column[5:] for column in self._get_event_columns() if column.startswith('name_')})
+        with self._event_catalog_lock:
+            version = self._event_catalog_version
+
+        with self.get_read_connection() as conn:
+            cursor = conn.execute(event_catalog_sql(langs))
+            rows = cursor.fetchall()
+
+        by_id = {}
+        active = {lang: [] for lang in langs}
+        for row in rows:
+            date, time, payment_amount, is_active, created_at = row[-5:]
+            for index, lang in enumerate(langs):
+                name, address = row[1 + index * 2], row[2 + index * 2]
+                event = (row[0], name, date, time, address, payment_amount, is_active, created_at)
+                by_id[(row[0], lang)] = event
+                if is_active == 1:
+                    active[lang].append(event)
+
+        catalog = {'by_id': by_id, 'active': active}
+        with self._event_catalog_lock:
+            # Yuklash paytida invalidate bo'lgan bo'lsa eski ma'lumotni saqlamaymiz
+            if version == self._event_catalog_version:
+                self._event_catalog = catalog
+                self._event_catalog_loaded_at = time_module.monotonic()
+        return catalog
+
+    def _get_event_catalog(self):
+        catalog = self._event_catalog
+        if catalog is None or time_module.monotonic() - self._event_catalog_loaded_at > config.EVENT_CACHE_TTL:
+            catalog = self._load_event_catalog()
+        return catalog
+
     def get_all_active_events(self, lang='uz'):
-        """Barcha faol tadbirlarni tilga qarab olish"""
-        with self.get_connection() as conn:
-            cursor = conn.cursor()
-            try:
-                cursor.execute("PRAGMA table_info(events)")
-                columns = [column[1] for column in cursor.fetchall()]
-
-                if f'name_{lang}' in columns:
-                    name_field = f'name_{lang}'
-                    address_field = f'address_{lang}'
-                    query = f'''
-                        SELECT id, {name_field}, date, time, {address_field}, payment_amount, is_active, created_at
-                        FROM events 
-                        WHERE is_active = 1 
-                        ORDER BY date ASC, time ASC
-                    '''
-                else:
-                    query = '''
-                        SELECT id, name_uz, date, time, address_uz, payment_amount, is_active, created_at
-                        FROM events 
-                        WHERE is_active = 1 
-                        ORDER BY date ASC, time ASC
-                    '''
-                cursor.execute(query)
-                return cursor.fetchall()
-            except Exception as e:
-                print(f"❌ Faol tadbirlarni olishda xatolik: {e}")
-                return []
+        """Barcha faol tadbirlarni tilga qarab olish (keshdan)"""
+        try:
+            return list(self._get_event_catalog()['active'][self._event_lang(lang)])
+        except Exception as e:
+            print(f"❌ Faol tadbirlarni olishda xatolik: {e}")
+            return []
 
     def get_event_by_id(self, event_id, lang='uz'):
-        """ID orqali tadbirni tilga qarab olish"""
-        with self.get_connection() as conn:
-            cursor = conn.cursor()
-            try:
-                cursor.execute("PRAGMA table_info(events)")
-                columns = [column[1] for column in cursor.fetchall()]
-
-                if f'name_{lang}' in columns:
-                    name_field = f'name_{lang}'
-                    address_field = f'address_{lang}'
-                    query = f'''
-                        SELECT id, {name_field}, date, time, {address_field}, payment_amount, is_active, created_at
-                        FROM events 
-                        WHERE id = ?
-                    '''
-                else:
-                    query = '''
-                        SELECT id, name_uz, date, time, address_uz, payment_amount, is_active, created_at
-                        FROM events 
-                        WHERE id = ?
-                    '''
-                cursor.execute(query, (event_id,))
-                return cursor.fetchone()
-            except Exception as e:
-                print(f"❌ Tadbirni ID orqali olishda xatolik: {e}")
-                return None
+        """ID orqali tadbirni tilga qarab olish (keshdan)"""
+        try:
+            return self._get_event_catalog()['by_id'].get((int(event_id), self._event_lang(lang)))
+        except Exception as e:
+            print(f"❌ Tadbirni ID orqali olishda xatolik: {e}")
+            return None
 
     def toggle_event_status(self, event_id):
         """Marosim holatini o'zgartirish"""
@@ -658,83 +1184,61 @@ class Database:
                     cursor.execute("UPDATE events SET is_active = 1 WHERE id = ?", (event_id,))
 
                 conn.commit()
+                self.invalidate_event_catalog()
                 return True
             except Exception as e:
                 print(f"❌ Tadbir holatini o'zgartirishda xatolik: {e}")
                 return False
 
+    def _event_lang_fields(self, lang):
+        lang = self._event_lang(lang)
+        return f'name_{lang}', f'address_{lang}'
+
+    def _event_with_stats_dict(self, row):
+        return {
+            'id': row[0],
+            'name': row[1],
+            'date': row[2],
+            'time': row[3],
+            'address': row[4],
+            'payment_amount': row[5],
+            'is_active': bool(row[6]),
+            'created_at': row[7],
+            'stats': {
+                'total': row[8] or 0,
+                'paid': row[9] or 0,
+                'approved': row[10] or 0,
+                'attended': row[11] or 0,
+                'pending': row[12] or 0
+            }
+        }
+
     def get_events_with_stats(self, lang='uz'):
-        """Marosimlar va ularning statistikasi"""
-        with self.get_connection() as conn:
+        """Marosimlar va ularning statistikasi (bitta so'rovda)"""
+        with self.get_read_connection() as conn:
             cursor = conn.cursor()
             try:
-                cursor.execute("PRAGMA table_info(events)")
-                columns = [column[1] for column in cursor.fetchall()]
-
-                if f'name_{lang}' in columns:
-                    name_field = f'name_{lang}'
-                    address_field = f'address_{lang}'
-                    query = f'''
-                        SELECT id, {name_field}, date, time, {address_field}, payment_amount, is_active, created_at
-                        FROM events 
-                        ORDER BY id DESC
-                    '''
-                else:
-                    query = '''
-                        SELECT id, name_uz, date, time, address_uz, payment_amount, is_active, created_at
-                        FROM events 
-                        ORDER BY id DESC
-                    '''
-
-                cursor.execute(query)
-                events = cursor.fetchall()
-                events_with_stats = []
-
-                for event in events:
-                    event_id = event[0]
-
-                    cursor.execute('SELECT COUNT(*) FROM users WHERE event_id = ?', (event_id,))
-                    total = cursor.fetchone()[0]
-
-                    cursor.execute('SELECT COUNT(*) FROM users WHERE event_id = ? AND payment_status = "paid"',
-                                   (event_id,))
-                    paid = cursor.fetchone()[0]
-
-                    cursor.execute('SELECT COUNT(*) FROM users WHERE event_id = ? AND approved = 1', (event_id,))
-                    approved = cursor.fetchone()[0]
-
-                    cursor.execute('SELECT COUNT(*) FROM users WHERE event_id = ? AND attended = 1', (event_id,))
-                    attended = cursor.fetchone()[0]
-
-                    cursor.execute(
-                        'SELECT COUNT(*) FROM users WHERE event_id = ? AND payment_status = "paid" AND approved = 0',
-                        (event_id,))
-                    pending = cursor.fetchone()[0]
-
-                    event_dict = {
-                        'id': event[0],
-                        'name': event[1],
-                        'date': event[2],
-                        'time': event[3],
-                        'address': event[4],
-                        'payment_amount': event[5],
-                        'is_active': bool(event[6]),
-                        'created_at': event[7],
-                        'stats': {
-                            'total': total,
-                            'paid': paid,
-                            'approved': approved,
-                            'attended': attended,
-                            'pending': pending
-                        }
-                    }
-                    events_with_stats.append(event_dict)
-
-                return events_with_stats
+                name_field, address_field = self._event_lang_fields(lang)
+                cursor.execute(events_with_stats_sql(name_field, address_field, config.USE_STATS_COUNTERS))
+                return [self._event_with_stats_dict(row) for row in cursor.fetchall()]
             except Exception as e:
                 print(f"❌ Tadbirlar statistikasini olishda xatolik: {e}")
                 return []
 
+    def get_event_stats(self, event_id, lang='uz'):
+        """Bitta marosim va uning statistikasi"""
+        with self.get_read_connection() as conn:
+            cursor = conn.cursor()
+            try:
+                name_field, address_field = self._event_lang_fields(lang)
+                cursor.execute(event_stats_sql(name_field, address_field, config.USE_STATS_COUNTERS),
+                               (event_id, event_id))
+                row = cursor.fetchone()
+                return self._event_with_stats_dict(row) if row else None
+            except Exception as e:
+                print(f"❌ Tadbir statistikasini olishda xatolik: {e}")
+                return None
+
     # USER BOSHQARUVI
     def register_user(self, telegram_id, full_name='', phone_number='', event_id=None):
         """User ro'yxatdan o'tkazish yoki yangilash"""
@@ -759,28 +1263,66 @@ class Database:
                     print(f"✅ Yangi user ro'yxatdan o'tdi: {telegram_id}")
 
                 conn.commit()
+                self.user_cache.invalidate(int(telegram_id))
                 return True
             except Exception as e:
                 print(f"❌ User ro'yxatdan o'tkazishda xatolik: {e}")
                 return False
 
+    def _reserve_ticket_block(self, size):
+        """id_sequences dan [boshi, oxiri) blokini ajratish (o'z tranzaksiyasida)"""
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("UPDATE id_sequences SET next_value = next_value + ? WHERE name = 'ticket'", (size,))
+            cursor.execute("SELECT next_value FROM id_sequences WHERE name = 'ticket'")
+            end = cursor.fetchone()[0]
+            conn.commit()
+        return end - size, end
+
     def _generate_unique_qr_id(self):
-        """Unique QR ID yaratish"""
-        while True:
-            qr_id = datetime.now().strftime('%d%m') + str(uuid.uuid4().int)[:4]
-            with self.get_connection() as conn:
-                cursor = conn.cursor()
-                cursor.execute('SELECT id FROM users WHERE qr_id = ?', (qr_id,))
-                if not cursor.fetchone():
-                    return qr_id
+        """Takrorlanmas chipta raqami (tartib raqami + nazorat raqami)
+
+        Blok ajratish o'zi commit qiladi - tranzaksiyada yozuvlardan oldin chaqirilishi kerak
+        """
+        with self._ticket_lock:
+            if self._ticket_next >= self._ticket_end:
+                self._ticket_next, self._ticket_end = self._reserve_ticket_block(config.TICKET_ID_BLOCK_SIZE)
+            sequence = self._ticket_next
+            self._ticket_next += 1
+        return format_ticket_id(sequence)
 
     def select_user(self, telegram_id):
-        """User ma'lumotlarini olish"""
-        with self.get_connection() as conn:
+        """User ma'lumotlarini olish (UserRecord), avval user_cache dan"""
+        telegram_id = int(telegram_id)
+        found, user = self.user_cache.get(telegram_id)
+        if found:
+            return user
+
+        version = self.user_cache.version
+        with self.get_read_connection() as conn:
+            cursor = conn.cursor()
+            try:
+                cursor.execute(SELECT_USER_SQL, (telegram_id,))
+                row = cursor.fetchone()
+                user = UserRecord._make(row) if row else None
+            except Exception as e:
+                print(f"❌ User olishda xatolik: {e}")
+                return None
+        self.user_cache.put(telegram_id, user, version)
+        return user
+
+    def select_user_fields(self, telegram_id, *fields):
+        """Faqat kerakli ustunlarni olish: select_user_fields(id, 'language', 'full_name')"""
+        record_type = user_projection(fields)
+        found, user = self.user_cache.get(int(telegram_id))
+        if found:
+            return record_type._make(getattr(user, field) for field in fields) if user else None
+        with self.get_read_connection() as conn:
             cursor = conn.cursor()
             try:
-                cursor.execute('SELECT * FROM users WHERE telegram_id = ?', (int(telegram_id),))
-                return cursor.fetchone()
+                cursor.execute(f'SELECT {", ".join(fields)} FROM users WHERE telegram_id = ?', (int(telegram_id),))
+                row = cursor.fetchone()
+                return record_type._make(row) if row else None
             except Exception as e:
                 print(f"❌ User olishda xatolik: {e}")
                 return None
@@ -791,18 +1333,29 @@ class Database:
 
     def select_all_users(self):
         """Barcha userlarni olish"""
-        with self.get_connection() as conn:
+        with self.get_read_connection() as conn:
             cursor = conn.cursor()
             try:
-                cursor.execute('SELECT * FROM users ORDER BY registered_at DESC')
-                return cursor.fetchall()
+                cursor.execute(SELECT_ALL_USERS_SQL)
+                return [UserRecord._make(row) for row in cursor.fetchall()]
             except Exception as e:
                 print(f"❌ Barcha userlarni olishda xatolik: {e}")
                 return []
 
+    def get_all_telegram_ids(self):
+        """Barcha userlarning telegram_id lari (reklama yuborish uchun)"""
+        with self.get_read_connection() as conn:
+            cursor = conn.cursor()
+            try:
+                cursor.execute('SELECT telegram_id FROM users ORDER BY registered_at DESC')
+                return [row[0] for row in cursor.fetchall()]
+            except Exception as e:
+                print(f"❌ Userlar ro'yxatini olishda xatolik: {e}")
+                return []
+
     def check_if_admin(self, user_id):
         """User admin ekanligini tekshirish"""
-        with self.get_connection() as conn:
+        with self.get_read_connection() as conn:
             cursor = conn.cursor()
             try:
                 cursor.execute('SELECT is_admin FROM admins WHERE user_id = ? AND is_admin = 1', (user_id,))
@@ -850,7 +1403,9 @@ class Database:
                 cursor.execute('UPDATE users SET payment_status = ? WHERE telegram_id = ?',
                                (status, int(telegram_id)))
                 if cursor.rowcount > 0:
+                    self._outbox_user(cursor, telegram_id)
                     conn.commit()
+                    self.user_cache.update(int(telegram_id), payment_status=status)
                     print(f"✅ To'lov holati yangilandi: {telegram_id} -> {status}")
                     return True
                 else:
@@ -862,49 +1417,28 @@ class Database:
 
     def get_pending_users(self):
         """Kutilayotgan userlarni olish"""
-        with self.get_connection() as conn:
+        with self.get_read_connection() as conn:
             cursor = conn.cursor()
             try:
-                cursor.execute('''
-                    SELECT u.*, e.name_uz as event_name 
-                    FROM users u
-                    LEFT JOIN events e ON u.event_id = e.id
-                    WHERE u.payment_status IN ('paid', 'pending_approval') AND u.approved = 0
-                    ORDER BY u.registered_at ASC
-                ''')
-                return cursor.fetchall()
+                cursor.execute(PENDING_USERS_SQL)
+                return [PendingUserRecord._make(row) for row in cursor.fetchall()]
             except Exception as e:
                 print(f"❌ Kutilayotgan userlarni olishda xatolik: {e}")
                 return []
 
     def get_all_user_stats(self):
-        """Barcha userlar statistikasi"""
-        with self.get_connection() as conn:
+        """Barcha userlar statistikasi (bitta so'rovda)"""
+        with self.get_read_connection() as conn:
             cursor = conn.cursor()
             try:
-                cursor.execute('SELECT COUNT(*) FROM users')
-                total = cursor.fetchone()[0]
-
-                cursor.execute(
-                    'SELECT COUNT(*) FROM users WHERE payment_status IN ("paid", "pending_approval", "approved")')
-                paid = cursor.fetchone()[0]
-
-                cursor.execute('SELECT COUNT(*) FROM users WHERE approved = 1')
-                approved = cursor.fetchone()[0]
-
-                cursor.execute('SELECT COUNT(*) FROM users WHERE attended = 1')
-                attended = cursor.fetchone()[0]
-
-                cursor.execute(
-                    'SELECT COUNT(*) FROM users WHERE payment_status IN ("paid", "pending_approval") AND approved = 0')
-                pending = cursor.fetchone()[0]
-
+                cursor.execute(all_user_stats_sql(config.USE_STATS_COUNTERS))
+                total, paid, approved, attended, pending = cursor.fetchone()
                 return {
-                    'total': total,
-                    'paid': paid,
-                    'approved': approved,
-                    'attended': attended,
-                    'pending': pending
+                    'total': total or 0,
+                    'paid': paid or 0,
+                    'approved': approved or 0,
+                    'attended': attended or 0,
+                    'pending': pending or 0
                 }
             except Exception as e:
                 print(f"❌ Umumiy statistikani olishda xatolik: {e}")
@@ -922,6 +1456,7 @@ class Database:
                     cursor.execute('UPDATE users SET language = ? WHERE telegram_id = ?', (language, int(telegram_id)))
                     if cursor.rowcount > 0:
                         conn.commit()
+                        self.user_cache.update(int(telegram_id), language=language)
                         return True
                 else:
                     qr_id = self._generate_unique_qr_id()
@@ -930,6 +1465,7 @@ class Database:
                         VALUES (?, ?, ?, '', '')
                     ''', (int(telegram_id), language, qr_id))
                     conn.commit()
+                    self.user_cache.invalidate(int(telegram_id))
                     return True
             except Exception as e:
                 print(f"❌ User tilini o'rnatishda xatolik: {e}")
@@ -937,158 +1473,171 @@ class Database:
 
     def get_user_language(self, telegram_id):
         """User tilini olish"""
-        with self.get_connection() as conn:
-            cursor = conn.cursor()
-            try:
-                cursor.execute('SELECT language FROM users WHERE telegram_id = ?', (int(telegram_id),))
-                result = cursor.fetchone()
-                return result[0] if result and result[0] else 'uz'
-            except Exception as e:
-                print(f"❌ User tilini olishda xatolik: {e}")
-                return 'uz'
+        user = self.select_user(telegram_id)
+        return user.language if user and user.language else 'uz'
 
     def get_user_registration_status(self, telegram_id):
         """User ro'yxatdan o'tish holatini tekshirish"""
-        with self.get_connection() as conn:
-            cursor = conn.cursor()
-            try:
-                cursor.execute('''
-                    SELECT qr_id, payment_status, approved, full_name, phone_number
-                    FROM users 
-                    WHERE telegram_id = ?
-                ''', (int(telegram_id),))
-                result = cursor.fetchone()
-
-                if not result:
-                    return {'exists': False, 'status': 'not_registered'}
-
-                qr_id, payment_status, approved, full_name, phone_number = result
-
-                if not full_name or not phone_number or full_name == '' or phone_number == '':
-                    status = 'not_registered'
-                elif approved == 1:
-                    status = 'approved'
-                elif payment_status in ['paid', 'pending_approval']:
-                    status = 'pending_approval'
-                elif payment_status == 'rejected':
-                    status = 'rejected'
-                else:
-                    status = 'pending_payment'
-
-                return {
-                    'exists': True,
-                    'status': status,
-                    'qr_id': qr_id,
-                    'payment_status': payment_status,
-                    'approved': approved,
-                    'full_name': full_name
-                }
-            except Exception as e:
-                print(f"❌ User statsini olishda xatolik: {e}")
-                return {'exists': False, 'status': 'error'}
+        try:
+            return registration_status(self.select_user(telegram_id))
+        except Exception as e:
+            print(f"❌ User statsini olishda xatolik: {e}")
+            return {'exists': False, 'status': 'error'}
 
     # QR KOD BOSHQARUVI
-    def generate_qr_code_with_full_data(self, telegram_id):
-        """Foydalanuvchi uchun QR kod yaratish (Google Sheets bilan bir xil formatda)"""
+    def _ticket_payload(self, qr_id, event_id):
+        """QR kod matni: marosim ma'lum bo'lsa imzolangan, aks holda oddiy ID"""
+        return sign_ticket(qr_id, event_id) if event_id else qr_id
+
+    def _render_ticket_png(self, telegram_id, qr_id, event_id=None):
+        """Chipta QR rasmi (PNG baytlar)"""
         try:
-            user = self.get_user(telegram_id)
+            png = render_qr(self._ticket_payload(qr_id, event_id))
+            print(f"✅ QR kod yaratildi: {telegram_id} - ID: {qr_id}")
+            return png
+        except Exception as e:
+            print(f"❌ QR kod yaratishda xatolik: {e}")
+            return None
+
+    def generate_qr_code_with_full_data(self, telegram_id, qr_id=None):
+        """Foydalanuvchi uchun QR kod yaratish (base64, eski chaqiruvlar uchun)"""
+        user = self.select_user_fields(telegram_id, 'qr_id', 'event_id')
+        if qr_id is None:
             if not user:
                 print(f"❌ User topilmadi: {telegram_id}")
                 return None
+            qr_id = user.qr_id
 
-            qr_id = user[7]  # Faqat qr_id ni olamiz
-            row_number = self._get_user_row_number(telegram_id) or 2  # Agar topilmasa, default 2
+        png = self._render_ticket_png(telegram_id, qr_id, user.event_id if user else None)
+        return base64.b64encode(png).decode() if png else None
 
-            # Google Sheets dagi kabi formula yaratish
-            qr_formula = self.create_qr_formula(f'F{row_number}', row_number)
+    def approve_user_with_full_qr(self, telegram_id, approved=True, attempts=3):
+        """User ni to'liq QR kod bilan tasdiqlash"""
+        if not approved:
+            with self.get_connection() as conn:
+                cursor = conn.cursor()
+                try:
+                    cursor.execute('''
+                        UPDATE users SET approved = 0, payment_status = 'rejected' 
+                        WHERE telegram_id = ?
+                    ''', (int(telegram_id),))
+                    if not cursor.rowcount:
+                        print(f"❌ Tasdiqlash uchun user topilmadi: {telegram_id}")
+                        return False
+                    conn.commit()
+                    print(f"❌ User rad etildi: {telegram_id}")
+                    self.user_cache.update(int(telegram_id), approved=0, payment_status='rejected')
+                    return True
+                except Exception as e:
+                    print(f"❌ User tasdiqlashda xatolik: {e}")
+                    return False
 
-            # api.qrserver.com dan to'g'ridan-to'g'ri rasm olish
-            qr_url = f"https://api.qrserver.com/v1/create-qr-code/?size=1200x1200&data={urllib.parse.quote(qr_id)}&margin=20"
-            response = requests.get(qr_url)
+        user = self.select_user_fields(telegram_id, 'qr_id', 'event_id')
+        for _ in range(attempts):
+            if not user:
+                print(f"❌ Tasdiqlash uchun user topilmadi: {telegram_id}")
+                return False
+            # QR yozish tranzaksiyasidan oldin chiziladi - yozuvchi ulanish band bo'lib turmaydi
+            png = self._render_ticket_png(telegram_id, user.qr_id, user.event_id)
+            if not png:
+                # Rasmsiz chipta yuborib bo'lmaydi - tasdiqlanmaydi
+                return False
 
-            if response.status_code != 200:
-                print(f"❌ QR kod rasm olishda xatolik: {response.status_code}")
-                return None
+            with self.get_connection() as conn:
+                cursor = conn.cursor()
+                try:
+                    cursor.execute('SELECT qr_id, event_id FROM users WHERE telegram_id = ?', (int(telegram_id),))
+                    user_data = cursor.fetchone()
+                    if not user_data or tuple(user_data) != tuple(user):
+                        # Chizish paytida qr_id yoki marosim o'zgargan - qulfdan tashqarida qayta chizamiz
+                        conn.rollback()
+                        user = type(user)._make(user_data) if user_data else None
+                        continue
 
-            # Rasmni base64 formatga aylantirish
-            buffer = io.BytesIO(response.content)
-            qr_code_data = base64.b64encode(buffer.getvalue()).decode()
+                    cursor.execute('''
+                        UPDATE users SET approved = 1, qr_file_id = NULL, payment_status = 'approved'
+                        WHERE telegram_id = ?
+                    ''', (int(telegram_id),))
+                    self._save_ticket_png(cursor, telegram_id, user.qr_id, png)
+                    self._outbox_user(cursor, telegram_id)
+                    conn.commit()
+                except Exception as e:
+                    print(f"❌ User tasdiqlashda xatolik: {e}")
+                    return False
 
-            print(f"✅ QR kod yaratildi: {user[2]} - ID: {qr_id}")
-            return qr_code_data
+            print(f"✅ User to'liq QR kod bilan tasdiqlandi: {telegram_id}")
+            self.user_cache.update(int(telegram_id), approved=1, qr_file_id=None, payment_status='approved')
+            return True
 
-        except Exception as e:
-            print(f"❌ QR kod yaratishda xatolik: {e}")
-            return None
+        print(f"❌ Tasdiqlash: chipta ma'lumotlari o'zgarishda davom etmoqda: {telegram_id}")
+        return False
 
-    def _get_user_row_number(self, telegram_id):
-        """Foydalanuvchi qator raqamini olish (Google Sheets uchun)"""
-        try:
-            # Google Sheets dan qator raqamini aniqlash
-            if SHEETS_MODE and SPREADSHEET_ID:
-                data = sheets_client.service.spreadsheets().values().get(
-                    spreadsheetId=SPREADSHEET_ID,
-                    range='E:E'
-                ).execute()
-                values = data.get('values', [])
-                for i, row in enumerate(values, 1):
-                    if row and str(row[0]) == str(self.get_user(telegram_id)[7]):
-                        return i + 1  # Sarlavha qatorini hisobga olamiz
-            return None
-        except Exception as e:
-            print(f"❌ Qator raqamini olishda xatolik: {e}")
-            return None
+    def _save_ticket_png(self, cursor, telegram_id, qr_id, png):
+        if png:
+            cursor.execute('''
+                INSERT OR REPLACE INTO ticket_assets (telegram_id, qr_id, png) VALUES (?, ?, ?)
+            ''', (int(telegram_id), qr_id, sqlite3.Binary(png)))
+        else:
+            cursor.execute('DELETE FROM ticket_assets WHERE telegram_id = ?', (int(telegram_id),))
 
-    def create_qr_formula(self, cell_reference, row_number):
-        """QR kod formulasi yaratish (Google Sheets bilan bir xil)"""
-        try:
-            formula = f'=IMAGE("https://api.qrserver.com/v1/create-qr-code/?size=1200x1200&data=" & ENCODEURL(E{row_number}) & "&margin=20")'
-            print(f"✅ QR formula yaratildi (1200x1200): {cell_reference}")
-            return formula
-        except Exception as e:
-            print(f"❌ QR formula yaratishda xatolik: {e}")
-            return None
+    def get_ticket_png(self, telegram_id):
+        """Joriy qr_id uchun chipta QR rasmi (PNG baytlar) yoki None"""
+        with self.get_read_connection() as conn:
+            cursor = conn.cursor()
+            try:
+                cursor.execute('''
+                    SELECT a.png FROM ticket_assets a
+                    JOIN users u ON u.telegram_id = a.telegram_id AND u.qr_id = a.qr_id
+                    WHERE a.telegram_id = ?
+                ''', (int(telegram_id),))
+                row = cursor.fetchone()
+                return bytes(row[0]) if row else None
+            except Exception as e:
+                print(f"❌ QR kod rasmini olishda xatolik: {e}")
+                return None
 
-    def approve_user_with_full_qr(self, telegram_id, approved=True):
-        """User ni to'liq QR kod bilan tasdiqlash"""
-        with self.get_connection() as conn:
+    def get_qr_photo(self, telegram_id):
+        """Yuborish uchun QR: (Telegram file_id yoki BytesIO, qr_id) yoki (None, None)"""
+        with self.get_read_connection() as conn:
             cursor = conn.cursor()
             try:
-                cursor.execute('SELECT id, qr_id FROM users WHERE telegram_id = ?', (int(telegram_id),))
-                user_data = cursor.fetchone()
-                if not user_data:
-                    print(f"❌ Tasdiqlash uchun user topilmadi: {telegram_id}")
-                    return False
+                cursor.execute('SELECT qr_file_id, qr_id FROM users WHERE telegram_id = ?', (int(telegram_id),))
+                row = cursor.fetchone()
+                if not row:
+                    return None, None
+                if row[0]:
+                    return row[0], row[1]
+            except Exception as e:
+                print(f"❌ QR kod rasmini olishda xatolik: {e}")
+                return None, None
 
-                if approved:
-                    # To'liq ma'lumotlar bilan QR kod yaratish
-                    qr_code_data = self.generate_qr_code_with_full_data(telegram_id)
-                    cursor.execute('''
-                        UPDATE users SET approved = 1, qr_code = ?, payment_status = 'approved'
-                        WHERE telegram_id = ?
-                    ''', (qr_code_data, int(telegram_id)))
-                    print(f"✅ User to'liq QR kod bilan tasdiqlandi: {telegram_id}")
-                else:
-                    cursor.execute('''
-                        UPDATE users SET approved = 0, payment_status = 'rejected' 
-                        WHERE telegram_id = ?
-                    ''', (int(telegram_id),))
-                    print(f"❌ User rad etildi: {telegram_id}")
+        # file_id yo'q - rasmni faqat shu holatda o'qiymiz
+        png = self.get_ticket_png(telegram_id)
+        if not png:
+            return None, None
+        return io.BytesIO(png), row[1]
 
+    def save_qr_file_id(self, telegram_id, qr_id, file_id):
+        """Birinchi yuborilgan QR rasmining file_id sini saqlash (qr_id o'zgarmagan bo'lsa)"""
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            try:
+                cursor.execute('UPDATE users SET qr_file_id = ? WHERE telegram_id = ? AND qr_id = ?',
+                               (file_id, int(telegram_id), qr_id))
                 conn.commit()
-                return True
+                self.user_cache.invalidate(int(telegram_id))
+                return cursor.rowcount > 0
             except Exception as e:
-                print(f"❌ User tasdiqlashda xatolik: {e}")
+                print(f"❌ QR file_id ni saqlashda xatolik: {e}")
                 return False
 
     def get_qr_code_image(self, telegram_id):
         """QR kod rasmini olish"""
         try:
-            user = self.get_user(telegram_id)
-            if not user or not user[6]:
+            png = self.get_ticket_png(telegram_id)
+            if not png:
                 return None
-            img_data = base64.b64decode(user[6])
-            return io.BytesIO(img_data)
+            return io.BytesIO(png)
         except Exception as e:
             print(f"❌ QR kod rasmini olishda xatolik: {e}")
             return None
@@ -1096,6 +1645,24 @@ class Database:
     def parse_qr_data(self, qr_text):
         """QR kod ma'lumotlarini parse qilish"""
         try:
+            # Imzolangan chipta (bazasiz tekshiriladi)
+            if is_signed_ticket(qr_text):
+                valid, qr_id, event_id, reason = verify_ticket(qr_text)
+                return {
+                    'format': 'signed',
+                    'data': qr_text,
+                    'id': qr_id,
+                    'valid': valid,
+                    'reason': reason,
+                    'name': 'N/A',
+                    'phone': 'N/A',
+                    'telegram_id': 'N/A',
+                    'event': {'id': event_id},
+                    'status': {},
+                    'registered': 'N/A',
+                    'qr_created': 'N/A'
+                }
+
             # JSON formatda bo'lsa
             if qr_text.strip().startswith('{'):
                 qr_data = json.loads(qr_text)
@@ -1143,99 +1710,335 @@ class Database:
                 'qr_created': 'N/A'
             }
 
+    def check_in_ticket(self, qr_id, scanner_name='Admin', event_id=None):
+        """Kelganlikni bitta shartli UPDATE ... RETURNING bilan belgilash
+
+        Ikki admin bir chiptani bir vaqtda skanerlasa ham faqat bittasi "first_entry" oladi.
+        event_id berilsa (imzolangan chipta) boshqa marosim chiptasi belgilanmaydi.
+        Qaytaradi: {'status': first_entry | already_checked_in | wrong_event | not_found,
+                    'full_name', 'phone', 'payment_status', 'event_id', 'event_name', 'attended_at', 'attended_by'}
+        """
+        now = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(CHECK_IN_SQL, (now, scanner_name, qr_id, event_id, event_id))
+            row = cursor.fetchone()
+            if row:
+                status = 'first_entry'
+                self._outbox_attendance(cursor, qr_id, scanner_name, now)
+                conn.commit()
+                self.user_cache.update(row[0], attended=1, attended_at=now, attended_by=scanner_name)
+            else:
+                # Yangilanmadi: nega - yozuvchi ulanishda, boshqa skan aralasha olmaydi
+                cursor.execute(CHECK_IN_LOOKUP_SQL, (qr_id,))
+                row = cursor.fetchone()
+                if not row:
+                    return {'status': 'not_found', 'full_name': None, 'phone': None, 'payment_status': None,
+                            'event_id': None, 'event_name': None, 'attended_at': None, 'attended_by': None}
+                status = 'wrong_event' if event_id is not None and row[4] != event_id else 'already_checked_in'
+
+        _, full_name, phone, payment_status, user_event_id, attended_at, attended_by = row
+        event = self.get_event_by_id(user_event_id) if user_event_id else None
+        event_name = event[1] if event else "Noma'lum marosim"
+        if status == 'first_entry':
+            print(f"✅ Kelganlik belgilandi: {full_name} - {event_name} ({scanner_name})")
+        return {
+            'status': status,
+            'full_name': full_name,
+            'phone': phone,
+            'payment_status': payment_status,
+            'event_id': user_event_id,
+            'event_name': event_name,
+            'attended_at': attended_at,
+            'attended_by': attended_by
+        }
+
     def mark_user_attended_with_full_data(self, qr_data, scanner_name='Admin'):
         """To'liq ma'lumotlar bilan kelganlik belgilash"""
         try:
-            now = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-
             # QR ma'lumotlarini parse qilish
             parsed_qr = self.parse_qr_data(qr_data)
-            qr_id = parsed_qr['id']
+            if parsed_qr['format'] == 'signed' and not parsed_qr['valid']:
+                print(f"❌ Soxta yoki buzilgan chipta: {qr_data}")
+                return False, None, None, parsed_qr
+
+            event_id = parsed_qr['event']['id'] if parsed_qr['format'] == 'signed' else None
+            result = self.check_in_ticket(parsed_qr['id'], scanner_name, event_id)
+            if result['status'] == 'not_found':
+                print(f"❌ QR ID topilmadi: {parsed_qr['id']}")
+                return False, None, None, parsed_qr
+            if result['status'] == 'wrong_event':
+                print(f"❌ Chipta boshqa marosim uchun: {parsed_qr['id']}")
+                return False, None, None, parsed_qr
+            if result['status'] == 'already_checked_in':
+                print(f"⚠️ User allaqachon kelgan: {result['full_name']} - {result['event_name']}")
+            return True, result['full_name'], result['event_name'], parsed_qr
 
-            with self.get_connection() as conn:
-                cursor = conn.cursor()
-                cursor.execute('''
-                    SELECT telegram_id, full_name, attended, event_id 
-                    FROM users WHERE qr_id = ?
-                ''', (qr_id,))
-                user_data = cursor.fetchone()
-
-                if not user_data:
-                    print(f"❌ QR ID topilmadi: {qr_id}")
-                    return False, None, None, parsed_qr
+        except Exception as e:
+            print(f"❌ Kelganlik belgilashda database xatolik: {e}")
+            return False, None, None, {'format': 'error', 'data': qr_data}
 
-                telegram_id, full_name, already_attended, user_event_id = user_data
+    def scan_ticket(self, qr_id, scanner_name='Admin'):
+        """QR skaner: chipta egasini topish va kelganlikni belgilash (eski format)"""
+        result = self.check_in_ticket(qr_id, scanner_name)
+        if result['status'] == 'not_found':
+            return None
+        return {
+            'full_name': result['full_name'],
+            'phone': result['phone'],
+            'payment_status': result['payment_status'],
+            'event_name': result['event_name'],
+            'already_attended': result['status'] != 'first_entry'
+        }
 
-                # Event ma'lumotlarini olish
-                event = self.get_event_by_id(user_event_id) if user_event_id else None
-                event_name = event[1] if event else "Noma'lum marosim"
+    def bulk_check_in(self, scans):
+        """Offline skanerlar partiyasini bitta tranzaksiyada qo'llash
 
-                if already_attended == 1:
-                    print(f"⚠️ User allaqachon kelgan: {full_name} - {event_name}")
-                    return True, full_name, event_name, parsed_qr
+        scans -> [(qr_id, event_id yoki None, scanned_at, scanner), ...]
+        Har bir chipta uchun eng erta skan yutadi (teng vaqtda - skaner nomi bo'yicha), shuning uchun
+        partiyani qayta yuborish yoki tartibi natijani o'zgartirmaydi.
+        Qaytaradi: har bir yozuv uchun {'qr_id', 'status', 'full_name', 'attended_at', 'attended_by'}
+        status: checked_in, updated (oldingi kechroq skan almashtirildi), duplicate, not_found, wrong_event
+        """
+        results = [None] * len(scans)
+        order = sorted(range(len(scans)), key=lambda index: (scans[index][2], scans[index][3], index))
+        qr_ids = sorted({scan[0] for scan in scans})
 
-                # Kelganlik belgilash
-                cursor.execute('''
-                    UPDATE users SET attended = 1, attended_at = ?, attended_by = ?
-                    WHERE qr_id = ? AND event_id = ?
-                ''', (now, scanner_name, qr_id, user_event_id))
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            try:
+                users = {}
+                for start in range(0, len(qr_ids), 500):
+                    chunk = qr_ids[start:start + 500]
+                    cursor.execute(f'''
+                        SELECT qr_id, telegram_id, full_name, event_id, attended, attended_at, attended_by
+                        FROM users WHERE qr_id IN ({', '.join('?' * len(chunk))})
+                    ''', chunk)
+                    for row in cursor.fetchall():
+                        users[row[0]] = list(row[1:])
+
+                updates = {}
+                for index in order:
+                    qr_id, event_id, scanned_at, scanner = scans[index]
+                    user = users.get(qr_id)
+                    if not user:
+                        results[index] = {'qr_id': qr_id, 'status': 'not_found', 'full_name': None,
+                                          'attended_at': None, 'attended_by': None}
+                        continue
 
-                if cursor.rowcount > 0:
-                    conn.commit()
-                    print(f"✅ Kelganlik belgilandi: {full_name} - {event_name} ({scanner_name})")
-                    return True, full_name, event_name, parsed_qr
-                else:
-                    print(f"❌ Kelganlik belgilashda xatolik: {qr_id}")
-                    return False, None, None, parsed_qr
+                    telegram_id, full_name, user_event_id, attended, attended_at, attended_by = user
+                    if event_id is not None and event_id != user_event_id:
+                        status = 'wrong_event'
+                    elif attended and (not attended_at or attended_at <= scanned_at):
+                        status = 'duplicate'
+                    else:
+                        status = 'updated' if attended else 'checked_in'
+                        user[3:] = [1, scanned_at, scanner]
+                        updates[qr_id] = (telegram_id, scanned_at, scanner)
+                    results[index] = {'qr_id': qr_id, 'status': status, 'full_name': full_name,
+                                      'attended_at': user[4], 'attended_by': user[5]}
+
+                cursor.executemany(
+                    'UPDATE users SET attended = 1, attended_at = ?, attended_by = ? WHERE qr_id = ?',
+                    [(scanned_at, scanner, qr_id) for qr_id, (_, scanned_at, scanner) in updates.items()]
+                )
+                for qr_id, (_, scanned_at, scanner) in updates.items():
+                    self._outbox_attendance(cursor, qr_id, scanner, scanned_at)
+                conn.commit()
+            except Exception as e:
+                print(f"❌ Partiyali kelganlik belgilashda xatolik: {e}")
+                return None
 
-        except Exception as e:
-            print(f"❌ Kelganlik belgilashda database xatolik: {e}")
-            return False, None, None, {'format': 'error', 'data': qr_data}
+        for telegram_id, scanned_at, scanner in updates.values():
+            self.user_cache.update(telegram_id, attended=1, attended_at=scanned_at, attended_by=scanner)
+        print(f"✅ Partiya: {len(scans)} ta skan, {len(updates)} ta kelganlik yozildi")
+        return results
 
     def convert_all_qr_to_json_format(self):
-        """Barcha mavjud QR kodlarni JSON formatga o'zgartirish"""
+        """Barcha mavjud QR kodlarni qayta yaratish"""
         try:
-            with self.get_connection() as conn:
+            # Barcha tasdiqlangan userlarni olish
+            with self.get_read_connection() as conn:
                 cursor = conn.cursor()
-
-                # Barcha tasdiqlangan userlarni olish
                 cursor.execute('''
-                    SELECT telegram_id, qr_id, approved, qr_code 
+                    SELECT telegram_id, qr_id, event_id 
                     FROM users 
                     WHERE approved = 1 AND qr_id IS NOT NULL
                 ''')
-
                 users = cursor.fetchall()
-                print(f"🔄 {len(users)} ta QR kodni JSON formatga o'zgartirish boshlandi...")
+            print(f"🔄 {len(users)} ta QR kodni qayta yaratish boshlandi...")
 
-                converted_count = 0
-                for user in users:
-                    telegram_id, qr_id, approved, existing_qr_code = user
+            # Rasmlar tranzaksiyadan tashqarida, parallel chiziladi
+            images = render_qr_many([self._ticket_payload(qr_id, event_id) for _, qr_id, event_id in users])
 
-                    try:
-                        # Yangi JSON QR kod yaratish
-                        new_qr_code = self.generate_qr_code_with_full_data(telegram_id)
+            converted_count = 0
+            with self.get_connection() as conn:
+                cursor = conn.cursor()
+                for (telegram_id, qr_id, _), png in zip(users, images):
+                    # qr_id o'zgargan userlar tegilmaydi
+                    cursor.execute('''
+                        UPDATE users SET qr_file_id = NULL WHERE telegram_id = ? AND qr_id = ?
+                    ''', (telegram_id, qr_id))
+                    if cursor.rowcount:
+                        self._save_ticket_png(cursor, telegram_id, qr_id, png)
+                        converted_count += 1
+                conn.commit()
+            self.user_cache.clear()
 
-                        if new_qr_code:
-                            # Database da yangilash
-                            cursor.execute('''
-                                UPDATE users SET qr_code = ? WHERE telegram_id = ?
-                            ''', (new_qr_code, telegram_id))
+            print(f"🎉 {converted_count} ta QR kod muvaffaqiyatli o'zgartirildi!")
+            return converted_count
 
-                            converted_count += 1
-                            print(f"✅ Converted: {qr_id} -> JSON format")
+        except Exception as e:
+            print(f"❌ Conversion xatolik: {e}")
+            return 0
 
-                    except Exception as e:
-                        print(f"❌ Xatolik {qr_id}: {e}")
-                        continue
+    # GOOGLE SHEETS OUTBOX
+    def _outbox_user(self, cursor, telegram_id):
+        """User qatorini outbox ga yozish (chaqiruvchining tranzaksiyasida). Bir chipta - bitta yozuv"""
+        if not config.SHEETS_MODE:
+            return
+        cursor.execute(
+            'SELECT telegram_id, full_name, phone_number, payment_status, qr_id, event_id FROM users WHERE telegram_id = ?',
+            (int(telegram_id),)
+        )
+        row = cursor.fetchone()
+        if not row or not row[4]:
+            return
+        payload = dict(zip(('telegram_id', 'full_name', 'phone', 'payment_status', 'qr_id', 'event_id'), row))
+        cursor.execute('''
+            INSERT INTO sheets_outbox (idem_key, kind, payload) VALUES (?, 'user', ?)
+            ON CONFLICT(idem_key) DO UPDATE SET
+                payload = excluded.payload, revision = revision + 1, attempts = 0, next_attempt_at = 0
+        ''', (f"user:{row[4]}", json.dumps(payload, ensure_ascii=False)))
+
+    def _outbox_attendance(self, cursor, qr_id, scanner_name, attended_at):
+        """Kelganlikni outbox ga yozish (chaqiruvchining tranzaksiyasida)
+
+        Bazadagi qiymat (eng erta skan) yutadi: yetkazilmagan yozuv yangilanadi, revision oshadi -
+        bulk_check_in dagi 'updated' ham jadvalga yetib boradi
+        """
+        if not config.SHEETS_MODE:
+            return
+        payload = {'qr_id': qr_id, 'scanner': scanner_name, 'attended_at': attended_at}
+        cursor.execute('''
+            INSERT INTO sheets_outbox (idem_key, kind, payload) VALUES (?, 'attendance', ?)
+            ON CONFLICT(idem_key) DO UPDATE SET
+                payload = excluded.payload, revision = revision + 1, attempts = 0, next_attempt_at = 0
+        ''', (f"attendance:{qr_id}", json.dumps(payload, ensure_ascii=False)))
+
+    def enqueue_sheets_clear(self):
+        """Jadvalni tozalash: undan oldingi yetkazilmagan o'zgarishlar kerak emas"""
+        if not config.SHEETS_MODE:
+            return False
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            try:
+                cursor.execute('DELETE FROM sheets_outbox')
+                cursor.execute(
+                    "INSERT INTO sheets_outbox (idem_key, kind, payload) VALUES (?, 'clear', '{}')",
+                    (f"clear:{time_module.time()}",)
+                )
+                conn.commit()
+                return True
+            except Exception as e:
+                print(f"❌ Sheets tozalashni navbatga qo'yishda xatolik: {e}")
+                return False
+
+    def get_sheets_outbox_batch(self, limit=200):
+        """Yuborish vaqti kelgan yozuvlar: [(id, kind, payload, revision, attempts), ...]
+
+        Tartib saqlanadi: eng eski yozuv kutayotgan bo'lsa (qayta urinish), keyingilari ham kutadi -
+        aks holda kelganlik o'z qatori yoki tozalashdan oldin yozilib qolishi mumkin
+        """
+        now = time_module.time()
+        with self.get_read_connection() as conn:
+            try:
+                rows = conn.execute('''
+                    SELECT id, kind, payload, revision, attempts, next_attempt_at FROM sheets_outbox
+                    ORDER BY id LIMIT ?
+                ''', (limit,)).fetchall()
+                due = []
+                for row in rows:
+                    if row[5] > now:
+                        break
+                    due.append((row[0], row[1], json.loads(row[2]), row[3], row[4]))
+                return due
+            except Exception as e:
+                print(f"❌ Sheets outbox o'qishda xatolik: {e}")
+                return []
+
+    def ack_sheets_outbox(self, items):
+        """Yetkazilgan yozuvlarni o'chirish. Orada yangilangan (revision oshgan) yozuv qoladi"""
+        with self.get_connection() as conn:
+            conn.executemany('DELETE FROM sheets_outbox WHERE id = ? AND revision = ?',
+                             [(item[0], item[3]) for item in items])
+            conn.commit()
+
+    def retry_sheets_outbox(self, items, error, base_delay=5, max_delay=900, max_attempts=None):
+        """Yetkazilmagan yozuvlarni eksponensial kechikish bilan qayta rejalashtirish
+
+        max_attempts berilsa (doimiy xatolik) shuncha urinishdan keyin yozuv sheets_outbox_dead ga o'tadi.
+        Dead-letter ga o'tgan yozuvlar sonini qaytaradi
+        """
+        now = time_module.time()
+        dead = 0
+        with self.get_connection() as conn:
+            if max_attempts:
+                keys = [(item[0], item[3], max_attempts) for item in items]
+                conn.executemany('''
+                    INSERT INTO sheets_outbox_dead (id, idem_key, kind, payload, attempts, last_error, created_at)
+                    SELECT id, idem_key, kind, payload, attempts + 1, ?, created_at FROM sheets_outbox
+                    WHERE id = ? AND revision = ? AND attempts + 1 >= ?
+                ''', [(str(error)[:500],) + key for key in keys])
+                dead = conn.executemany(
+                    'DELETE FROM sheets_outbox WHERE id = ? AND revision = ? AND attempts + 1 >= ?', keys
+                ).rowcount
+            conn.executemany('''
+                UPDATE sheets_outbox SET attempts = attempts + 1, next_attempt_at = ?, last_error = ?
+                WHERE id = ? AND revision = ?
+            ''', [(now + min(max_delay, base_delay * 2 ** item[4]), str(error)[:500], item[0], item[3])
+                  for item in items])
+            conn.commit()
+        return dead
+
+    def get_sheets_rows(self, spreadsheet_id):
+        """Saqlangan qator indeksi: {qr_id: qator raqami}"""
+        with self.get_read_connection() as conn:
+            try:
+                return dict(conn.execute('SELECT qr_id, row_number FROM sheets_rows WHERE spreadsheet_id = ?',
+                                         (spreadsheet_id,)).fetchall())
+            except Exception as e:
+                print(f"❌ Sheets qator indeksini o'qishda xatolik: {e}")
+                return {}
 
+    def save_sheets_rows(self, spreadsheet_id, rows, replace=False):
+        """Qator indeksini yangilash. replace=True - jadval qayta o'qilgan yoki tozalangan"""
+        with self.get_connection() as conn:
+            try:
+                if replace:
+                    conn.execute('DELETE FROM sheets_rows WHERE spreadsheet_id = ?', (spreadsheet_id,))
+                conn.executemany('INSERT OR REPLACE INTO sheets_rows (spreadsheet_id, qr_id, row_number) VALUES (?, ?, ?)',
+                                 [(spreadsheet_id, qr_id, row_number) for qr_id, row_number in rows.items()])
                 conn.commit()
-                print(f"🎉 {converted_count} ta QR kod muvaffaqiyatli o'zgartirildi!")
-                return converted_count
+                return True
+            except Exception as e:
+                print(f"❌ Sheets qator indeksini saqlashda xatolik: {e}")
+                return False
 
-        except Exception as e:
-            print(f"❌ Conversion xatolik: {e}")
-            return 0
+    def get_sheets_outbox_stats(self):
+        with self.get_read_connection() as conn:
+            try:
+                pending, lag, max_attempts, last_error, dead = conn.execute('''
+                    SELECT COUNT(*), (julianday('now') - julianday(MIN(created_at))) * 86400, MAX(attempts),
+                           (SELECT last_error FROM sheets_outbox WHERE last_error IS NOT NULL ORDER BY id DESC LIMIT 1),
+                           (SELECT COUNT(*) FROM sheets_outbox_dead)
+                    FROM sheets_outbox
+                ''').fetchone()
+                return {'pending': pending, 'lag_seconds': round(lag or 0, 1), 'max_attempts': max_attempts or 0,
+                        'last_error': last_error, 'dead': dead}
+            except Exception as e:
+                print(f"❌ Sheets outbox statistikasini olishda xatolik: {e}")
+                return {'pending': 0, 'lag_seconds': 0, 'max_attempts': 0, 'last_error': None, 'dead': 0}
 
     # LEGACY METHODS (eski kod bilan mos kelish uchun)
     def add_channel(self, channel_id, channel_name):
@@ -1247,6 +2050,7 @@ class Database:
                 cursor.execute('INSERT INTO channels (channel_id, channel_name) VALUES (?, ?)',
                                (channel_id, channel_name))
                 conn.commit()
+                self.invalidate_channel_cache()
                 return True
             except sqlite3.IntegrityError:
                 return False
@@ -1270,12 +2074,17 @@ class Database:
     def backup_database(self):
         """Ma'lumotlar bazasini zahiralash"""
         try:
-            import shutil
             backup_dir = "db/backups"
             os.makedirs(backup_dir, exist_ok=True)
             timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
             backup_path = f"{backup_dir}/database_backup_{timestamp}.db"
-            shutil.copy2(self.db_path, backup_path)
+            # WAL rejimida faylni nusxalash xavfli - SQLite backup API dan foydalanamiz
+            target = sqlite3.connect(backup_path)
+            try:
+                with self.get_read_connection() as conn:
+                    conn.backup(target)
+            finally:
+                target.close()
             print(f"✅ Database zahiralandi: {backup_path}")
             return backup_path
         except Exception as e:
@@ -1284,7 +2093,7 @@ class Database:
 
     def debug_events_status(self):
         """Debug: tadbirlar holatini tekshirish"""
-        with self.get_connection() as conn:
+        with self.get_read_connection() as conn:
             cursor = conn.cursor()
             try:
                 cursor.execute('SELECT id, name_uz, is_active FROM events ORDER BY id DESC')
@@ -1294,5 +2103,16 @@ class Database:
                 return []
 
 
-# Global database instance yaratish
-user_db = Database()
\ No newline at end of file
+# Global database instance (birinchi murojaatda yaratiladi)
+_shared_db = None
+_shared_db_lock = threading.Lock()
+
+
+def get_db():
+    """Butun jarayon uchun yagona Database obyektini olish"""
+    global _shared_db
+    if _shared_db is None:
+        with _shared_db_lock:
+            if _shared_db is None:
+                _shared_db = Database(DATABASE_PATH)
+    return _shared_db
@@ -0,0 +1,90 @@
+import re
+import sys
+
+from utils.db_api.database import (
+    SELECT_USER_SQL, SELECT_ALL_USERS_SQL, PENDING_USERS_SQL, CHECK_IN_SQL, CHECK_IN_LOOKUP_SQL,
+    event_catalog_sql, event_stats_sql, events_with_stats_sql, all_user_stats_sql
+)
+
+# Kutilgan reja: rejada bo'lishi shart bo'lgan bo'lak (odatda indeks nomi) yoki
+# FULL_SCAN - ataylab to'liq o'qish (kichik jadval)
+FULL_SCAN = None
+
+# Har bir marosimga bitta qator - to'liq o'qilishi muammo emas
+_SMALL_TABLES = {'events', 'e', 'event_counters'}
+
+# Tez-tez bajariladigan so'rovlar: (nomi, SQL, parametrlar, kutilgan reja bo'lagi).
+# SQL Database metodlari ishlatadigan konstantalardan olinadi - matn ajralib ketmaydi
+HOT_QUERIES = [
+    ('select_user', SELECT_USER_SQL, (1,), 'INDEX sqlite_autoindex_users_1'),
+    ('check_in_ticket', CHECK_IN_SQL, ('', '', '00000000', None, None), 'INDEX sqlite_autoindex_users_2'),
+    ('check_in_lookup', CHECK_IN_LOOKUP_SQL, ('00000000',), 'INDEX sqlite_autoindex_users_2'),
+    ('select_all_users', SELECT_ALL_USERS_SQL, (), 'INDEX idx_users_registered_at'),
+    ('get_pending_users', PENDING_USERS_SQL, (), 'INDEX idx_users_pending'),
+    # get_event_stats (USE_STATS_COUNTERS=True va False)
+    ('event_stats_counters', event_stats_sql('name_uz', 'address_uz', True), (1, 1),
+     'event_counters USING INTEGER PRIMARY KEY'),
+    ('event_stats_live', event_stats_sql('name_uz', 'address_uz', False), (1, 1), 'INDEX idx_users_event_stats'),
+    # get_events_with_stats: bitta GROUP BY o'tishi (hisoblagichlar - har marosimga bitta qator)
+    ('events_with_stats_counters', events_with_stats_sql('name_uz', 'address_uz', True), (), FULL_SCAN),
+    ('events_with_stats_live', events_with_stats_sql('name_uz', 'address_uz', False), (), 'INDEX idx_users_event_stats'),
+    # get_all_user_stats
+    ('all_user_stats_counters', all_user_stats_sql(True), (), FULL_SCAN),
+    ('all_user_stats_live', all_user_stats_sql(False), (), 'INDEX idx_users_event_stats'),
+    # Marosimlar keshi (get_all_active_events/get_event_by_id) - events to'liq yuklanadi
+    ('event_catalog', event_catalog_sql(('uz',)), (), FULL_SCAN),
+]
+
+# "SCAN users" yoki "SCAN u" - indekssiz to'liq jadval o'qish (_SMALL_TABLES bundan mustasno).
+# "SCAN ... USING INDEX" (masalan ORDER BY registered_at) va SEARCH dan keyingi
+# vaqtinchalik saralash ruxsat etiladi
+_FULL_SCAN = re.compile(r'^SCAN (TABLE )?(\w+)( AS \w+)?$')
+
+
+def _plan_problems(plan_rows, expected_index):
+    details = [row[-1] for row in plan_rows]
+    if expected_index is FULL_SCAN:
+        return []
+    problems = [detail for detail in details
+                if _FULL_SCAN.match(detail) and _FULL_SCAN.match(detail).group(2) not in _SMALL_TABLES]
+    if not any(expected_index in detail for detail in details):
+        problems.append(f"{expected_index} ishlatilmadi")
+    return problems
+
+
+def check_query_plans(conn):
+    """Har bir HOT_QUERIES so'rovi uchun EXPLAIN QUERY PLAN natijasini tekshirish
+
+    Qaytaradi: (ok, natijalar) - natijalar {nomi: {'plan': [...], 'problems': [...]}}
+    """
+    results = {}
+    ok = True
+    for name, sql, params, expected_index in HOT_QUERIES:
+        plan_rows = conn.execute(f'EXPLAIN QUERY PLAN {sql}', params).fetchall()
+        problems = _plan_problems(plan_rows, expected_index)
+        results[name] = {
+            'plan': [row[-1] for row in plan_rows],
+            'problems': problems
+        }
+        if problems:
+            ok = False
+    return ok, results
+
+
+def print_report(ok, results):
+    for name, result in results.items():
+        status = '❌' if result['problems'] else '✅'
+        print(f"{status} {name}: {' | '.join(result['plan'] + result['problems'])}")
+    if ok:
+        print("✅ Barcha so'rovlar indeks ishlatmoqda")
+    else:
+        print("❌ To'liq jadval skanerlanishi aniqlandi!")
+
+
+if __name__ == '__main__':
+    # python -m utils.db_api.query_plans
+    from utils.db_api.database import get_db
+
+    ok, results = get_db().check_query_plans()
+    print_report(ok, results)
+    sys.exit(0 if ok else 1)
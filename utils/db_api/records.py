@@ -0,0 +1,48 @@
+from collections import namedtuple
+from functools import lru_cache
+
+# users jadvalidan o'qiladigan ustunlar (qr_code rasmi bu yerga kirmaydi)
+USER_COLUMNS = (
+    'id', 'telegram_id', 'full_name', 'phone_number', 'event_id', 'payment_status', 'qr_id',
+    'approved', 'registered_at', 'attended', 'attended_at', 'attended_by', 'language', 'qr_file_id',
+)
+
+UserRecord = namedtuple('UserRecord', USER_COLUMNS)
+PendingUserRecord = namedtuple('PendingUserRecord', USER_COLUMNS + ('event_name',))
+
+USER_SELECT = ', '.join(USER_COLUMNS)
+
+
+@lru_cache(maxsize=64)
+def user_projection(fields):
+    """Faqat kerakli ustunlar uchun yozuv turi (fields - ustun nomlari tuple)"""
+    unknown = [field for field in fields if field not in USER_COLUMNS]
+    if unknown:
+        raise ValueError(f"Noma'lum users ustuni: {', '.join(unknown)}")
+    return namedtuple('UserFields', fields)
+
+
+def registration_status(user):
+    """User yozuvidan ro'yxatdan o'tish holati (get_user_registration_status formatida)"""
+    if not user:
+        return {'exists': False, 'status': 'not_registered'}
+
+    if not user.full_name or not user.phone_number:
+        status = 'not_registered'
+    elif user.approved == 1:
+        status = 'approved'
+    elif user.payment_status in ['paid', 'pending_approval']:
+        status = 'pending_approval'
+    elif user.payment_status == 'rejected':
+        status = 'rejected'
+    else:
+        status = 'pending_payment'
+
+    return {
+        'exists': True,
+        'status': status,
+        'qr_id': user.qr_id,
+        'payment_status': user.payment_status,
+        'approved': user.approved,
+        'full_name': user.full_name
+    }
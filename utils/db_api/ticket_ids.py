@@ -0,0 +1,86 @@
+import base64
+import hashlib
+import hmac
+import re
+from functools import lru_cache
+
+from data import config
+
+# Yangi chipta raqami: 8 xonali tartib raqami + 1 ta Luhn nazorat raqami (9 xona).
+# Eski raqamlar (ddmm + 4 xona) 8 xonali - ular bilan hech qachon to'qnashmaydi
+SEQUENCE_DIGITS = 8
+_LEGACY_ID = re.compile(r'^\d{8}$')
+
+
+def luhn_check_digit(digits):
+    """Raqamlar qatori uchun Luhn nazorat raqami"""
+    total = 0
+    for index, char in enumerate(reversed(digits)):
+        value = int(char)
+        if index % 2 == 0:
+            value *= 2
+            if value > 9:
+                value -= 9
+        total += value
+    return str((10 - total % 10) % 10)
+
+
+def format_ticket_id(sequence):
+    """Tartib raqamidan chipta raqami: 42 -> '000000426'"""
+    digits = str(sequence).zfill(SEQUENCE_DIGITS)
+    return digits + luhn_check_digit(digits)
+
+
+def is_valid_ticket_id(qr_id):
+    """Bazaga murojaat qilmasdan noto'g'ri terilgan raqamni aniqlash (eski format ham qabul qilinadi)"""
+    qr_id = str(qr_id).strip()
+    if _LEGACY_ID.match(qr_id):
+        return True
+    if not qr_id.isdigit() or len(qr_id) <= SEQUENCE_DIGITS:
+        return False
+    return luhn_check_digit(qr_id[:-1]) == qr_id[-1]
+
+
+# Imzolangan chipta: "T1.<qr_id>.<event_id>.<imzo>" - skaner bazasiz tekshiradi.
+# ':' ishlatilmaydi, chunki eski skaner kodi "id:..." formatini ajratadi
+SIGNED_PREFIX = 'T1'
+_SIGNATURE_BYTES = 12
+
+
+@lru_cache(maxsize=1)
+def _ticket_key():
+    # TICKET_SECRET o'zgarsa avval berilgan imzolangan chiptalar yaroqsiz bo'ladi
+    secret = config.TICKET_SECRET or hmac.new(config.BOT_TOKEN.encode(), b'ticket', hashlib.sha256).hexdigest()
+    return secret.encode()
+
+
+def _signature(qr_id, event_id):
+    message = f"{SIGNED_PREFIX}.{qr_id}.{event_id}".encode()
+    digest = hmac.new(_ticket_key(), message, hashlib.sha256).digest()[:_SIGNATURE_BYTES]
+    return base64.urlsafe_b64encode(digest).decode().rstrip('=')
+
+
+def sign_ticket(qr_id, event_id):
+    """QR kodga yoziladigan imzolangan chipta matni"""
+    return f"{SIGNED_PREFIX}.{qr_id}.{event_id}.{_signature(qr_id, event_id)}"
+
+
+def is_signed_ticket(text):
+    return str(text).startswith(SIGNED_PREFIX + '.')
+
+
+def verify_ticket(text, active_event_ids=None):
+    """Imzolangan chiptani bazasiz tekshirish
+
+    Qaytaradi: (ok, qr_id, event_id, sabab) - sabab: None, 'format', 'signature', 'event'
+    """
+    parts = str(text).strip().split('.')
+    if len(parts) != 4 or parts[0] != SIGNED_PREFIX or not parts[2].isdigit():
+        return False, None, None, 'format'
+    _, qr_id, event_id, signature = parts
+    event_id = int(event_id)
+    if not hmac.compare_digest(signature.encode(), _signature(qr_id, event_id).encode()):
+        return False, qr_id, event_id, 'signature'
+    if active_event_ids is not None and event_id not in active_event_ids:
+        return False, qr_id, event_id, 'event'
+    return True, qr_id, event_id, None
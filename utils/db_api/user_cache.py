@@ -0,0 +1,85 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+class UserCache:
+    """telegram_id -> UserRecord (yoki None) LRU keshi, thread-safe"""
+
+    def __init__(self, max_entries=5000, ttl=600):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()  # telegram_id -> (user, amal qilish muddati)
+        self._lock = threading.Lock()
+        # Har bir yozuvda oshadi: o'qish paytida o'zgargan userni eski holatda saqlab qo'ymaslik uchun
+        self._version = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, telegram_id):
+        """(topildi, user) - user None bo'lishi ham mumkin (bazada yo'q)"""
+        with self._lock:
+            entry = self._entries.get(telegram_id)
+            if entry and entry[1] > time.monotonic():
+                self._entries.move_to_end(telegram_id)
+                self.hits += 1
+                return True, entry[0]
+            if entry:
+                del self._entries[telegram_id]
+            self.misses += 1
+            return False, None
+
+    def contains(self, telegram_id):
+        """Statistikaga ta'sir qilmasdan tekshirish"""
+        with self._lock:
+            entry = self._entries.get(telegram_id)
+            return bool(entry) and entry[1] > time.monotonic()
+
+    @property
+    def version(self):
+        return self._version
+
+    def put(self, telegram_id, user, version=None):
+        """Bazadan o'qilgan userni saqlash. version o'qishdan oldin olingan bo'lsa
+        va o'rtada yozuv bo'lgan bo'lsa - saqlanmaydi"""
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            if version is not None and version != self._version:
+                return
+            self._entries[telegram_id] = (user, time.monotonic() + self.ttl)
+            self._entries.move_to_end(telegram_id)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def update(self, telegram_id, **fields):
+        """Keshdagi userni joyida yangilash (write-through), bo'lmasa hech narsa qilmaydi"""
+        with self._lock:
+            self._version += 1
+            entry = self._entries.get(telegram_id)
+            if entry and entry[0] is not None:
+                self._entries[telegram_id] = (entry[0]._replace(**fields), entry[1])
+            elif entry:
+                del self._entries[telegram_id]
+
+    def invalidate(self, telegram_id):
+        with self._lock:
+            self._version += 1
+            self._entries.pop(telegram_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._version += 1
+            self._entries.clear()
+
+    def get_stats(self):
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions
+            }
@@ -0,0 +1,77 @@
+import asyncio
+import io
+import time
+
+from PIL import Image
+
+from data import config
+from utils.qr_renderer import get_qr_pool
+
+# QR o'quvchi kutubxonalar ixtiyoriy: pyzbar (tizimda zbar kerak) yoki opencv
+try:
+    from pyzbar import pyzbar
+except ImportError:
+    pyzbar = None
+
+try:
+    import cv2
+    import numpy
+except ImportError:
+    cv2 = None
+
+DECODER_AVAILABLE = bool(pyzbar or cv2)
+
+# Katta rasmlar shu o'lchamgacha kichraytiriladi (o'qish tezlashadi, QR baribir aniq qoladi)
+_MAX_SIDE = 1280
+
+
+def _decode_image(image_bytes):
+    """Rasmdagi QR matnini o'qish (pul jarayonida bajariladi): (matn, xatolik sababi)"""
+    try:
+        image = Image.open(io.BytesIO(image_bytes))
+        image.load()
+    except Exception:
+        return None, 'bad_image'
+
+    image = image.convert('L')
+    if max(image.size) > _MAX_SIDE:
+        image.thumbnail((_MAX_SIDE, _MAX_SIDE))
+
+    if pyzbar:
+        for symbol in pyzbar.decode(image, symbols=[pyzbar.ZBarSymbol.QRCODE]):
+            return symbol.data.decode('utf-8', errors='replace'), None
+
+    if cv2:
+        text, points, _ = cv2.QRCodeDetector().detectAndDecode(numpy.array(image))
+        if text:
+            return text, None
+        if points is not None:
+            return None, 'unreadable'
+
+    return None, 'not_found'
+
+
+async def decode_qr_image(image_bytes):
+    """Rasmdan QR o'qish: (matn, xatolik sababi, kechikish ms)
+
+    sabab: None, 'no_decoder', 'bad_image', 'not_found', 'unreadable', 'timeout', 'error'
+    """
+    started_at = time.perf_counter()
+    if not DECODER_AVAILABLE:
+        return None, 'no_decoder', 0
+
+    loop = asyncio.get_running_loop()
+    pool = get_qr_pool()  # None bo'lsa - standart thread executor
+    try:
+        text, reason = await asyncio.wait_for(
+            loop.run_in_executor(pool, _decode_image, image_bytes),
+            timeout=config.QR_DECODE_TIMEOUT
+        )
+    except asyncio.TimeoutError:
+        text, reason = None, 'timeout'
+    except Exception as e:
+        print(f"❌ QR rasmini o'qishda xatolik: {e}")
+        text, reason = None, 'error'
+
+    elapsed_ms = round((time.perf_counter() - started_at) * 1000)
+    return text, reason, elapsed_ms
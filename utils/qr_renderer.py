@@ -0,0 +1,82 @@
+import io
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+import qrcode
+
+from data import config
+
+# QR rasmlarini chizadigan va o'qiydigan jarayonlar puli (GIL va event loopni band qilmaslik uchun)
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def _render_png(data, box_size, border):
+    """QR kodni PNG baytlarga chizish (pul jarayonida bajariladi)"""
+    qr = qrcode.QRCode(
+        error_correction=qrcode.constants.ERROR_CORRECT_M,
+        box_size=box_size,
+        border=border
+    )
+    qr.add_data(data)
+    qr.make(fit=True)
+    image = qr.make_image(fill_color="black", back_color="white")
+
+    buffer = io.BytesIO()
+    image.save(buffer, format='PNG')
+    return buffer.getvalue()
+
+
+def get_qr_pool():
+    global _pool
+    if config.QR_RENDER_WORKERS <= 0:
+        return None
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ProcessPoolExecutor(max_workers=config.QR_RENDER_WORKERS)
+    return _pool
+
+
+def start_qr_pool():
+    """Pul jarayonlarini oldindan ishga tushirish (birinchi tasdiqlash kutib qolmasligi uchun)"""
+    pool = get_qr_pool()
+    if pool:
+        pool.submit(_render_png, 'warmup', 1, 0).result()
+
+
+def render_qr(data, box_size=None, border=None):
+    """QR kod PNG baytlari. Pul ishlamasa joriy jarayonda chiziladi"""
+    box_size = box_size or config.QR_CODE_SIZE
+    border = config.QR_CODE_BORDER if border is None else border
+
+    pool = get_qr_pool()
+    if pool:
+        try:
+            return pool.submit(_render_png, str(data), box_size, border).result(timeout=config.QR_RENDER_TIMEOUT)
+        except Exception as e:
+            print(f"⚠️ QR pulda chizilmadi, joriy jarayonda chiziladi: {e}")
+    return _render_png(str(data), box_size, border)
+
+
+def render_qr_many(items, box_size=None, border=None):
+    """Ko'p QR kodni parallel chizish: [data, ...] -> [png, ...]"""
+    box_size = box_size or config.QR_CODE_SIZE
+    border = config.QR_CODE_BORDER if border is None else border
+    items = [str(data) for data in items]
+
+    pool = get_qr_pool()
+    if pool:
+        try:
+            return list(pool.map(_render_png, items, [box_size] * len(items), [border] * len(items)))
+        except Exception as e:
+            print(f"⚠️ QR pulda chizilmadi, joriy jarayonda chiziladi: {e}")
+    return [_render_png(data, box_size, border) for data in items]
+
+
+def shutdown_qr_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=True)
+            _pool = None
@@ -0,0 +1,210 @@
+import asyncio
+import time
+from collections import OrderedDict
+
+from data import config
+from utils.db_api.async_database import get_async_db
+
+SUBSCRIBED_STATUSES = ("member", "administrator", "creator")
+
+
+def resolve_channel_id(channel_id):
+    """Bazadagi channel_id ni get_chat_member uchun tayyorlash (noma'lum format - None)"""
+    channel_id = str(channel_id)
+    if channel_id.startswith('@'):
+        return channel_id
+    if channel_id.isdigit() or (channel_id.startswith('-') and channel_id[1:].isdigit()):
+        return int(channel_id)
+    return None
+
+
+def match_channel(channels, chat):
+    """chat_member updatedagi chatni bazadagi channel_id ga moslash"""
+    chat_id = str(chat.id)
+    username = f"@{chat.username}".lower() if chat.username else None
+    for channel in channels:
+        channel_id = str(channel[0])
+        if channel_id == chat_id or (username and channel_id.lower() == username):
+            return channel_id
+    return None
+
+
+class SubscriptionChecker:
+    """Kanal obunasini tekshirish: (user, kanal) bo'yicha TTL kesh va parallel so'rovlar"""
+
+    def __init__(self, positive_ttl=300, negative_ttl=30, max_entries=50000):
+        self.positive_ttl = positive_ttl
+        self.negative_ttl = negative_ttl
+        self.max_entries = max_entries
+        self._cache = OrderedDict()  # (user_id, channel_id) -> (obuna, amal qilish muddati), LRU tartibida
+        self._inflight = {}  # (user_id, kanallar, force) -> bajarilayotgan tekshiruv
+        self.hits = 0
+        self.misses = 0
+
+    def _get_cached(self, user_id, channel_id):
+        key = (user_id, channel_id)
+        entry = self._cache.get(key)
+        if entry and entry[1] > time.monotonic():
+            self._cache.move_to_end(key)
+            return entry[0]
+        return None
+
+    def _store(self, user_id, channel_id, subscribed):
+        ttl = self.positive_ttl if subscribed else self.negative_ttl
+        key = (user_id, channel_id)
+        self._cache[key] = (subscribed, time.monotonic() + ttl)
+        self._cache.move_to_end(key)
+        if len(self._cache) > self.max_entries:
+            # Eng uzoq ishlatilmagan yozuv chiqariladi (muddati o'tganlar ham shu yo'l bilan ketadi)
+            self._cache.popitem(last=False)
+
+    def record(self, user_id, channel_id, status):
+        """Tashqaridan kelgan aniq holatni (chat_member update) keshga yozish"""
+        self._store(user_id, str(channel_id), status in SUBSCRIBED_STATUSES)
+
+    def invalidate(self, user_id, channel_id=None):
+        """User (yoki bitta kanal) bo'yicha keshni tozalash"""
+        if channel_id is not None:
+            self._cache.pop((user_id, channel_id), None)
+            return
+        for key in [key for key in self._cache if key[0] == user_id]:
+            del self._cache[key]
+
+    async def _fetch(self, bot, user_id, channel_id):
+        actual_channel_id = resolve_channel_id(channel_id)
+        if actual_channel_id is None:
+            print(f"⚠️ Noma'lum kanal format: {channel_id}")
+            return True  # Noto'g'ri formatdagi kanal tekshirilmaydi
+
+        try:
+            member = await bot.get_chat_member(actual_channel_id, user_id)
+        except Exception as e:
+            # Kanal mavjud bo'lmasa yoki bot unga kira olmasa - obuna emas (keshlanmaydi)
+            print(f"❌ Kanal {channel_id} tekshirishda xatolik: {e}")
+            return None
+
+        subscribed = member.status in SUBSCRIBED_STATUSES
+        self._store(user_id, channel_id, subscribed)
+        await get_async_db().save_channel_members([(channel_id, user_id, member.status)])
+        if not subscribed:
+            print(f"🚫 User {user_id} kanalga obuna emas: {actual_channel_id} (status: {member.status})")
+        return subscribed
+
+    async def _load_local(self, user_id, channel_ids):
+        """channel_members jadvalidan ma'lum holatlar: {channel_id: obuna}"""
+        statuses = await get_async_db().get_channel_memberships(
+            user_id, channel_ids, config.CHANNEL_MEMBER_MAX_AGE
+        )
+        local = {}
+        for channel_id, status in statuses.items():
+            local[channel_id] = status in SUBSCRIBED_STATUSES
+            self._store(user_id, channel_id, local[channel_id])
+        return local
+
+    async def _check(self, bot, user_id, channel_ids, force):
+        missing = []
+        for channel_id in channel_ids:
+            cached = None if force else self._get_cached(user_id, channel_id)
+            if cached is False:
+                self.hits += 1
+                return False
+            if cached is None:
+                missing.append(channel_id)
+            else:
+                self.hits += 1
+
+        if not missing:
+            return True
+
+        # Force bo'lmasa avval chat_member updatelari bilan yangilanadigan jadvalga qaraymiz
+        if not force:
+            local = await self._load_local(user_id, missing)
+            if not all(local.values()):
+                return False
+            missing = [channel_id for channel_id in missing if channel_id not in local]
+            if not missing:
+                return True
+
+        self.misses += len(missing)
+        results = await asyncio.gather(*(self._fetch(bot, user_id, channel_id) for channel_id in missing))
+        return all(results)
+
+    async def is_subscribed(self, bot, user_id, channels, force=False):
+        """
+        User barcha kanallarga obuna bo'lganini tekshirish.
+        channels -> [(channel_id, channel_name, channel_username, channel_type), ...]
+        force=True - keshni chetlab o'tib qayta so'rash ("Tekshirish" tugmasi)
+        """
+        if not channels:
+            return True  # Kanal yo'q bo'lsa, obuna tekshirish shart emas
+
+        channel_ids = tuple(str(channel[0]) for channel in channels)
+        key = (user_id, channel_ids, force)
+
+        # Bir userning bir vaqtdagi updatelari bitta tekshiruvni kutadi
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(self._check(bot, user_id, channel_ids, force))
+            self._inflight[key] = task
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+
+        try:
+            return await asyncio.shield(task)
+        except Exception as e:
+            print(f"❌ Obuna tekshirishda xatolik: {e}")
+            return False
+
+    async def reconcile(self, bot, older_than, batch_size=100):
+        """Eskirgan channel_members yozuvlarini get_chat_member orqali qayta tekshirish (tekshirilganlar soni)"""
+        db = get_async_db()
+        stale = await db.get_stale_channel_members(older_than, batch_size)
+        if not stale:
+            return 0
+        results = await asyncio.gather(*(self._fetch(bot, user_id, channel_id) for channel_id, user_id in stale))
+        # Xatolik bo'lganlar (user o'chirilgan, bot chiqarilgan) va noma'lum formatdagi kanallar holati
+        # eskiligicha qoladi, lekin navbat oxiriga o'tadi - keyingi partiyalar sog' yozuvlarni yangilay oladi
+        failed = [(channel_id, user_id) for (channel_id, user_id), result in zip(stale, results)
+                  if result is None or resolve_channel_id(channel_id) is None]
+        if failed:
+            await db.mark_channel_members_checked(failed)
+        return len(stale)
+
+    def get_stats(self):
+        return {
+            'entries': len(self._cache),
+            'inflight': len(self._inflight),
+            'hits': self.hits,
+            'misses': self.misses
+        }
+
+
+_subscription_checker = None
+
+
+def get_subscription_checker():
+    """Jarayon uchun yagona SubscriptionChecker"""
+    global _subscription_checker
+    if _subscription_checker is None:
+        _subscription_checker = SubscriptionChecker(
+            positive_ttl=config.SUBSCRIPTION_CACHE_TTL,
+            negative_ttl=config.SUBSCRIPTION_NEGATIVE_TTL
+        )
+    return _subscription_checker
+
+
+async def run_membership_reconciler(bot):
+    """channel_members jadvalini vaqti-vaqti bilan qayta tekshirib turuvchi fon vazifasi"""
+    checker = get_subscription_checker()
+    # Yozuv yarim umriga yetganda yangilanadi, shunda CHANNEL_MEMBER_MAX_AGE dan o'tib ketmaydi
+    older_than = config.CHANNEL_MEMBER_MAX_AGE // 2
+    while True:
+        try:
+            checked = await checker.reconcile(bot, older_than, config.CHANNEL_MEMBER_RECONCILE_BATCH)
+            while checked == config.CHANNEL_MEMBER_RECONCILE_BATCH:
+                await asyncio.sleep(1)  # Bot API limitlarini hisobga olib partiyalar orasida pauza
+                checked = await checker.reconcile(bot, older_than, config.CHANNEL_MEMBER_RECONCILE_BATCH)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"❌ Kanal a'zoligini qayta tekshirishda xatolik: {e}")
+        await asyncio.sleep(config.CHANNEL_MEMBER_RECONCILE_INTERVAL)
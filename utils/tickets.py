@@ -0,0 +1,30 @@
+from aiogram.utils.exceptions import BadRequest
+
+from utils.db_api.async_database import get_async_db
+
+
+async def send_qr_photo(bot, chat_id, telegram_id, **kwargs):
+    """
+    User QR chiptasini yuborish. Birinchi marta rasm yuklanadi va file_id saqlanadi,
+    keyingi safar Telegramdagi nusxa qayta ishlatiladi. QR yo'q bo'lsa None qaytaradi.
+    """
+    db = get_async_db()
+    photo, qr_id = await db.get_qr_photo(telegram_id)
+    if not photo:
+        return None
+
+    if isinstance(photo, str):
+        try:
+            return await bot.send_photo(chat_id, photo, **kwargs)
+        except BadRequest as e:
+            # file_id yaroqsiz bo'lib qolgan - rasmni qayta yuklaymiz
+            print(f"⚠️ QR file_id ishlamadi ({telegram_id}): {e}")
+            await db.save_qr_file_id(telegram_id, qr_id, None)
+            photo, qr_id = await db.get_qr_photo(telegram_id)
+            if not photo:
+                return None
+
+    sent = await bot.send_photo(chat_id, photo, **kwargs)
+    if sent.photo:
+        await db.save_qr_file_id(telegram_id, qr_id, sent.photo[-1].file_id)
+    return sent
@@ -0,0 +1,30 @@
+from utils.db_api.async_database import get_async_db
+from utils.db_api.records import registration_status
+
+_NOT_LOADED = object()
+
+
+class UserContext:
+    """Bitta update davomida user ma'lumotlari: birinchi so'ralganda bir marta o'qiladi"""
+
+    def __init__(self, telegram_id):
+        self.telegram_id = telegram_id
+        self._user = _NOT_LOADED
+
+    async def get_user(self):
+        """UserRecord yoki None (bazada yo'q bo'lsa)"""
+        if self._user is _NOT_LOADED:
+            self._user = await get_async_db().select_user(self.telegram_id)
+        return self._user
+
+    async def get_language(self):
+        user = await self.get_user()
+        return user.language if user and user.language else 'uz'
+
+    async def get_status(self):
+        """get_user_registration_status bilan bir xil formatdagi holat"""
+        return registration_status(await self.get_user())
+
+    def invalidate(self):
+        """Handler ichida user o'zgartirilgandan keyin qayta o'qish uchun"""
+        self._user = _NOT_LOADED